@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial aggregation for very large networks.
+
+Regions, collectors and producers are clustered (k-means) by location
+(coordinates, or the costs of their arcs) and by their generation, capacities
+or demand. Each cluster becomes a super-node with the summed data, the
+manufacturers are kept, and the reduced instance is solved as usual. Its plan
+is mapped back to the original network by disaggregate.
+"""
+import time as tm
+import warnings
+import numpy as np
+import scipy.sparse as sp
+from scipy.cluster.vq import kmeans2
+from classes import Instance
+from backends import build_matrices
+from optimize import create_model, solve_model, get_results, build_solution
+from heuristic import solve_lp, repair, cost_bound
+
+# node kinds that are clustered and the prefix of their super-nodes
+KINDS = {0: ('regions', 'R'), 1: ('collectors', 'C'), 3: ('producers', 'P')}
+KEYS = ['regions', 'collectors', 'manufs', 'producers']
+
+
+def cost_features(instance, kind, other):
+    """
+    Mean and cheapest cost of the arcs between each node of a kind and the
+    nodes of another kind (in either direction).
+
+    Returns:
+        ndarray: Nodes x 2, the nodes without arcs get the maximum cost.
+    """
+    arrays = instance.arrays
+    n = len(arrays[KEYS[kind]])
+    orig_kind, dest_kind = np.asarray(arrays['arc_orig_kind']), np.asarray(arrays['arc_dest_kind'])
+    cost = np.asarray(arrays['arc_cost'], dtype=float)
+    out = (orig_kind == kind) & (dest_kind == other)
+    into = (orig_kind == other) & (dest_kind == kind)
+    pos = np.concatenate([np.asarray(arrays['arc_orig'])[out], np.asarray(arrays['arc_dest'])[into]])
+    cost = np.concatenate([cost[out], cost[into]])
+    count = np.bincount(pos, minlength=n)
+    mean = np.bincount(pos, weights=cost, minlength=n)/np.maximum(count, 1)
+    nearest = np.full(n, np.inf)
+    np.minimum.at(nearest, pos, cost)
+    missing = cost.max() if len(cost) else 0.0
+    mean[count == 0] = nearest[count == 0] = missing
+    return np.column_stack([mean, nearest])
+
+def features(*blocks):
+    # standardized columns, every block with the same weight
+    columns = []
+    for block in blocks:
+        block = np.asarray(block, dtype=float).reshape(len(block), -1)
+        std = block.std(axis=0)
+        columns.append((block - block.mean(axis=0))/np.where(std > 0, std, 1)/np.sqrt(block.shape[1]))
+    return np.hstack(columns)
+
+def cluster(data, k, seed=0):
+    """
+    Cluster the rows of data with k-means.
+
+    Returns:
+        ndarray: The cluster of each row, numbered from 0 without gaps.
+    """
+    if k >= len(data):
+        return np.arange(len(data))
+    _, labels = kmeans2(data, k, minit='++', seed=seed)
+    return np.unique(labels, return_inverse=True)[1]
+
+def aggregate(instance, sizes, coords=None, seed=0):
+    """
+    Build the reduced instance of super-nodes.
+
+    Args:
+        instance (Instance): The original instance.
+        sizes (dict): Number of clusters of 'regions', 'collectors' and
+            'producers'.
+        coords (dict, optional): Node name -> (x, y), for all the regions,
+            collectors and producers.
+        seed (int, optional): Seed of k-means. Defaults to 0.
+
+    Returns:
+        tuple: The reduced instance and the cluster of each node by kind
+            (dictionary kind -> array, manufacturers not included).
+    """
+    arrays = instance.arrays
+    gen = np.asarray(arrays['gen'], dtype=float)
+    demP = np.asarray(arrays['demP'], dtype=float)
+    data = np.asarray(arrays['collectors_data'], dtype=float)
+    location = {1: cost_features(instance, 1, 2), 3: cost_features(instance, 3, 2)}
+    # regions: their own arcs and the mean location of their collectors
+    e1 = (np.asarray(arrays['arc_orig_kind']) == 0) & (np.asarray(arrays['arc_dest_kind']) == 1)
+    adjacency = sp.csr_matrix((np.ones(e1.sum()), (np.asarray(arrays['arc_orig'])[e1],
+                                                   np.asarray(arrays['arc_dest'])[e1])),
+                              shape=(len(gen), len(data)))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    location[0] = np.hstack([cost_features(instance, 0, 1),
+                             (adjacency @ location[1])/np.maximum(degree, 1)[:, None]])
+    if coords is None and len(np.unique(np.asarray(arrays['arc_cost'])[e1])) <= 1:
+        warnings.warn('the arcs of the regions all cost the same, the regions are located only '
+                      'by their collectors; pass coords to cluster them by location')
+    profile = {0: gen, 1: data[:, 4:6], 3: demP}
+
+    labels, members = {}, {}
+    for kind, (key, prefix) in KINDS.items():
+        nodes = np.asarray(arrays[key])
+        blocks = [location[kind], profile[kind]]
+        if coords is not None:
+            blocks.insert(0, np.array([coords[n] for n in nodes.tolist()], dtype=float))
+        labels[kind] = cluster(features(*blocks), sizes[key], seed)
+        # cluster x node membership matrix
+        members[kind] = sp.csr_matrix((np.ones(len(nodes)), (labels[kind], np.arange(len(nodes)))))
+
+    # collectors: summed capacities, stock and activation cost, variable costs weighted by capC
+    count = members[1] @ np.ones(len(data))
+    weight = members[1] @ data[:, 4]
+    c_var = (members[1] @ (data[:, [0, 1, 3]]*data[:, 4:5]))/np.where(weight > 0, weight, 1)[:, None]
+    c_var[weight == 0] = (members[1] @ data[:, [0, 1, 3]])[weight == 0]/count[weight == 0, None]
+    collectors_data = np.column_stack([c_var[:, 0], c_var[:, 1], members[1] @ data[:, 2], c_var[:, 2],
+                                       members[1] @ data[:, 4:7]])
+    iniA = np.zeros(members[1].shape[0])
+    np.maximum.at(iniA, labels[1], np.asarray(arrays['iniA'], dtype=float))
+
+    # arcs between super-nodes, with the mean cost of their arcs
+    ends = []
+    for kind_key, pos_key in [('arc_orig_kind', 'arc_orig'), ('arc_dest_kind', 'arc_dest')]:
+        kind = np.asarray(arrays[kind_key])
+        pos = np.asarray(arrays[pos_key], dtype=np.int64).copy()
+        for k in labels:
+            pos[kind == k] = labels[k][pos[kind == k]]
+        ends += [kind, pos]
+    arcs, inverse = np.unique(np.column_stack(ends), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    arc_cost = np.bincount(inverse, weights=arrays['arc_cost'])/np.bincount(inverse)
+
+    def names(prefix, n):
+        return np.char.add(prefix, np.arange(1, n + 1).astype(str))
+
+    K = {kind: m.shape[0] for kind, m in members.items()}
+    reduced = {
+        'regions': names('R', K[0]),
+        'collectors': names('C', K[1]),
+        'manufs': np.asarray(arrays['manufs']),
+        'producers': names('P', K[3]),
+        'time': np.asarray(arrays['time']),
+        'collectors_data': collectors_data,
+        'manufs_data': np.asarray(arrays['manufs_data'], dtype=float),
+        'iniA': iniA,
+        'arc_orig_kind': arcs[:, 0].astype(np.int8),
+        'arc_orig': arcs[:, 1].astype(np.int32),
+        'arc_dest_kind': arcs[:, 2].astype(np.int8),
+        'arc_dest': arcs[:, 3].astype(np.int32),
+        'arc_cost': arc_cost,
+        'gen': members[0] @ gen,
+        'demP': members[3] @ demP}
+    # cover as many super-regions as the share of regions to cover
+    n_reg = int(np.clip(round(instance.n_reg*K[0]/len(instance.regions)), 1, K[0]))
+    scalars = {'dt': instance.dt, 'capV': instance.capV, 'n_reg': n_reg, 'alpha': instance.alpha}
+    return Instance.from_arrays(reduced, scalars, instance.name + '_agg'), labels
+
+def restrict(instance, regions, collectors):
+    """
+    Sub-instance with some of the regions and collectors and their arcs (the
+    manufacturers and producers are kept).
+
+    Args:
+        instance (Instance): The instance.
+        regions (ndarray): Boolean mask of the regions kept.
+        collectors (ndarray): Boolean mask of the collectors kept.
+
+    Returns:
+        tuple: The sub-instance and the positions of its arcs in the instance.
+    """
+    arrays = instance.arrays
+    keep = {0: ('regions', regions), 1: ('collectors', collectors)}
+    kinds = [np.asarray(arrays['arc_orig_kind']), np.asarray(arrays['arc_dest_kind'])]
+    ends = [np.asarray(arrays['arc_orig'], dtype=np.int64), np.asarray(arrays['arc_dest'], dtype=np.int64)]
+    arcs = np.ones(len(kinds[0]), dtype=bool)
+    for kind, pos in zip(kinds, ends):
+        for k, (key, mask) in keep.items():
+            arcs[kind == k] &= mask[pos[kind == k]]
+    arcs = np.flatnonzero(arcs)
+
+    sub = {key: np.asarray(arrays[key]) for key in Instance.ARRAYS}
+    for key in ['regions', 'gen']:
+        sub[key] = sub[key][regions]
+    for key in ['collectors', 'collectors_data', 'iniA']:
+        sub[key] = sub[key][collectors]
+    for key in ['arc_orig_kind', 'arc_orig', 'arc_dest_kind', 'arc_dest', 'arc_cost']:
+        sub[key] = sub[key][arcs]
+    # renumber the ends of the arcs among the kept nodes
+    for kind_key, pos_key in [('arc_orig_kind', 'arc_orig'), ('arc_dest_kind', 'arc_dest')]:
+        pos = sub[pos_key].copy()
+        for k, (key, mask) in keep.items():
+            sel = sub[kind_key] == k
+            pos[sel] = (np.cumsum(mask) - 1)[pos[sel]]
+        sub[pos_key] = pos
+    scalars = {key: getattr(instance, key) for key in Instance.SCALARS}
+    return Instance.from_arrays(sub, scalars, instance.name + '_sub'), arcs
+
+def sub_columns(matrices, sub_matrices, regions, collectors, arcs, T):
+    """Columns of the original model of the columns of the model of a
+    sub-instance (regions, collectors and arcs are the kept positions)."""
+    first = {name: start for name, keys, start, stop in matrices['vars']}
+    steps = np.arange(T)
+    rows = {'activ': collectors, 'activ_f': collectors, 'stock': collectors, 'flow': arcs, 'trip': arcs}
+    cols = []
+    for name, keys, start, stop in sub_matrices['vars']:
+        if name == 'cover':
+            cols.append(first[name] + regions)
+        elif name in rows:
+            cols.append(first[name] + (rows[name][:, None]*T + steps).ravel())
+        else:
+            # cover_max and cover_min
+            cols.append(first[name] + steps)
+    return np.concatenate(cols)
+
+def disaggregate(instance, matrices, labels, X, time_limit=None):
+    """
+    Turn the plan of the reduced instance into a plan of the original one,
+    rounding an LP relaxation on the members of the active and covered
+    super-nodes and completing it with heuristic.repair.
+
+    Args:
+        instance (Instance): The original instance.
+        matrices (dict): The model of the original instance in matrix form.
+        labels (dict): The clusters returned by aggregate.
+        X (dict): The values of the plan of the reduced instance.
+        time_limit (float, optional): Time limit of each LP in seconds.
+
+    Returns:
+        ndarray: The values of the variables of the original model, None if
+            the repair failed.
+    """
+    T = len(instance.time)
+    # sub-network of the covered super-regions (all of them if too few) and the active super-collectors
+    covered = np.asarray(X['cover'])[labels[0]] > 0.5
+    active = np.asarray(X['activ']).reshape(-1, T)[labels[1]] > 0.5
+    regions = covered if covered.sum() >= instance.n_reg else np.ones_like(covered)
+    collectors = active.any(axis=1)
+    sub, arcs = restrict(instance, regions, collectors)
+
+    m = build_matrices(sub)
+    cols = {name: np.arange(first, stop) for name, keys, first, stop in m['vars']}
+    ub = m['ub'].copy()
+    # collectors off in the periods their super-collector is
+    ub[cols['activ']] = np.minimum(ub[cols['activ']], np.ravel(active[collectors]))
+    relaxed = solve_lp(m, m['lb'], ub, time_limit)
+    if relaxed is not None:
+        score = relaxed.X[cols['cover']]
+        activ = relaxed.X[cols['activ']].reshape(-1, T) > 1e-6
+    else:
+        # the largest regions of the covered clusters and the members of the active super-collectors
+        score = np.asarray(sub.arrays['gen'], dtype=float).sum(axis=1)
+        activ = active[collectors]
+    # the largest relaxed covers, first those of the covered clusters
+    order = np.lexsort((-score, ~covered[regions]))
+    cover = np.zeros(len(sub.regions))
+    cover[order[:instance.n_reg]] = 1
+    x_sub = repair(sub, m, cover, activ, time_limit)
+    if x_sub is None:
+        return None
+
+    # the collectors left out keep their initial stock
+    x = np.zeros(len(matrices['c']))
+    stock = next(start for name, keys, start, stop in matrices['vars'] if name == 'stock')
+    iniS = np.asarray(instance.arrays['collectors_data'], dtype=float)[:, 6]
+    x[stock:stock + len(iniS)*T] = np.repeat(iniS, T)
+    x[sub_columns(matrices, m, np.flatnonzero(regions), np.flatnonzero(collectors), arcs, T)] = x_sub
+    return x
+
+def aggregate_solve(instance, sizes=None, ratio=0.1, coords=None, builder=create_model,
+                    bound=False, time_limit=None, seed=0, **params):
+    """
+    Solve a large instance through a reduced instance of super-nodes.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        sizes (dict, optional): Number of clusters of 'regions', 'collectors'
+            and 'producers'. Defaults to ratio times the number of nodes.
+        ratio (float, optional): Default share of clusters. Defaults to 0.1.
+        coords (dict, optional): Node name -> (x, y) (see aggregate).
+        builder (function, optional): Model builder of the reduced instance.
+            Defaults to create_model.
+        bound (bool, optional): Measure the gap against the LP relaxation of
+            the original instance (costly) instead of heuristic.cost_bound.
+            Defaults to False.
+        time_limit (float, optional): Time limit of each solve in seconds.
+        seed (int, optional): Seed of k-means. Defaults to 0.
+        **params: Gurobi parameters of the reduced solve.
+
+    Returns:
+        tuple: "Aggregated" and the solution object, or "non-optimal" and
+            None. dict_sol holds the gap, the objective of the reduced
+            solve and the number of super-nodes.
+    """
+    start = tm.perf_counter()
+    if sizes is None:
+        sizes = {key: max(1, int(np.ceil(ratio*len(getattr(instance, key)))))
+                 for key, prefix in KINDS.values()}
+    reduced, labels = aggregate(instance, sizes, coords, seed)
+
+    model = builder(reduced)
+    if time_limit is not None:
+        model.Params.TimeLimit = time_limit
+    for key, value in params.items():
+        model.setParam(key, value)
+    solve_model(model)
+    status, agg_solution = get_results(model, reduced)
+    model.dispose()
+    if agg_solution is None:
+        return "non-optimal", None
+
+    m = build_matrices(instance)
+    x = disaggregate(instance, m, labels, agg_solution.values(), time_limit)
+    if x is None:
+        return "non-optimal", None
+    obj_val = float(m['c'] @ x)
+    lower = cost_bound(instance)
+    if bound:
+        relaxed = solve_lp(m, m['lb'], m['ub'], time_limit)
+        if relaxed is not None:
+            lower = relaxed.ObjVal
+    gap = max(0.0, (obj_val - lower)/abs(obj_val)) if obj_val else 0.0
+
+    X = {name: x[first:stop] for name, keys, first, stop in m['vars']}
+    solution = build_solution(instance, X, obj_val, tm.perf_counter() - start, gap)
+    solution.dict_sol['agg_obj_val'] = agg_solution.dict_sol['obj_val']
+    solution.dict_sol['agg_sizes'] = {key: len(getattr(reduced, key)) for key, prefix in KINDS.values()}
+    return "Aggregated", solution
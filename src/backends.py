@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+"""
+Solver-independent form of the returnability model.
+
+build_matrices assembles the model (objective, sparse constraint matrix with
+one block of rows per constraint family, bounds and integrality) with NumPy
+and SciPy only. optimize.create_model_matrix passes it to Gurobi and
+create_model_highs solves it with HiGHS through scipy.optimize.milp, which
+needs no license. Both expose the same interface to solve_model and
+get_results.
+"""
+import time as tm
+from itertools import product
+from types import SimpleNamespace
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import milp, Bounds, LinearConstraint
+
+# status codes (same values as gurobipy.GRB)
+OPTIMAL = 2
+INFEASIBLE = 3
+UNBOUNDED = 5
+TIME_LIMIT = 9
+INTERRUPTED = 11
+
+# variable families in column order: name, type ('B' binary, 'I' integer, 'C' continuous)
+FAMILIES = [('activ', 'B'), ('activ_f', 'B'), ('cover', 'B'), ('cover_max', 'C'),
+            ('cover_min', 'C'), ('flow', 'C'), ('stock', 'C'), ('trip', 'I')]
+
+
+def index_arcs(instance):
+    """
+    Index the arcs of an instance by echelon and by node.
+
+    Nodes are numbered per set (regions, collectors, manufs and producers) so
+    the positions can be used directly as row offsets of the constraint blocks.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+
+    Returns:
+        dict: Arrays with the origin/destination position of each arc and the
+            arc positions of each echelon ('e1' regions->collectors, 'e2'
+            collectors->manufs, 'e3' manufs->producers).
+    """
+    arrays = instance.arrays
+    orig_kind = np.asarray(arrays['arc_orig_kind'], dtype=np.int64)
+    dest_kind = np.asarray(arrays['arc_dest_kind'], dtype=np.int64)
+    orig = np.asarray(arrays['arc_orig'], dtype=np.int64)
+    dest = np.asarray(arrays['arc_dest'], dtype=np.int64)
+
+    return {
+        'orig': orig,
+        'dest': dest,
+        'orig_kind': orig_kind,
+        'dest_kind': dest_kind,
+        'e1': np.flatnonzero((orig_kind == 0) & (dest_kind == 1)),
+        'e2': np.flatnonzero((orig_kind == 1) & (dest_kind == 2)),
+        'e3': np.flatnonzero((orig_kind == 2) & (dest_kind == 3)),
+        }
+
+def build_matrices(instance):
+    """
+    Assemble the model of create_model in matrix form.
+
+    The arcs are indexed once by echelon and node and every constraint family
+    is emitted as one sparse block of rows.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+
+    Returns:
+        dict: 'c' objective, 'A' constraint matrix (CSR), 'sense' and 'rhs'
+            of each row, 'lb'/'ub'/'vtype' of each column, 'vars' the
+            (name, keys, start, stop) of each variable family and 'constrs'
+            the (name, start, stop) of each constraint family.
+    """
+    regions = instance.regions
+    collectors = instance.collectors
+    time = instance.time
+
+    arrays = instance.arrays
+    R, C, M, P, T, A = len(regions), len(collectors), len(instance.manufs), \
+        len(instance.producers), len(time), len(arrays['arc_cost'])
+    idx = index_arcs(instance)
+    t_range = np.arange(T)
+    t_pos = {t: i for i, t in enumerate(time)}
+
+    # parameters as arrays
+    c_buy, c_clasif, c_activ, c_hold, capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float).T
+    c_clean, capM = np.asarray(arrays['manufs_data'], dtype=float).T
+    iniA = np.asarray(arrays['iniA'], dtype=float)
+    c_transp = np.asarray(arrays['arc_cost'], dtype=float)
+    gen = np.asarray(arrays['gen'], dtype=float)
+    # coverage ratios are only defined where there is generation
+    inv_gen = np.divide(1.0, gen, out=np.zeros_like(gen), where=gen > 0)
+    demP = np.asarray(arrays['demP'], dtype=float)
+
+    # variables (same order and keys as create_model)
+    arc_keys = [(o, d, t) for o, d in zip(instance.node_names(idx['orig_kind'], idx['orig']).tolist(),
+                                          instance.node_names(idx['dest_kind'], idx['dest']).tolist())
+                for t in time]
+    keys = {'activ': product(collectors, time), 'activ_f': product(collectors, time),
+            'cover': regions, 'cover_max': time, 'cover_min': time, 'flow': arc_keys,
+            'stock': product(collectors, time), 'trip': arc_keys}
+    variables = []
+    vtype = []
+    start = 0
+    for name, kind in FAMILIES:
+        family_keys = list(keys[name])
+        variables.append((name, family_keys, start, start + len(family_keys)))
+        vtype.append(np.full(len(family_keys), kind))
+        start += len(family_keys)
+    n_cols = start
+    vtype = np.concatenate(vtype)
+
+    # column offset of each variable family
+    o_activ, o_activ_f, o_cover, o_cover_max, o_cover_min, o_flow, o_stock, o_trips = \
+        [v[2] for v in variables]
+
+    def node_cols(offset, n):
+        # (n, T) column indexes of a variable indexed by node and period
+        return offset + np.arange(n)[:, None]*T + t_range
+
+    def arc_cols(offset, a):
+        # (len(a), T) column indexes of a variable indexed by arc and period
+        return offset + a[:, None]*T + t_range
+
+    def node_rows(node):
+        # (len(node), T) row indexes of a constraint indexed by node and period
+        return node[:, None]*T + t_range
+
+    blocks = []
+    def add_block(rows, cols, vals, n_rows, sense, rhs, name, keep=None):
+        rows = np.concatenate([np.ravel(r) for r in rows])
+        cols = np.concatenate([np.ravel(c) for c in cols])
+        vals = np.concatenate([np.ravel(v) for v in vals])
+        block = sp.csr_matrix((vals, (rows, cols)), shape=(n_rows, n_cols))
+        block.eliminate_zeros()
+        rhs = np.broadcast_to(np.ravel(rhs), n_rows)
+        if keep is not None:
+            block, rhs = block[keep], rhs[keep]
+        blocks.append((name, block, sense, rhs))
+
+    # arcs leaving and entering each kind of node
+    out_r = np.flatnonzero(idx['orig_kind'] == 0)
+    in_c = np.flatnonzero(idx['dest_kind'] == 1)
+    out_c = np.flatnonzero(idx['orig_kind'] == 1)
+    in_m = np.flatnonzero(idx['dest_kind'] == 2)
+    out_m = np.flatnonzero(idx['orig_kind'] == 2)
+    in_p = np.flatnonzero(idx['dest_kind'] == 3)
+
+    def ones(a):
+        return np.ones((len(a), T))
+
+    # objective function
+    obj = np.zeros(n_cols)
+    e1, e2, e3 = idx['e1'], idx['e2'], idx['e3']
+    # buying and classification cost
+    obj[arc_cols(o_flow, e1)] = (c_buy + c_clasif)[idx['dest'][e1], None]
+    # transforming (cleaning all income bottles)
+    obj[arc_cols(o_flow, e2)] = c_clean[idx['dest'][e2], None]
+    # collection center activation cost and inventory holding
+    obj[node_cols(o_activ, C)] = c_activ[:, None]
+    obj[node_cols(o_stock, C)] = c_hold[:, None]
+    # transport from collections to transformers and from transformers to producers
+    obj[arc_cols(o_trips, e2)] = c_transp[e2, None]
+    obj[arc_cols(o_trips, e3)] = c_transp[e3, None]
+
+    # constraints
+    # number of regions to cover
+    add_block([np.zeros(R, dtype=np.int64)], [o_cover + np.arange(R)], [np.ones(R)],
+              1, '=', instance.n_reg, "cover")
+    # generation at each region
+    add_block(
+        [node_rows(idx['orig'][out_r]), node_rows(np.arange(R))],
+        [arc_cols(o_flow, out_r), np.repeat(o_cover + np.arange(R)[:, None], T, axis=1)],
+        [ones(out_r), -gen],
+        R*T, '<', 0.0, "gen")
+    # classification capacity
+    add_block(
+        [node_rows(idx['dest'][in_c]), node_rows(np.arange(C))],
+        [arc_cols(o_flow, in_c), node_cols(o_activ, C)],
+        [ones(in_c), np.repeat(-capC[:, None], T, axis=1)],
+        C*T, '<', 0.0, "capC")
+    # storage capacity
+    add_block(
+        [node_rows(np.arange(C))], [node_cols(o_stock, C)], [np.ones((C, T))],
+        C*T, '<', np.repeat(capS[:, None], T, axis=1), "capS")
+    # transformer capacity
+    add_block(
+        [node_rows(idx['dest'][in_m])], [arc_cols(o_flow, in_m)], [ones(in_m)],
+        M*T, '<', np.repeat(capM[:, None], T, axis=1), "capM")
+    # stock balance: stock[c,t] - stock[c,t-1] - inflow + outflow = iniS (t=1) or 0
+    first = np.array([t <= 1 for t in time])
+    prev = np.array([t_pos[t-1] if t > 1 else -1 for t in time])
+    prev_rows = node_rows(np.arange(C))[:, ~first]
+    prev_cols = o_stock + np.arange(C)[:, None]*T + prev[~first]
+    add_block(
+        [node_rows(np.arange(C)), prev_rows, node_rows(idx['dest'][in_c]), node_rows(idx['orig'][out_c])],
+        [node_cols(o_stock, C), prev_cols, arc_cols(o_flow, in_c), arc_cols(o_flow, out_c)],
+        [np.ones((C, T)), -np.ones(prev_rows.shape), -ones(in_c), ones(out_c)],
+        C*T, '=', np.where(first, iniS[:, None], 0.0), "stock")
+    # flow balance at transformers
+    add_block(
+        [node_rows(idx['dest'][in_m]), node_rows(idx['orig'][out_m])],
+        [arc_cols(o_flow, in_m), arc_cols(o_flow, out_m)],
+        [ones(in_m), -ones(out_m)],
+        M*T, '=', 0.0, "manuf_balanc")
+    # demand fulfillment
+    add_block(
+        [node_rows(idx['dest'][in_p])], [arc_cols(o_flow, in_p)], [ones(in_p)],
+        P*T, '>', demP, "demP")
+    # commercial relationship: activ[c,t] >= activ_f[c,t1] for t in the dt window of t1
+    pairs = np.array([(t_pos[t1], t_pos[t]) for t1 in time
+                      for t in range(t1, min(t1+instance.dt, len(time)))], dtype=np.int64).reshape(-1, 2)
+    K = len(pairs)
+    rel_rows = np.arange(C)[:, None]*K + np.arange(K)
+    add_block(
+        [rel_rows, rel_rows],
+        [o_activ + np.arange(C)[:, None]*T + pairs[:, 1], o_activ_f + np.arange(C)[:, None]*T + pairs[:, 0]],
+        [np.ones((C, K)), -np.ones((C, K))],
+        C*K, '>', 0.0, "relat1")
+    add_block(
+        [node_rows(np.arange(C)), node_rows(np.arange(C)), prev_rows],
+        [node_cols(o_activ_f, C), node_cols(o_activ, C), o_activ + np.arange(C)[:, None]*T + prev[~first]],
+        [np.ones((C, T)), -np.ones((C, T)), np.ones(prev_rows.shape)],
+        C*T, '>', np.where(first, -iniA[:, None], 0.0), "relat2")
+    # maximum coverage: cover_max[t] - flow(r,*,t)/gen[r,t] >= 0 (regions with generation)
+    r_out = idx['orig'][out_r]
+    add_block(
+        [node_rows(np.arange(R)), node_rows(r_out)],
+        [np.repeat(o_cover_max + t_range[None, :], R, axis=0), arc_cols(o_flow, out_r)],
+        [np.ones((R, T)), -inv_gen[r_out]],
+        R*T, '>', 0.0, "cov_max", keep=np.ravel(gen > 0))
+    # minimum coverage: cover_min[t] - flow(r,*,t)/gen[r,t] + cover[r] <= 1
+    add_block(
+        [node_rows(np.arange(R)), node_rows(r_out), node_rows(np.arange(R))],
+        [np.repeat(o_cover_min + t_range[None, :], R, axis=0), arc_cols(o_flow, out_r),
+         np.repeat(o_cover + np.arange(R)[:, None], T, axis=1)],
+        [np.ones((R, T)), -inv_gen[r_out], np.ones((R, T))],
+        R*T, '<', 1.0, "cov_min", keep=np.ravel(gen > 0))
+    # balance coverage: cover_max[t] - cover_min[t] <= alpha
+    add_block(
+        [t_range, t_range], [o_cover_max + t_range, o_cover_min + t_range], [np.ones(T), -np.ones(T)],
+        T, '<', instance.alpha, "cover_bal")
+    # round up trips
+    add_block(
+        [np.tile(np.arange(len(e2))[:, None]*T + t_range, 2)],
+        [np.hstack([arc_cols(o_trips, e2), arc_cols(o_flow, e2)])],
+        [np.hstack([ones(e2), -ones(e2)/instance.capV])],
+        len(e2)*T, '>', 0.0, "trips_e2")
+    # round up trips
+    add_block(
+        [np.tile(np.arange(len(e3))[:, None]*T + t_range, 2)],
+        [np.hstack([arc_cols(o_trips, e3), arc_cols(o_flow, e3)])],
+        [np.hstack([ones(e3), -ones(e3)/instance.capV])],
+        len(e3)*T, '>', 0.0, "trips_e3")
+
+    # bounds of the variables (flow and trip tightened by Instance.presolve)
+    lb = np.zeros(n_cols)
+    ub = np.where(vtype == 'B', 1.0, np.inf)
+    if instance.bounds is not None:
+        ub[o_flow:o_flow + A*T] = np.ravel(instance.bounds['flow'])
+        ub[o_trips:o_trips + A*T] = np.ravel(instance.bounds['trip'])
+        # drop the inequalities the bounds already satisfy
+        big = np.where(np.isinf(ub), 1e30, ub)
+        for i, (name, block, sense, rhs) in enumerate(blocks):
+            if sense == '<':
+                keep = block.maximum(0) @ big > rhs
+            elif sense == '>':
+                keep = block.minimum(0) @ big < rhs
+            else:
+                continue
+            blocks[i] = (name, block[keep], sense, rhs[keep])
+
+    constrs = []
+    start = 0
+    for name, block, sense, rhs in blocks:
+        constrs.append((name, start, start + block.shape[0]))
+        start += block.shape[0]
+
+    return {
+        'c': obj,
+        'A': sp.vstack([b[1] for b in blocks], format='csr'),
+        'sense': np.concatenate([np.full(b[1].shape[0], b[2]) for b in blocks]),
+        'rhs': np.concatenate([b[3] for b in blocks]).astype(float),
+        'lb': lb,
+        'ub': ub,
+        'vtype': vtype,
+        'vars': variables,
+        'constrs': constrs,
+        }
+
+class HighsModel:
+    """
+    The returnability model solved with HiGHS (scipy.optimize.milp).
+
+    It mimics the part of a gurobipy Model used by solve_model, get_results
+    and the other pipeline helpers: optimize(), Params (TimeLimit, MIPGap,
+    Threads, OutputFlag), Status with the gurobipy codes, ObjVal, ObjBound,
+    MIPGap, Runtime and the sizes NumVars, NumConstrs and NumNZs. Callbacks
+    (and so lazy constraints) and MIP starts are not supported.
+
+    Args:
+        matrices (dict): The model in matrix form (see build_matrices).
+        name (str, optional): The name of the model.
+    """
+    def __init__(self, matrices, name='returnability'):
+        self.ModelName = name
+        self.matrices = matrices
+        self.Params = SimpleNamespace(TimeLimit=np.inf, MIPGap=1e-4, Threads=0, OutputFlag=1)
+        self.Status = 1  # loaded, not solved
+        self.ObjVal = self.ObjBound = self.MIPGap = np.nan
+        self.Runtime = 0.0
+        self.SolCount = 0
+        self.NodeCount = 0
+        self.MaxMemUsed = 0.0  # not reported by HiGHS
+        self.X = None
+        self.NumVars = matrices['A'].shape[1]
+        self.NumConstrs = matrices['A'].shape[0]
+        self.NumNZs = matrices['A'].nnz
+        self._vars = {name: range(start, stop) for name, keys, start, stop in matrices['vars']}
+        self._blocks = {name: range(start, stop) for name, start, stop in matrices['constrs']}
+
+    def setParam(self, key, value):
+        setattr(self.Params, key, value)
+
+    def optimize(self, callback=None):
+        if callback is not None:
+            raise ValueError("The HiGHS backend does not support callbacks")
+        m = self.matrices
+        sense = m['sense']
+        lhs = np.where(sense == '<', -np.inf, m['rhs'])
+        rhs = np.where(sense == '>', np.inf, m['rhs'])
+        options = {'disp': bool(self.Params.OutputFlag), 'mip_rel_gap': self.Params.MIPGap}
+        if np.isfinite(self.Params.TimeLimit):
+            options['time_limit'] = self.Params.TimeLimit
+        start = tm.perf_counter()
+        res = milp(m['c'], constraints=LinearConstraint(m['A'], lhs, rhs),
+                   integrality=(m['vtype'] != 'C').astype(int), bounds=Bounds(m['lb'], m['ub']),
+                   options=options)
+        self.Runtime = tm.perf_counter() - start
+        self.Status = {0: OPTIMAL, 1: TIME_LIMIT, 2: INFEASIBLE, 3: UNBOUNDED}.get(res.status, INTERRUPTED)
+        self.SolCount = int(res.x is not None)
+        if res.x is not None:
+            self.X = res.x
+            self.ObjVal = res.fun
+            self.MIPGap = getattr(res, 'mip_gap', 0.0)
+            self.ObjBound = getattr(res, 'mip_dual_bound', res.fun)
+            self.NodeCount = getattr(res, 'mip_node_count', 0)
+
+    def family_values(self):
+        """Values of each variable family, in the order of their keys."""
+        return {name: self.X[rng.start:rng.stop] for name, rng in self._vars.items()}
+
+    def dispose(self):
+        self.matrices = None
+
+def create_model_highs(instance, lazy=False):
+    """
+    Create the model of create_model to be solved with HiGHS.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        lazy (bool, optional): Not supported, HiGHS has no lazy constraints.
+            Defaults to False.
+
+    Returns:
+        HighsModel: The created model.
+
+    Raises:
+        ValueError: If lazy is True.
+    """
+    if lazy:
+        raise ValueError("The HiGHS backend does not support lazy constraints, "
+                         "use create_model or create_model_matrix")
+    return HighsModel(build_matrices(instance))
@@ -0,0 +1,394 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the model pipeline on synthetic instances of growing size.
+
+Run from the src folder:
+    python benchmark.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time as tm
+import tracemalloc
+import pandas as pd
+from classes import Instance
+from heuristic import heuristic_solve
+from optimize import create_model, create_model_matrix, solve_model, get_results
+from utilities import read_data_json, write_data_json
+
+
+# parameters of utilities.instance_generator after the sizes: demand range, capacity
+# margins, generation share, packaging value, cost shares, dt and alpha
+GENERATOR = ((100, 300), 0.2, 0.3, 0.2, 0.3, 100, 0.01, 1, 1.0, 0.05, 0.1, 0.01, 0.01, 2, 0.3)
+
+
+def synthetic_instance(n_reg, n_collec, n_manufs, n_prod, periods, seed=42):
+    """
+    Create a feasible random instance of a size with Instance.instance_generator,
+    covering half of the regions.
+
+    Args:
+        n_reg (int): Number of regions.
+        n_collec (int): Number of collectors.
+        n_manufs (int): Number of manufacturers.
+        n_prod (int): Number of producers.
+        periods (int): Number of periods.
+        seed (int, optional): Seed of the random generator. Defaults to 42.
+
+    Returns:
+        Instance: The instance.
+    """
+    return Instance.instance_generator(n_reg, n_collec, n_manufs, n_prod, periods, *GENERATOR,
+                                       max(1, n_reg//2), seed=seed, feasible=True,
+                                       name='synthetic_%d_%d_%d_%d_%d' % (n_reg, n_collec, n_manufs, n_prod, periods))
+
+def benchmark_build(sizes, repeats=1):
+    """
+    Compare the build time of create_model and create_model_matrix.
+
+    Args:
+        sizes (list): Tuples (n_reg, n_collec, n_manufs, n_prod, periods).
+        repeats (int, optional): Builds per size and builder, the minimum
+            time is kept. Defaults to 1.
+
+    Returns:
+        DataFrame: One row per size and builder with the build time and the
+            model dimensions (equal dimensions for both builders).
+    """
+    rows = []
+    for size in sizes:
+        instance = synthetic_instance(*size)
+        for builder in [create_model, create_model_matrix]:
+            times = []
+            for _ in range(repeats):
+                start = tm.perf_counter()
+                model = builder(instance)
+                times.append(tm.perf_counter() - start)
+            rows.append({
+                'size': size,
+                'builder': builder.__name__,
+                'build_time': min(times),
+                'n_vars': model.NumVars,
+                'n_constrs': model.NumConstrs,
+                'n_nz': model.NumNZs})
+            model.dispose()
+
+    return pd.DataFrame(rows)
+
+def benchmark_lazy(sizes, builder=create_model_matrix, time_limit=None, threads=None):
+    """
+    Compare the eager model with the lazy mode (relat1, cov_max and cov_min
+    enforced from the callback) on synthetic instances.
+
+    Args:
+        sizes (list): Tuples (n_reg, n_collec, n_manufs, n_prod, periods).
+        builder (function, optional): Model builder. Defaults to
+            create_model_matrix.
+        time_limit (float, optional): Time limit of each solve in seconds.
+        threads (int, optional): Threads used by Gurobi.
+
+    Returns:
+        DataFrame: One row per size and mode with the model dimensions, the
+            build and solve times, the objective and the number of lazy
+            constraints added.
+    """
+    rows = []
+    for size in sizes:
+        instance = synthetic_instance(*size)
+        for lazy in [False, True]:
+            start = tm.perf_counter()
+            model = builder(instance, lazy=lazy)
+            build_time = tm.perf_counter() - start
+            model.Params.OutputFlag = 0
+            if time_limit is not None:
+                model.Params.TimeLimit = time_limit
+            if threads is not None:
+                model.Params.Threads = threads
+            start = tm.perf_counter()
+            solve_model(model)
+            rows.append({
+                'size': size,
+                'mode': 'lazy' if lazy else 'eager',
+                'n_constrs': model.NumConstrs,
+                'n_nz': model.NumNZs,
+                'build_time': build_time,
+                'solve_time': tm.perf_counter() - start,
+                'status': model.Status,
+                'obj_val': model.ObjVal if model.SolCount else None,
+                'gap': model.MIPGap if model.SolCount else None,
+                'n_lazy': sum(model._n_lazy.values()) if lazy else 0})
+            model.dispose()
+
+    return pd.DataFrame(rows)
+
+def benchmark_heuristic(sizes, bound_sizes=None, time_limit=None):
+    """
+    Time heuristic.heuristic_solve on synthetic instances, measuring its gap
+    against cost_bound and, on some sizes, against the LP relaxation.
+
+    Args:
+        sizes (list): Tuples (n_reg, n_collec, n_manufs, n_prod, periods).
+        bound_sizes (list, optional): Sizes also solved with bound=True (one
+            more LP of the size of the model). Defaults to none.
+        time_limit (float, optional): Time limit of each LP in seconds.
+
+    Returns:
+        DataFrame: One row per size and bound with the time, the objective,
+            the gap and the validity of the plan.
+    """
+    rows = []
+    for size in sizes:
+        instance = synthetic_instance(*size)
+        for bound in [False, True] if size in (bound_sizes or []) else [False]:
+            start = tm.perf_counter()
+            status, solution = heuristic_solve(instance, time_limit, bound=bound)
+            rows.append({
+                'size': size,
+                'bound': 'lp' if bound else 'cost_bound',
+                'time': tm.perf_counter() - start,
+                'status': status,
+                'obj_val': solution.dict_sol['obj_val'] if solution is not None else None,
+                'gap': solution.dict_sol['gap'] if solution is not None else None,
+                'valid': solution.solution_checker() if solution is not None else False})
+
+    return pd.DataFrame(rows)
+
+def read_data_json_eval(file_path):
+    """
+    Previous loader (json.load and eval of the tuple keys), kept as the
+    baseline of benchmark_loader.
+    """
+    with open(file_path, "r") as json_file:
+        json_data = json.load(json_file)
+    for key in ['arcs', 'gen', 'demP']:
+        json_data[key] = {tuple(eval(k)): v for k, v in json_data[key].items()}
+    return json_data
+
+def benchmark_loader(sizes, loaders=None):
+    """
+    Compare the JSON loaders on synthetic instances written to a temporary file.
+
+    Args:
+        sizes (list): Tuples (n_reg, n_collec, n_manufs, n_prod, periods).
+        loaders (list, optional): Names of the loaders to run ('eval',
+            'parse_key', 'stream'). Defaults to all of them.
+
+    Returns:
+        DataFrame: One row per size and loader with the load time, the peak
+            resident memory of the process while loading and its increase
+            over the memory before the load, and the peak memory allocated
+            by Python while loading (MB).
+    """
+    loaders = [(name, loader) for name, loader in
+               [('eval', read_data_json_eval),
+                ('parse_key', read_data_json),
+                ('stream', lambda path: read_data_json(path, stream=True))]
+               if loaders is None or name in loaders]
+    rows = []
+    for size in sizes:
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            instance = synthetic_instance(*size)
+            write_data_json(instance.raw_data, path)
+            del instance
+            for name, loader in loaders:
+                with RSSMonitor() as rss:
+                    start = tm.perf_counter()
+                    data = loader(path)
+                    elapsed = tm.perf_counter() - start
+                n_arcs = len(data['arcs'])
+                del data
+                # second load to measure the Python memory, tracemalloc slows down the loaders
+                tracemalloc.start()
+                data = loader(path)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                del data
+                rows.append({
+                    'size': size,
+                    'loader': name,
+                    'file_mb': os.path.getsize(path)/2**20,
+                    'n_arcs': n_arcs,
+                    'load_time': elapsed,
+                    'rss_peak_mb': rss.peak,
+                    'rss_delta_mb': rss.peak - rss.start,
+                    'peak_mb': peak/2**20})
+        finally:
+            os.remove(path)
+
+    return pd.DataFrame(rows)
+
+def git_commit():
+    """Short hash of the current commit ('' outside a git repository)."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+def rss_mb():
+    """Current resident memory of the process (MB), the peak so far where
+    /proc is not available."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*os.sysconf('SC_PAGE_SIZE')/2**20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+class RSSMonitor:
+    """
+    Peak resident memory of the process while a block runs, sampled by a
+    thread (Gurobi releases the GIL while it solves).
+
+    Args:
+        interval (float, optional): Seconds between samples. Defaults to 0.01.
+    """
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.start = self.peak = 0.0
+
+    def __enter__(self):
+        self.start = self.peak = rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_mb())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_mb())
+
+# columns of the table written by benchmark_pipeline
+PIPELINE_COLUMNS = ['commit', 'builder', 'n_reg', 'n_collec', 'n_manufs', 'n_prod', 'periods',
+                    'stage', 'time', 'rss_peak_mb', 'rss_delta_mb', 'grb_mem_mb', 'py_peak_mb', 'n_vars', 'n_constrs',
+                    'n_nz', 'status', 'gap', 'valid']
+
+def benchmark_pipeline(sizes, builder=create_model, time_limit=None, threads=None,
+                       trace_memory=False, output=None):
+    """
+    Time each stage of the pipeline (build, solve, extract, check) on synthetic
+    instances of growing size.
+
+    Args:
+        sizes (list): Tuples (n_reg, n_collec, n_manufs, n_prod, periods).
+        builder (function, optional): Model builder. Defaults to create_model.
+        time_limit (float, optional): Time limit of each solve in seconds.
+        threads (int, optional): Threads used by Gurobi.
+        trace_memory (bool, optional): Measure the peak Python memory of each
+            stage with tracemalloc (slows down the stages). Defaults to False.
+        output (str, optional): CSV file the rows are appended to, so runs of
+            different commits can be compared (see compare_benchmarks).
+
+    Returns:
+        DataFrame: One row per size and stage with its time, the peak resident
+            memory of the process during the stage and its increase over the
+            memory at the start of the stage, the peak Gurobi memory and the
+            model size.
+    """
+    commit = git_commit()
+    rows = []
+    for size in sizes:
+        instance = synthetic_instance(*size)
+        base = {'commit': commit, 'builder': builder.__name__,
+                **dict(zip(['n_reg', 'n_collec', 'n_manufs', 'n_prod', 'periods'], size))}
+        model = solution = None
+
+        def build():
+            return builder(instance)
+
+        def solve():
+            model.Params.OutputFlag = 0
+            if time_limit is not None:
+                model.Params.TimeLimit = time_limit
+            if threads is not None:
+                model.Params.Threads = threads
+            return solve_model(model)
+
+        def extract():
+            return get_results(model, instance)
+
+        def check():
+            return solution.solution_checker()
+
+        for stage, func in [('build', build), ('solve', solve), ('extract', extract), ('check', check)]:
+            if stage == 'check' and solution is None:
+                break
+            if trace_memory:
+                tracemalloc.start()
+            with RSSMonitor() as rss:
+                start = tm.perf_counter()
+                result = func()
+                elapsed = tm.perf_counter() - start
+            row = {**base, 'stage': stage, 'time': elapsed, 'rss_peak_mb': rss.peak,
+                   'rss_delta_mb': rss.peak - rss.start,
+                   'grb_mem_mb': model.MaxMemUsed*1024 if model is not None else 0.0}
+            if trace_memory:
+                row['py_peak_mb'] = tracemalloc.get_traced_memory()[1]/2**20
+                tracemalloc.stop()
+            if stage == 'build':
+                model = result
+                row.update({'n_vars': model.NumVars, 'n_constrs': model.NumConstrs, 'n_nz': model.NumNZs})
+            elif stage == 'solve':
+                row.update({'status': model.Status, 'gap': model.MIPGap if model.SolCount else None})
+            elif stage == 'extract':
+                solution = result[1]
+            else:
+                row['valid'] = result
+            rows.append(row)
+        model.dispose()
+
+    df = pd.DataFrame(rows, columns=PIPELINE_COLUMNS)
+    if output is not None:
+        df.to_csv(output, mode='a', header=not os.path.exists(output), index=False)
+    return df
+
+def compare_benchmarks(path):
+    """
+    Compare the stage times of the runs saved by benchmark_pipeline.
+
+    Args:
+        path (str): The CSV file written by benchmark_pipeline.
+
+    Returns:
+        DataFrame: Mean time of each size and stage (rows) for each commit
+            (columns).
+    """
+    df = pd.read_csv(path)
+    keys = ['builder', 'n_reg', 'n_collec', 'n_manufs', 'n_prod', 'periods', 'stage']
+    return df.pivot_table(index=keys, columns='commit', values='time', aggfunc='mean')
+
+
+if __name__ == '__main__':
+    sizes = [(5, 5, 3, 5, 4),
+             (20, 20, 10, 20, 12),
+             (50, 50, 20, 50, 24),
+             (100, 100, 40, 100, 52)]
+    print(benchmark_build(sizes).to_string(index=False))
+    # loader only: files of about 27 and 110 MB, too large to build and solve
+    loader_sizes = [(1000, 1000, 50, 500, 52),
+                    (2000, 2000, 100, 1000, 52)]
+    print(benchmark_loader(sizes + loader_sizes).to_string(index=False))
+    # python benchmark.py --large also streams files of about 0.4 and 1.7 GB: the parsed
+    # dictionaries take about 9 times the size of the file (rss_delta_mb), which bounds
+    # the files that can be loaded by the memory of the machine
+    args = [arg for arg in sys.argv[1:] if arg != '--large']
+    if '--large' in sys.argv:
+        large_sizes = [(4000, 4000, 200, 2000, 52),
+                       (8000, 8000, 400, 4000, 52)]
+        print(benchmark_loader(large_sizes, loaders=['stream']).to_string(index=False))
+    print(benchmark_lazy(sizes[:3], time_limit=600).to_string(index=False))
+    # the LP bound takes minutes on the largest size (the heuristic under a second)
+    print(benchmark_heuristic(sizes, bound_sizes=sizes[:3]).to_string(index=False))
+    # python benchmark.py results.csv appends the pipeline times to results.csv
+    output = args[0] if args else None
+    print(benchmark_pipeline(sizes[:2], time_limit=600, output=output).to_string(index=False))
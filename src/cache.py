@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Cache of solved instances.
+
+Solutions are keyed by a canonical hash of the data of the instance, which
+does not depend on the order of the sets or of the dictionaries, of the solver
+and of its parameters (functions, such as the solver or a builder, by their
+module and qualified name). The cache has two tiers: an LRU of solutions in memory and
+a folder of saved solutions (see Solution.save) that evicts the least
+recently used ones when it exceeds a size.
+"""
+import hashlib
+import json
+import os
+import shutil
+import weakref
+from collections import OrderedDict
+import numpy as np
+from classes import Solution
+from optimize import create_model, solve_model, get_results
+
+# data keys of the instances, computed once per instance
+_data_keys = weakref.WeakKeyDictionary()
+
+
+def canonical(value):
+    # JSON-serializable form of the value with sorted dictionaries and floats for the numbers
+    if isinstance(value, dict):
+        return sorted([json.dumps(canonical(k)), canonical(v)] for k, v in value.items())
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return [canonical(v) for v in value]
+    if isinstance(value, (bool, np.bool_)):
+        return bool(value)
+    if isinstance(value, (int, float, np.number)):
+        return float(value)
+    if callable(value):
+        # str() of a function holds its address, which changes between runs
+        return value.__module__ + '.' + value.__qualname__
+    return str(value)
+
+def data_key(instance):
+    """
+    Digest of the data of an instance: collectors, manufs, arcs, gen, demP,
+    iniA, the sets and the scalars (dt, capV, n_reg, alpha), independent of
+    their order.
+
+    The columnar arrays (see Instance.arrays) are hashed with the nodes and
+    periods sorted by name and the arcs by their end nodes. The digest is
+    computed once per instance.
+
+    Args:
+        instance (Instance): The instance.
+
+    Returns:
+        str: A hexadecimal digest.
+    """
+    if instance in _data_keys:
+        return _data_keys[instance]
+    arrays = instance.arrays
+    digest = hashlib.sha1()
+    order = {}
+    ranks = []
+    for key in ['regions', 'collectors', 'manufs', 'producers', 'time']:
+        values = np.asarray(arrays[key])
+        order[key] = np.argsort(values, kind='stable')
+        rank = np.empty(len(values), dtype=np.int64)
+        rank[order[key]] = np.arange(len(values))
+        ranks.append(rank)
+        digest.update(json.dumps([key, values[order[key]].tolist()]).encode())
+
+    t = order['time']
+    tables = {'collectors_data': np.asarray(arrays['collectors_data'])[order['collectors']],
+              'manufs_data': np.asarray(arrays['manufs_data'])[order['manufs']],
+              'iniA': np.asarray(arrays['iniA'])[order['collectors']],
+              'gen': np.asarray(arrays['gen'])[order['regions']][:, t],
+              'demP': np.asarray(arrays['demP'])[order['producers']][:, t]}
+    for key in sorted(tables):
+        digest.update(key.encode())
+        digest.update(np.ascontiguousarray(tables[key], dtype=np.float64).tobytes())
+
+    # arcs as (kind, rank) of their end nodes, sorted
+    offsets = np.cumsum([0] + [len(rank) for rank in ranks[:4]])
+    node_rank = np.concatenate(ranks[:4])
+    orig_kind = np.asarray(arrays['arc_orig_kind'], dtype=np.int64)
+    dest_kind = np.asarray(arrays['arc_dest_kind'], dtype=np.int64)
+    ends = np.column_stack([orig_kind, node_rank[offsets[orig_kind] + np.asarray(arrays['arc_orig'])],
+                            dest_kind, node_rank[offsets[dest_kind] + np.asarray(arrays['arc_dest'])]])
+    arcs = np.lexsort(ends.T[::-1])
+    digest.update(b'arcs')
+    digest.update(np.ascontiguousarray(ends[arcs]).tobytes())
+    digest.update(np.ascontiguousarray(np.asarray(arrays['arc_cost'])[arcs], dtype=np.float64).tobytes())
+
+    digest.update(json.dumps([float(getattr(instance, key)) for key in instance.SCALARS]).encode())
+    _data_keys[instance] = digest.hexdigest()
+    return _data_keys[instance]
+
+def instance_key(instance, **params):
+    """
+    Key of an instance and solver parameters: data_key of the instance
+    combined with the canonical parameters.
+
+    Args:
+        instance (Instance): The instance.
+        **params: Solver parameters added to the key.
+
+    Returns:
+        str: A hexadecimal digest.
+    """
+    content = json.dumps([data_key(instance), canonical(params)], separators=(',', ':'))
+    return hashlib.sha1(content.encode()).hexdigest()
+
+def solve_instance(instance, builder=create_model, **params):
+    """
+    Build and solve an instance.
+
+    Returns:
+        tuple: The status and the solution, as returned by get_results.
+    """
+    model = builder(instance)
+    for key, value in params.items():
+        model.setParam(key, value)
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    model.dispose()
+    return status, solution
+
+def folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, name))
+               for root, _, names in os.walk(path) for name in names)
+
+class ResultCache:
+    """
+    Two-tier cache of solutions keyed by instance_key.
+
+    Args:
+        path (str, optional): Folder of the disk tier, created if needed. No
+            disk tier if None.
+        maxsize (int, optional): Maximum number of solutions in memory, the
+            least recently used is dropped when it is exceeded. Defaults to 64.
+        max_bytes (int, optional): Maximum size of the disk tier, the least
+            recently used solutions are deleted when it is exceeded. Defaults
+            to 1 GB.
+    """
+    def __init__(self, path=None, maxsize=64, max_bytes=2**30):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.memory = OrderedDict()
+        self.hits = {'memory': 0, 'disk': 0}
+        self.misses = 0
+        # size of the entries of the disk tier, least recently used first
+        self.disk = OrderedDict()
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            entries = [os.path.join(path, key) for key in os.listdir(path)
+                       if os.path.isfile(os.path.join(path, key, 'status'))]
+            for entry in sorted(entries, key=os.path.getmtime):
+                self.disk[os.path.basename(entry)] = folder_size(entry)
+
+    @property
+    def disk_bytes(self):
+        return sum(self.disk.values())
+
+    def stats(self):
+        """Hits by tier, misses and the size of both tiers."""
+        return {'hits_memory': self.hits['memory'], 'hits_disk': self.hits['disk'], 'misses': self.misses,
+                'n_memory': len(self.memory), 'n_disk': len(self.disk), 'disk_bytes': self.disk_bytes}
+
+    def get(self, instance, solver=solve_instance, **params):
+        """
+        Cached result of an instance.
+
+        Args:
+            instance (Instance): The instance.
+            solver (function, optional): Solver of the result. Defaults to
+                solve_instance.
+            **params: Solver parameters of the result.
+
+        Returns:
+            tuple: The status and the solution, None if it is not cached. The
+                solution refers to the cached instance, equal to the given one
+                up to the order of its data.
+        """
+        key = instance_key(instance, solver=solver, **params)
+        if key in self.memory:
+            self.hits['memory'] += 1
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if key in self.disk:
+            entry = os.path.join(self.path, key)
+            with open(os.path.join(entry, 'status'), 'r') as status_file:
+                result = (status_file.read(), Solution.load(entry))
+            self.hits['disk'] += 1
+            os.utime(entry)
+            self.disk.move_to_end(key)
+            self._remember(key, result)
+            return result
+        self.misses += 1
+        return None
+
+    def put(self, instance, status, solution, solver=solve_instance, **params):
+        """
+        Cache the result of an instance (results without solution are not
+        cached).
+
+        Args:
+            instance (Instance): The instance.
+            status (str): The status of the result.
+            solution (Solution): The solution.
+            solver (function, optional): Solver of the result. Defaults to
+                solve_instance.
+            **params: Solver parameters of the result.
+        """
+        if solution is None:
+            return
+        key = instance_key(instance, solver=solver, **params)
+        self._remember(key, (status, solution))
+        if self.path is None or key in self.disk:
+            return
+
+        # write to a temporary folder and rename it, so readers never see half an entry
+        entry = os.path.join(self.path, key)
+        tmp = '%s.tmp%d' % (entry, os.getpid())
+        solution.save(tmp)
+        with open(os.path.join(tmp, 'status'), 'w') as status_file:
+            status_file.write(status)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # written meanwhile by another process
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.disk[key] = folder_size(entry)
+        while self.disk_bytes > self.max_bytes and len(self.disk) > 1:
+            evicted, _ = self.disk.popitem(last=False)
+            shutil.rmtree(os.path.join(self.path, evicted), ignore_errors=True)
+
+    def _remember(self, key, result):
+        self.memory[key] = result
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def solve(self, instance, solver=solve_instance, **params):
+        """
+        Cached result of an instance, solved and cached on a miss.
+
+        Args:
+            instance (Instance): The instance.
+            solver (function, optional): Called as solver(instance, **params)
+                on a miss, returns the status and the solution. Defaults to
+                solve_instance. Part of the key, as the parameters.
+            **params: Solver parameters (part of the key), e.g. the builder
+                of solve_instance.
+
+        Returns:
+            tuple: The status and the solution.
+        """
+        result = self.get(instance, solver=solver, **params)
+        if result is None:
+            result = solver(instance, **params)
+            self.put(instance, *result, solver=solver, **params)
+        return result
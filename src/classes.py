@@ -5,10 +5,13 @@ Created on Mon Jun 19 16:13:16 2023
 @author: pablo.maya
 """
 
+import json
+import os
 import gurobipy as gp
 import numpy as np
-import random
-from utilities import create_partition, euclidean
+import pandas as pd
+from utilities import instance_generator
+from kpis import evaluate, tables
 
 class Instance:
   """
@@ -22,7 +25,8 @@ class Instance:
 
     
     self.name = name
-    self.raw_data = data
+    self._raw_data = data
+    self._arrays = None
     
     # desagregated data
     self.regions = data['regions']
@@ -46,183 +50,598 @@ class Instance:
     self.manufs, self.c_clean, self.capM  = gp.multidict(data['manufs'])
 
     # Sparse network
-    self.arcs, self.c_transp = gp.multidict(data['arcs'])
+    self._arcs, self._c_transp = gp.multidict(data['arcs'])
 
     
-    self.gen = data['gen'] # generation in each region at each period
-    self.demP = data['demP'] # demand of each producer at each time
+    self._gen = data['gen'] # generation in each region at each period
+    self._demP = data['demP'] # demand of each producer at each time
     self.dt = data['dt'] # number of periods for the collector agreement
     self.capV = data['capV'] # Vehicle capacity
     self.n_reg = data['n_reg'] # number of regions
     self.alpha = data['alpha'] # maximum difference in coverage among regions
-    
-  def __init__(self, name='instance0' ):
-      self.name = name
-      
-      
-  def instance_generator(self, n_reg, n_collec, n_manufs, n_prod, periods, demand_range, 
-                           p_capT, # percentage of increase of capacity regarding demand
-                           p_capC, # percentage of increase of capacity regarding demand
-                           p_capS, # perecentage of the capacity at collector
-                           p_gen, # percentage of the generation considered in the demand 
-                           v_base, # basis value of a returnable packaging
-                           p_transp, # percenatje of transport per bootle 
-                           d_tranp, # percentaje of variation accordin to distance [0, 1]
-                           p_buy, # cost of buy as percentage of v_base of a packaging
-                           p_clasif, # cost of classifying as percentage of v_base of a packaging
-                           p_activ, # cost of activation as a percentaje of the value of the capacity
-                           p_hold, # cost of stock as percentage of v_base of a packaging
-                           p_clean, # cost of cleaning as percentage of v_base of a packaging
-                           dt,
-                           alpha,
-                           min_reg):
-        
-        self.regions = ["r"+str(i+1) for i in range(n_reg)]
-        self.collectors = ["c"+str(i+1) for i in range(n_collec)]
-        self.manufs = ["m"+str(i+1) for i in range(n_manufs)]
-        self.producers = ["p"+str(i+1) for i in range(n_prod)]
-        self.time = [(t+1) for t in range(periods)]
-        # create demands per region
-        demP  = {(p,t):random.randint(demand_range[0], demand_range[1]) \
-                    for p in producers for t in time}
-        
-        # calculate the maximum demand in a period    
-        agg_dem = {t: sum(val for (key, val) in demP.items() if key[1] == t) for t in set(key[1] for key in demP)}
-        max_demt = max(list(agg_dem.values()))
-        
-        
-        # create transformers capacity
-        capT = create_partition(n_manufs, int(max_demt*(1+p_capT)))
-        capT = {c:capT[i] for i, c in enumerate(manufs) }
-        
-        # create collectors clasif capacity, inventory capacity and initial value
-        capC = create_partition(n_collec, int(max_demt*(1+p_capC)))
-        capC = {c : capC[i] for i, c in enumerate(collectors) }
-        capS = {k : int(v*p_capS) for k, v in capC.items()}
-        iniS = {k : random.randint(0, v) for k, v in capS.items()}
-        
-        # create region generation
-        gen = create_partition(n_collec, int(max_demt/p_gen))
-        gen = {r : gen[i] for i, r in enumerate(regions) }
-        
-        # create vehicle capacity
-        max_dem = max(demP.values())
-        capV = random.randint(int(max_dem/2), max_dem)
-        
-        # Create arcs
-        # create coordinates on a 100x100  panel
-        nodes = {s:(random.uniform(0, 100), random.uniform(0, 100)) for s in collectors + manufs + producers}
-        arcs_e1 = {(r, c):0 for r in regions for c in collectors}
-        arcs_e2 = {(c, m):euclidean(nodes[c], nodes[m])  for c in collectors for m in manufs}
-        arcs_e3 = {(m, p):euclidean(nodes[m], nodes[p])  for m in producers for p in producers}
-        arcs = {**arcs_e1, **arcs_e2, **arcs_e3}
-        max_dist = max(arcs.values())
-        factor = d_tranp*capV*p_transp/max_dist
-        arcs = {k : int(v*factor) for k,v in arcs.items()}
-        
-        c_buy = p_buy*v_base
-        c_clasif = p_clasif*v_base
-        c_activ = {c : capC[c]*v_base*p_activ for c in collectors}
-        c_hold = p_hold*v_base
-        c_clean = p_clean*v_base
-        dt = dt
-        alpha = alpha
-        min_reg = min_reg
-    
-      
-      
+    # activity of each collector in the period before the first one (rolling horizon)
+    self.iniA = data.get('iniA', {c: 0 for c in self.collectors})
+    # upper bounds of flow and trip of each (arc, period), set by presolve
+    self.bounds = None
+
+  # columnar layout: node name tables, arcs as (kind, position) of their
+  # end nodes, parameters as arrays indexed like the node tables
+  ARRAYS = ('regions', 'collectors', 'manufs', 'producers', 'time', 'collectors_data',
+            'manufs_data', 'iniA', 'arc_orig_kind', 'arc_orig', 'arc_dest_kind', 'arc_dest',
+            'arc_cost', 'gen', 'demP')
+  SCALARS = ('dt', 'capV', 'n_reg', 'alpha')
+
+  @classmethod
+  def from_arrays(cls, arrays, scalars, name='instance0'):
+    """
+      Create an instance from its columnar arrays (see Instance.arrays). The
+      tuple dictionaries (arcs, c_transp, gen, demP) are only created when
+      they are accessed.
+
+      Args:
+          arrays (dict): The arrays listed in Instance.ARRAYS.
+          scalars (dict): The values of dt, capV, n_reg and alpha.
+          name (str, optional): The name of the instance. Defaults to 'instance0'.
+
+      Returns:
+          Instance: The instance.
+    """
+    self = cls.__new__(cls)
+    self.name = name
+    self._arrays = dict(arrays)
+    self._raw_data = self._arcs = self._c_transp = self._gen = self._demP = self.bounds = None
+
+    self.regions = arrays['regions'].tolist()
+    self.producers = arrays['producers'].tolist()
+    self.time = arrays['time'].tolist()
+    self.collectors = arrays['collectors'].tolist()
+    self.c_buy, self.c_clasif, self.c_activ, self.c_hold, self.capC, self.capS, self.iniS = \
+        [dict(zip(self.collectors, col)) for col in np.asarray(arrays['collectors_data']).T.tolist()]
+    self.manufs = arrays['manufs'].tolist()
+    self.c_clean, self.capM = \
+        [dict(zip(self.manufs, col)) for col in np.asarray(arrays['manufs_data']).T.tolist()]
+    self.iniA = dict(zip(self.collectors, np.asarray(arrays['iniA']).tolist()))
+    for key in cls.SCALARS:
+        setattr(self, key, scalars[key])
+    return self
+
+  @classmethod
+  def load(cls, path, mmap_mode='r'):
+    """
+      Load an instance saved with Instance.save, memory mapping its arrays.
+
+      Args:
+          path (str): The folder of the instance.
+          mmap_mode (str, optional): Memory map mode of numpy.load, None reads
+              the arrays in memory. Defaults to 'r'.
+
+      Returns:
+          Instance: The instance.
+    """
+    with open(os.path.join(path, 'instance.json'), 'r') as json_file:
+        meta = json.load(json_file)
+    arrays = {key: np.load(os.path.join(path, key + '.npy'), mmap_mode=mmap_mode)
+              for key in cls.ARRAYS}
+    return cls.from_arrays(arrays, meta['scalars'], meta['name'])
+
+  def save(self, path):
+    """
+      Save the instance as a folder with one .npy file per array of
+      Instance.arrays and the scalars in instance.json.
+
+      Args:
+          path (str): The folder of the instance, created if needed.
+    """
+    os.makedirs(path, exist_ok=True)
+    for key, array in self.arrays.items():
+        np.save(os.path.join(path, key + '.npy'), np.asarray(array))
+    with open(os.path.join(path, 'instance.json'), 'w') as json_file:
+        json.dump({'name': self.name,
+                   'scalars': {key: getattr(self, key) for key in self.SCALARS}}, json_file)
+
+  @property
+  def arrays(self):
+    """Columnar view of the instance, built from the dictionaries if needed."""
+    if self._arrays is None:
+        kind = {}
+        pos = {}
+        for k, nodes in enumerate([self.regions, self.collectors, self.manufs, self.producers]):
+            for i, n in enumerate(nodes):
+                kind[n] = k
+                pos[n] = i
+        n_arcs = len(self._arcs)
+        self._arrays = {
+            'regions': np.array(self.regions, dtype=str),
+            'collectors': np.array(self.collectors, dtype=str),
+            'manufs': np.array(self.manufs, dtype=str),
+            'producers': np.array(self.producers, dtype=str),
+            'time': np.array(self.time, dtype=np.int64),
+            'collectors_data': np.array(
+                [[p[c] for p in [self.c_buy, self.c_clasif, self.c_activ, self.c_hold,
+                                 self.capC, self.capS, self.iniS]] for c in self.collectors],
+                dtype=float).reshape(len(self.collectors), 7),
+            'manufs_data': np.array([[self.c_clean[m], self.capM[m]] for m in self.manufs],
+                                    dtype=float).reshape(len(self.manufs), 2),
+            'iniA': np.array([self.iniA[c] for c in self.collectors], dtype=float),
+            'arc_orig_kind': np.fromiter((kind[o] for o, d in self._arcs), dtype=np.int8, count=n_arcs),
+            'arc_orig': np.fromiter((pos[o] for o, d in self._arcs), dtype=np.int32, count=n_arcs),
+            'arc_dest_kind': np.fromiter((kind[d] for o, d in self._arcs), dtype=np.int8, count=n_arcs),
+            'arc_dest': np.fromiter((pos[d] for o, d in self._arcs), dtype=np.int32, count=n_arcs),
+            'arc_cost': np.fromiter((self._c_transp[a] for a in self._arcs), dtype=float, count=n_arcs),
+            'gen': np.array([[self._gen[r, t] for t in self.time] for r in self.regions],
+                            dtype=float).reshape(len(self.regions), len(self.time)),
+            'demP': np.array([[self._demP[p, t] for t in self.time] for p in self.producers],
+                             dtype=float).reshape(len(self.producers), len(self.time))}
+    return self._arrays
+
+  def node_names(self, kind, pos):
+    """Names of the nodes given their kind (0 regions, 1 collectors, 2 manufs,
+    3 producers) and position arrays."""
+    arrays = self.arrays
+    tables = [arrays[key] for key in ['regions', 'collectors', 'manufs', 'producers']]
+    offsets = np.cumsum([0] + [len(t) for t in tables])
+    return np.concatenate(tables).astype(object)[offsets[np.asarray(kind)] + np.asarray(pos)]
+
+  @property
+  def arcs(self):
+    if self._arcs is None:
+        arrays = self.arrays
+        self._arcs = gp.tuplelist(zip(
+            self.node_names(arrays['arc_orig_kind'], arrays['arc_orig']).tolist(),
+            self.node_names(arrays['arc_dest_kind'], arrays['arc_dest']).tolist()))
+    return self._arcs
+
+  @property
+  def c_transp(self):
+    if self._c_transp is None:
+        self._c_transp = dict(zip(self.arcs, np.asarray(self.arrays['arc_cost']).tolist()))
+    return self._c_transp
+
+  @property
+  def gen(self):
+    if self._gen is None:
+        self._gen = {(r, t): v for r, row in zip(self.regions, np.asarray(self.arrays['gen']).tolist())
+                     for t, v in zip(self.time, row)}
+    return self._gen
+
+  @property
+  def demP(self):
+    if self._demP is None:
+        self._demP = {(p, t): v for p, row in zip(self.producers, np.asarray(self.arrays['demP']).tolist())
+                      for t, v in zip(self.time, row)}
+    return self._demP
+
+  @property
+  def raw_data(self):
+    if self._raw_data is None:
+        self._raw_data = {
+            'regions': self.regions,
+            'collectors': {c: [self.c_buy[c], self.c_clasif[c], self.c_activ[c], self.c_hold[c],
+                               self.capC[c], self.capS[c], self.iniS[c]] for c in self.collectors},
+            'manufs': {m: [self.c_clean[m], self.capM[m]] for m in self.manufs},
+            'producers': self.producers,
+            'time': self.time,
+            'arcs': self.c_transp,
+            'gen': self.gen,
+            'demP': self.demP,
+            'iniA': self.iniA,
+            **{key: getattr(self, key) for key in self.SCALARS}}
+    return self._raw_data
+
+  def presolve(self):
+    """
+      Remove the arcs that cannot carry flow and bound the flow and trips of
+      the remaining ones.
+
+      The bounds are propagated through the network: an arc from a region
+      carries at most the generation of the region and the classification
+      capacity of the collector, a collector ships at most its stock plus
+      what it can receive, a manufacturer at most its capacity and what it
+      can receive, and a manufacturer receives at most what it can ship. A
+      trip carries capV, so trips are bounded by ceil(flow/capV) (and fixed
+      to 0 on the arcs from regions, which have no trips constraint).
+
+      Returns:
+          Instance: The instance without the unusable arcs, with the upper
+              bounds of flow and trip of each (arc, period) in its bounds
+              attribute (arrays arcs x periods, 0 for impossible pairs).
+    """
+    arrays = self.arrays
+    C, M, T = len(self.collectors), len(self.manufs), len(self.time)
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    dest_kind = np.asarray(arrays['arc_dest_kind'])
+    orig = np.asarray(arrays['arc_orig'], dtype=np.int64)
+    dest = np.asarray(arrays['arc_dest'], dtype=np.int64)
+    capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float)[:, 4:7].T
+    capM = np.asarray(arrays['manufs_data'], dtype=float)[:, 1]
+    gen = np.asarray(arrays['gen'], dtype=float)
+    e1 = (orig_kind == 0) & (dest_kind == 1)
+    e2 = (orig_kind == 1) & (dest_kind == 2)
+    e3 = (orig_kind == 2) & (dest_kind == 3)
+
+    def total(node, values, n):
+        # sum of the bounds of the arcs of each node, by period
+        out = np.zeros((n, T))
+        np.add.at(out, node, values)
+        return out
+
+    flow = np.full((len(orig), T), np.inf)
+    # regions -> collectors
+    flow[e1] = np.minimum(gen[orig[e1]], capC[dest[e1], None])
+    inflow = np.minimum(total(dest[e1], flow[e1], C), capC[:, None])
+    # collectors -> manufs: previous stock plus the inflow of the period
+    available = np.empty((C, T))
+    level = iniS
+    for t in range(T):
+        available[:, t] = level + inflow[:, t]
+        level = np.minimum(capS, available[:, t])
+    flow[e2] = np.minimum(available[orig[e2]], capM[dest[e2], None])
+    # manufs -> producers, and back: a manufacturer receives what it can ship
+    flow[e3] = np.minimum(total(dest[e2], flow[e2], M), capM[:, None])[orig[e3]]
+    flow[e2] = np.minimum(flow[e2], total(orig[e3], flow[e3], M)[dest[e2]])
+
+    trip = np.zeros_like(flow)
+    trip[e2 | e3] = np.ceil(flow[e2 | e3]/self.capV)
+
+    keep = flow.max(axis=1) > 0
+    reduced = dict(arrays)
+    for key in ['arc_orig_kind', 'arc_orig', 'arc_dest_kind', 'arc_dest', 'arc_cost']:
+        reduced[key] = np.asarray(arrays[key])[keep]
+    instance = Instance.from_arrays(reduced, {key: getattr(self, key) for key in self.SCALARS}, self.name)
+    instance.bounds = {'flow': flow[keep], 'trip': trip[keep]}
+    return instance
+
+  def precheck(self, tol=1e-6, report=False):
+    """
+      Aggregate feasibility tests, run before building the model.
+
+      The tests are necessary conditions (a relaxation of the model), so an
+      instance that fails one is infeasible while one that passes all of
+      them may still be infeasible:
+        - cover: n_reg regions exist (a covered region needs no arcs, gen
+          only bounds its flow at 0).
+        - demP (echelon 3): the manufacturers with an arc to a producer can
+          clean its demand in every period.
+        - flow_bound (echelon 3): the flow bounds of Instance.presolve on the
+          arcs into a producer cover its demand in every period.
+        - capM (echelon 2): the manufacturers reachable from collectors and
+          reaching producers can clean the total demand of every period.
+        - supply (echelon 1): the initial stock of the collectors shipping to
+          usable manufacturers plus what the n_reg largest regions generate
+          (at most the classification capacity of the collectors with region
+          arcs) covers the cumulative demand of every period.
+
+      Args:
+          tol (float, optional): Tolerance of the comparisons. Defaults to 1e-6.
+          report (bool, optional): Return the failed tests instead of a flag.
+              Defaults to False.
+
+      Returns:
+          bool or DataFrame: True if every test passes or, when report is
+              True, a DataFrame with one row per failed test (test, echelon,
+              key, period, available, required and shortfall).
+    """
+    arrays = self.arrays
+    R, C, M, P = len(self.regions), len(self.collectors), len(self.manufs), len(self.producers)
+    time = np.asarray(self.time)
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    dest_kind = np.asarray(arrays['arc_dest_kind'])
+    orig = np.asarray(arrays['arc_orig'], dtype=np.int64)
+    dest = np.asarray(arrays['arc_dest'], dtype=np.int64)
+    capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float)[:, 4:7].T
+    capM = np.asarray(arrays['manufs_data'], dtype=float)[:, 1]
+    gen = np.asarray(arrays['gen'], dtype=float)
+    demP = np.asarray(arrays['demP'], dtype=float)
+    demand = demP.sum(axis=0)
+    e1 = (orig_kind == 0) & (dest_kind == 1)
+    e2 = (orig_kind == 1) & (dest_kind == 2)
+    e3 = (orig_kind == 2) & (dest_kind == 3)
+
+    def has(node, sel, n):
+        # nodes with at least one arc of the selection
+        return np.bincount(node[sel], minlength=n) > 0
+
+    failed = []
+    def test(name, echelon, key, period, available, required):
+        available, required = np.broadcast_arrays(np.asarray(available, dtype=float),
+                                                  np.asarray(required, dtype=float))
+        key, period = np.broadcast_to(key, available.shape), np.broadcast_to(period, available.shape)
+        mask = required - available > tol
+        failed.append(pd.DataFrame({'test': name, 'echelon': echelon, 'key': key[mask], 'period': period[mask],
+                                    'available': available[mask], 'required': required[mask],
+                                    'shortfall': (required - available)[mask]}))
+
+    test('cover', 1, 'n_reg', -99, R, self.n_reg)
+    # manufs -> producers
+    reach = np.zeros((M, P))
+    reach[orig[e3], dest[e3]] = 1
+    test('demP', 3, np.asarray(self.producers, dtype=object)[:, None], time[None, :],
+         (capM @ reach)[:, None], demP)
+    instance = self.presolve()
+    inflow = np.zeros((P, len(time)))
+    keep_e3 = (np.asarray(instance.arrays['arc_orig_kind']) == 2) & (np.asarray(instance.arrays['arc_dest_kind']) == 3)
+    np.add.at(inflow, np.asarray(instance.arrays['arc_dest'])[keep_e3], instance.bounds['flow'][keep_e3])
+    test('flow_bound', 3, np.asarray(self.producers, dtype=object)[:, None], time[None, :], inflow, demP)
+    # collectors -> manufs
+    manufs = has(dest, e2, M) & has(orig, e3, M)
+    test('capM', 2, 'manufs', time, capM[manufs].sum(), demand)
+    # regions -> collectors, with the stock carried between periods
+    to_manufs = np.flatnonzero(e2)
+    to_manufs = to_manufs[manufs[dest[to_manufs]]]
+    # the stock of every collector reaching a usable manuf counts, the
+    # classification capacity only of those that also receive from regions
+    shipping = np.bincount(orig[to_manufs], minlength=C) > 0
+    collectors = has(dest, e1, C) & shipping
+    # only the regions with arcs to collectors supply
+    largest = -np.sort(-gen[has(orig, e1, R)], axis=0)[:self.n_reg].sum(axis=0)
+    supply = np.minimum(largest, capC[collectors].sum())
+    test('supply', 1, 'regions', time, iniS[shipping].sum() + np.cumsum(supply), np.cumsum(demand))
+
+    failed = pd.concat(failed, ignore_index=True)
+    if report:
+        return failed
+    return failed.empty
+
+  @classmethod
+  def instance_generator(cls, *args, name='instance0', **kwargs):
+    """
+      Generate a random instance, see utilities.instance_generator for the
+      arguments (the last one, seed, makes the instance reproducible).
+
+      Returns:
+          Instance: The generated instance, built from its arrays.
+    """
+    arrays, scalars = instance_generator(*args, **kwargs)
+    return cls.from_arrays(arrays, scalars, name)
+
 
-    
 class Solution:
     """
     Represents a solution to a mathematical optimization model.
+
+    The variables are kept in compact frames (flows and network): categorical
+    names and nodes, float64 values (float32 halves them, but large balances
+    then lose their units) and, by default, only the nonzero values.
+    The index of a row is its position in the full frames, which are built on
+    demand (df_flows and df_network).
     
     Args:
         instance (object): An instance object containing the parameters used in the model.
         dict_sol (dict): A dictionary containing the solution results.
-        df_flows (DataFrame): A DataFrame containing the flow variables of the solution.
-        df_network (DataFrame): A DataFrame containing the network variables of the solution.
+        df_flows (DataFrame): A DataFrame containing the flow variables of the solution,
+            with the rows of Solution.flow_keys.
+        df_network (DataFrame): A DataFrame containing the network variables of the solution,
+            with the rows of Solution.network_keys.
         name (str, optional): The name of the solution. Defaults to 'solution0'.
+        nonzero (bool, optional): Keep only the nonzero values. Defaults to True.
+        dtype (dtype, optional): Type of the values. Defaults to float64.
     """
-    def __init__(self, instance, dict_sol, df_flows, df_network, name='solution0'):
+    # variable families of df_network, in order
+    NETWORK = ('activ', 'activ_f', 'cover', 'cover_max', 'cover_min', 'stock')
+
+    def __init__(self, instance, dict_sol, df_flows, df_network, name='solution0', nonzero=True,
+                 dtype=np.float64):
         self.instance = instance
         self.dict_sol = dict_sol
-        self.df_flows = df_flows
-        # agregate a column arc to be used as a key
-        self.df_flows['arc'] = list(zip(self.df_flows['origin'], self.df_flows['destination']))
-        self.df_network = df_network
-        
-        
-    def solution_checker(self):
-        # function to compare a value in the df to a value in a dictionary with que (a1,a2)
-        def check_condition(row, dictionary, key):
-            if len(key)==1:
-                return row['value'] <= dictionary[(row[key[0]], row[key[1]])]
-            if len(key)==2:
-                return row['value'] <= dictionary[(row[key[0]], row[key[1]])]
-        
-        # get only the flow variables 
-        flows = self.df_flows[self.df_flows['name']=='flow']
-        network = self.df_network
+        self.name = name
+        self.flows = self.compact(df_flows, nonzero, dtype)
+        self.network = self.compact(df_network, nonzero, dtype)
+        self._df_flows = self._df_network = self._kpis = None
+
+    @staticmethod
+    def compact(df, nonzero=True, dtype=np.float64):
+        """Compact copy of a solution frame: categorical text columns, int32
+        periods, values of the given dtype and only the nonzero rows if
+        nonzero is True."""
+        df = df.drop(columns='arc', errors='ignore')
+        if nonzero:
+            df = df[df['value'] != 0]
+        return df.astype({col: 'category' for col in df.columns if col not in ('period', 'value')}
+                         | {'period': np.int32, 'value': dtype})
+
+    @staticmethod
+    def flow_keys(instance, rows=None):
+        """Keys (name, origin, destination, period) of the flow and trip
+        variables, in the order of the model (only the given row positions
+        if rows is not None)."""
+        T = len(instance.time)
+        arrays = instance.arrays
+        n = len(arrays['arc_cost'])*T
+        rows = np.arange(2*n) if rows is None else np.asarray(rows)
+        arc, t = np.divmod(rows % n, T)
+        return pd.DataFrame({
+            'name': np.array(['flow', 'trip'], dtype=object)[rows // n],
+            'origin': instance.node_names(np.asarray(arrays['arc_orig_kind'])[arc], np.asarray(arrays['arc_orig'])[arc]),
+            'destination': instance.node_names(np.asarray(arrays['arc_dest_kind'])[arc], np.asarray(arrays['arc_dest'])[arc]),
+            'period': np.array(instance.time)[t]}, index=rows)
+
+    @staticmethod
+    def network_keys(instance):
+        """Keys (name, facility, period) of the network variables, in the
+        order of Solution.NETWORK."""
+        T = len(instance.time)
+        time = np.array(instance.time)
+        collectors = np.array(instance.collectors, dtype=object)
+        regions = np.array(instance.regions, dtype=object)
+        # cover variables have a single index, cover_max/cover_min keep the period as facility
+        network = [(name, np.repeat(collectors, T), np.tile(time, len(collectors)))
+                   for name in ['activ', 'activ_f']]
+        network += [('cover', regions, np.full(len(regions), -99))]
+        network += [(name, time.astype(str).astype(object), np.full(T, -99))
+                    for name in ['cover_max', 'cover_min']]
+        network += [('stock', np.repeat(collectors, T), np.tile(time, len(collectors)))]
+        return pd.DataFrame({
+            'name': np.concatenate([np.full(len(f), name, dtype=object) for name, f, p in network]),
+            'facility': np.concatenate([f for name, f, p in network]),
+            'period': np.concatenate([p for name, f, p in network]).astype(int)})
+
+    @staticmethod
+    def expand(keys, compact):
+        # full frame: the keys with the values of the compact frame, 0 elsewhere
+        value = np.zeros(len(keys))
+        value[compact.index.to_numpy()] = compact['value'].to_numpy(dtype=float)
+        keys['value'] = value
+        return keys
+
+    @property
+    def df_flows(self):
+        """Full frame of the flow and trip variables, with an arc column."""
+        if self._df_flows is None:
+            self._df_flows = self.expand(self.flow_keys(self.instance), self.flows)
+            # agregate a column arc to be used as a key
+            self._df_flows['arc'] = list(zip(self._df_flows['origin'], self._df_flows['destination']))
+        return self._df_flows
+
+    def values(self):
+        """Values of each variable family, in the order of the variables of
+        create_model (see kpis.evaluate)."""
+        instance = self.instance
+        T = len(instance.time)
+        n = len(instance.arrays['arc_cost'])*T
+        flows = np.zeros(2*n)
+        flows[self.flows.index.to_numpy()] = self.flows['value'].to_numpy(dtype=float)
+        network = np.zeros(len(self.network_keys(instance)))
+        network[self.network.index.to_numpy()] = self.network['value'].to_numpy(dtype=float)
+        C, R = len(instance.collectors), len(instance.regions)
+        sizes = {'activ': C*T, 'activ_f': C*T, 'cover': R, 'cover_max': T, 'cover_min': T, 'stock': C*T}
+        X = {'flow': flows[:n], 'trip': flows[n:]}
+        X.update(zip(self.NETWORK, np.split(network, np.cumsum([sizes[k] for k in self.NETWORK])[:-1])))
+        return X
+
+    @property
+    def kpis(self):
+        """KPI tables by node, arc and echelon and period (see kpis.tables)."""
+        if self._kpis is None:
+            self._kpis = tables(self.instance, evaluate(self.instance, self.values()))
+        return self._kpis
+
+    @property
+    def df_network(self):
+        """Full frame of the network variables."""
+        if self._df_network is None:
+            self._df_network = self.expand(self.network_keys(self.instance), self.network)
+        return self._df_network
+
+    def save(self, path):
+        """
+        Save the solution as a folder with its compact frames in Parquet
+        files, dict_sol in solution.json and the instance (see Instance.save).
+
+        Args:
+            path (str): The folder of the solution, created if needed.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.flows.to_parquet(os.path.join(path, 'flows.parquet'))
+        self.network.to_parquet(os.path.join(path, 'network.parquet'))
+        with open(os.path.join(path, 'solution.json'), 'w') as json_file:
+            json.dump({'name': self.name, 'dict_sol': self.dict_sol}, json_file,
+                      default=lambda v: v.item() if isinstance(v, np.generic) else str(v))
+        self.instance.save(os.path.join(path, 'instance'))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Load a solution saved with Solution.save.
+
+        Args:
+            path (str): The folder of the solution.
+            mmap_mode (str, optional): Memory map mode of the instance arrays.
+                Defaults to 'r'.
+
+        Returns:
+            Solution: The solution.
+        """
+        with open(os.path.join(path, 'solution.json'), 'r') as json_file:
+            meta = json.load(json_file)
+        self = cls.__new__(cls)
+        self.instance = Instance.load(os.path.join(path, 'instance'), mmap_mode=mmap_mode)
+        self.dict_sol = meta['dict_sol']
+        self.name = meta['name']
+        self.flows = pd.read_parquet(os.path.join(path, 'flows.parquet'))
+        self.network = pd.read_parquet(os.path.join(path, 'network.parquet'))
+        self._df_flows = self._df_network = self._kpis = None
+        return self
         
-        # check objaective function
-        if self.dict_sol['obj_val'] - self.dict_sol['c_total'] >= 0.1:
-            return False
         
+    def solution_checker(self, tol=0.1, report=False):
+        """
+        Check the solution against the constraints of the model.
+
+        Args:
+            tol (float, optional): Tolerance of the comparisons. Defaults to 0.1.
+            report (bool, optional): Return the violations instead of a flag.
+                Defaults to False.
+
+        Returns:
+            bool or DataFrame: True if no constraint is violated or, when report
+                is True, a DataFrame with one row per violated constraint
+                (constraint family, key, lhs, rhs and violation).
+        """
+        instance = self.instance
+        arrays = instance.arrays
+        time = np.asarray(instance.time)
+        # aggregates of the compact values, the full frames are not built
+        ev = evaluate(instance, self.values())
+        capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float)[:, 4:7].T
+        capM = np.asarray(arrays['manufs_data'], dtype=float)[:, 1]
+
+        def nodes(names):
+            names = np.asarray(names, dtype=object)
+            return lambda i: names[i]
+
+        def arcs(i):
+            # (origin, destination) of the arcs at the given positions
+            o = instance.node_names(np.asarray(arrays['arc_orig_kind'])[i], np.asarray(arrays['arc_orig'])[i])
+            d = instance.node_names(np.asarray(arrays['arc_dest_kind'])[i], np.asarray(arrays['arc_dest'])[i])
+            return list(zip(o, d))
+
+        violations = []
+        def check(name, keys, lhs, rhs, sense):
+            # lhs and rhs are (rows x periods) arrays, keys names the rows
+            lhs, rhs = np.broadcast_arrays(np.atleast_2d(np.asarray(lhs, dtype=float)),
+                                           np.atleast_2d(np.asarray(rhs, dtype=float)))
+            if sense == '<=':
+                gap = lhs - rhs
+            elif sense == '>=':
+                gap = rhs - lhs
+            else:
+                gap = np.abs(lhs - rhs)
+            i, j = np.nonzero(gap > tol)
+            if callable(keys):
+                keys = [(*k, t) if isinstance(k, tuple) else (k, t) for k, t in zip(keys(i), time[j])]
+            else:
+                keys = [keys]*len(i)
+            violations.append(pd.DataFrame({'constraint': name, 'key': pd.Series(keys, dtype=object),
+                                            'lhs': lhs[i, j], 'rhs': rhs[i, j], 'violation': gap[i, j]}))
+
+        # check objective function
+        check('obj', 'c_total', self.dict_sol['c_total'], self.dict_sol['obj_val'], '==')
         # check number of regions covered
-        n_reg = network[network['name']=='cover']['value'].sum()
-        if np.abs(n_reg - self.instance.n_reg) > 0.1:
-            return False
-        
+        cover = ev['cover']
+        check('cover', 'n_reg', cover.sum(), instance.n_reg, '==')
+        # check regions generation limits
+        check('gen', nodes(instance.regions), ev['outflow'][0],
+              np.asarray(arrays['gen'], dtype=float)*cover[:, None], '<=')
         # check the capacity at collection centers
-        flow_c = flows[flows['destination'].isin(self.instance.collectors)]
-        flow_c= flow_c.groupby(['destination', 'period'], as_index=False)['value'].sum()
-        condition_mask = flow_c.apply(check_condition, 
-                                      args = (self.instance.capC, ('destination')), axis=1)
-        if not condition_mask.all():
-            return False
-        
-        # check regions geneartion limits
-        flow_r = flows[flows['origin'].isin(self.instance.regions)]
-        flow_r = flow_r.groupby(['origin', 'period'], as_index=False)['value'].sum()
-        condition_mask = flow_r.apply(check_condition, 
-                                      args = (self.instance.gen, ('origin', 'period')), axis=1)
-        if not condition_mask.all():
-            return False
-
+        collectors = nodes(instance.collectors)
+        check('capC', collectors, ev['inflow'][1], capC[:, None]*ev['activ'], '<=')
         # check stock capacity
-        network_s = network[network['name']=='stock']
-        network_s.reset_index(inplace=True)
-        condition_mask = network_s.apply(check_condition, 
-                                      args = (self.instance.capS, ('facility')), axis=1)
-        if not condition_mask.all():
-            return False
-        
+        stock = ev['stock']
+        check('capS', collectors, stock, capS[:, None], '<=')
         # check the capacity at transformers
-        flow_m = flows[flows['destination'].isin(self.instance.manufs)]
-        flow_m= flow_m.groupby(['destination', 'period'], as_index=False)['value'].sum()
-        condition_mask = flow_m.apply(check_condition, 
-                                      args = (self.instance.capM, ('destination')), axis=1)
-        if not condition_mask.all():
-            return False
-        
-        # check the inventory
-        flow_c_out = flows[flows['origin'].isin(self.instance.collectors)]
-        flow_c_out= flow_c_out.groupby(['origin', 'period'], as_index=False)['value'].sum()
-        
-        a = 1
-        for c in self.instance.collectors:
-            for t in self.instance.time:
-                stockLHS = list(network_s.loc[(network_s['facility'] == c) & (network_s['period'] == t), 'value'])[0]
-                if t == 1:
-                    stockRHS = list([self.instance.iniS[c]])[0]
-                else:
-                    stockRHS = list(network_s.loc[(network_s['facility'] == c) & (network_s['period'] == t-1), 'value'])[0]
-                stockRHS += list(flow_c.loc[(flow_c['destination'] == c) & (flow_c['period'] == t), 'value'])[0]
-                stockRHS -= list(flow_c_out.loc[(flow_c_out['origin'] == c) & (flow_c_out['period'] == t), 'value'])[0]
-                if np.abs(stockLHS - stockRHS) > 0.1:
-                    return False
-  
-        
-        return True
-        
+        check('capM', nodes(instance.manufs), ev['inflow'][2], capM[:, None], '<=')
+        # check the inventory: stock[c,t] = stock[c,t-1] (iniS for t=1) + inflow - outflow
+        prev = np.column_stack([iniS, stock[:, :-1]])
+        check('stock', collectors, stock, prev + ev['inflow'][1] - ev['outflow'][1], '==')
+        # check the flow balance at transformers
+        check('manuf_balanc', nodes(instance.manufs), ev['inflow'][2], ev['outflow'][2], '==')
+        # check the demand of the producers
+        check('demP', nodes(instance.producers), ev['inflow'][3], np.asarray(arrays['demP'], dtype=float), '>=')
+        # check the trips on the arcs leaving collectors and transformers
+        sel = np.flatnonzero(np.isin(np.asarray(arrays['arc_orig_kind']), [1, 2]))
+        check('trips', lambda i: arcs(sel[i]), ev['trips'][sel], ev['flow'][sel]/instance.capV, '>=')
+
+        violations = pd.concat(violations, ignore_index=True)
+        if report:
+            return violations
+        return violations.empty
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Benders decomposition for long horizons.
+
+The master problem holds the collector activation (activ, activ_f), the
+region coverage (cover) and the stock of the collectors, with one variable
+theta[t] per period for the cost of the flows. Given those decisions the
+flows, trips (relaxed) and coverage ratios of different periods are
+independent, so the subproblems are one LP per period, solved in parallel.
+Every iteration adds one optimality cut per period to the master. The
+subproblems have penalized slacks on their equality and demand rows, so they
+are always feasible and no feasibility cuts are needed.
+
+Once the bounds meet, the full model is solved with the activation and
+coverage decisions of the best master solution fixed (integer trips), and
+the result is returned as a standard Solution.
+"""
+import time as tm
+from concurrent.futures import ThreadPoolExecutor
+import gurobipy as gp
+import numpy as np
+import scipy.sparse as sp
+from backends import build_matrices
+from optimize import create_model_matrix, solve_model, get_results
+
+# variable families of the master problem
+MASTER = ('activ', 'activ_f', 'cover', 'stock')
+
+
+def split_model(matrices, T):
+    """
+    Split the columns and rows of the model between the master and the periods.
+
+    Args:
+        matrices (dict): The model in matrix form (see build_matrices).
+        T (int): Number of periods.
+
+    Returns:
+        tuple: The master column mask, the period of each column (-1 for
+            master columns) and the period of each row (-1 for the rows with
+            master columns only).
+    """
+    n_cols = len(matrices['c'])
+    master = np.zeros(n_cols, dtype=bool)
+    period = np.full(n_cols, -1)
+    for name, keys, start, stop in matrices['vars']:
+        if name in MASTER:
+            master[start:stop] = True
+        elif name in ('flow', 'trip'):
+            period[start:stop] = np.arange(stop - start) % T
+        else:
+            period[start:stop] = np.arange(stop - start)
+
+    # a row belongs to the period of its first subproblem column
+    A_sub = matrices['A'][:, ~master].tocsr()
+    row_period = np.full(A_sub.shape[0], -1)
+    has = np.diff(A_sub.indptr) > 0
+    row_period[has] = period[~master][A_sub.indices[A_sub.indptr[:-1][has]]]
+    return master, period, row_period
+
+class Subproblem:
+    """
+    The LP of the flows of one period, with the master decisions in the
+    right-hand side.
+
+    Args:
+        matrices (dict): The model in matrix form.
+        master (ndarray): Master column mask.
+        cols (ndarray): Columns of the period.
+        rows (ndarray): Rows of the period.
+        penalty (float): Cost of a unit of slack.
+    """
+    def __init__(self, matrices, master, cols, rows, penalty):
+        A = matrices['A'][rows]
+        self.B = A[:, master].tocsr()
+        self.b = matrices['rhs'][rows]
+        sense = matrices['sense'][rows]
+
+        # slacks of the demand (>=) and balance (=) rows
+        up = np.flatnonzero(sense != '<')
+        down = np.flatnonzero(sense == '=')
+        S = sp.hstack([sp.csr_matrix((np.ones(len(up)), (up, np.arange(len(up)))), shape=(len(rows), len(up))),
+                       sp.csr_matrix((-np.ones(len(down)), (down, np.arange(len(down)))),
+                                     shape=(len(rows), len(down)))])
+
+        self.env = gp.Env(params={'OutputFlag': 0, 'Threads': 1})
+        self.model = gp.Model('period', env=self.env)
+        n_slack = len(up) + len(down)
+        x = self.model.addMVar(len(cols) + n_slack, ub=np.concatenate([matrices['ub'][cols], np.full(n_slack, np.inf)]),
+                               obj=np.concatenate([matrices['c'][cols], np.full(n_slack, penalty)]))
+        self.constrs = self.model.addMConstr(sp.hstack([A[:, cols], S]).tocsr(), x, sense, self.b)
+
+    def solve(self, y):
+        """
+        Solve the period for the master decisions y.
+
+        Returns:
+            tuple: The cost of the period and its subgradient with respect to y.
+        """
+        self.constrs.RHS = self.b - self.B @ y
+        self.model.optimize()
+        return self.model.ObjVal, -(self.B.T @ self.constrs.Pi)
+
+    def dispose(self):
+        self.model.dispose()
+        self.env.dispose()
+
+def benders_solve(instance, max_iter=100, tol=1e-4, workers=None, time_limit=None,
+                  penalty=1e6, telemetry=None):
+    """
+    Solve an instance with Benders decomposition (alternative to solve_model
+    and get_results).
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        max_iter (int, optional): Maximum number of iterations. Defaults to 100.
+        tol (float, optional): Relative gap between the bounds of the
+            decomposition to stop. Defaults to 1e-4.
+        workers (int, optional): Threads solving the periods. Defaults to the
+            number of cores.
+        time_limit (float, optional): Time limit of the decomposition in
+            seconds (the final solve gets what is left).
+        penalty (float, optional): Cost of a unit of unmet demand or stock
+            imbalance in the subproblems. Defaults to 1e6.
+        telemetry (Telemetry, optional): Emits an 'iteration' event with the
+            bounds of every iteration (see telemetry.Telemetry).
+
+    Returns:
+        tuple: The status and the solution object. The gap of the solution
+            is measured against the lower bound of the decomposition (with
+            relaxed trips); the status is "Optimal" if it is within tol,
+            "Decomposition" if the plan is valid but the gap stays open (e.g.
+            max_iter or time_limit reached) and "non-optimal" without plan.
+    """
+    start = tm.perf_counter()
+    T = len(instance.time)
+    m = build_matrices(instance)
+    master, period, row_period = split_model(m, T)
+
+    # master problem
+    model = gp.Model('master')
+    model.Params.OutputFlag = 0
+    y = model.addMVar(int(master.sum()), ub=m['ub'][master], obj=m['c'][master],
+                      vtype=m['vtype'][master])
+    theta = model.addMVar(T, obj=np.ones(T))
+    rows = np.flatnonzero(row_period == -1)
+    model.addMConstr(m['A'][rows][:, master], y, m['sense'][rows], m['rhs'][rows])
+
+    subproblems = [Subproblem(m, master, np.flatnonzero(period == t), np.flatnonzero(row_period == t), penalty)
+                   for t in range(T)]
+    lower, upper, best = -np.inf, np.inf, None
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for it in range(max_iter):
+            if time_limit is not None:
+                model.Params.TimeLimit = max(time_limit - (tm.perf_counter() - start), 0)
+            model.optimize()
+            if model.SolCount == 0:
+                break
+            lower = max(lower, model.ObjBound)
+            y_hat = y.X
+            cuts = list(pool.map(lambda sub: sub.solve(y_hat), subproblems))
+            cost = m['c'][master] @ y_hat + sum(z for z, g in cuts)
+            if cost < upper:
+                upper, best = cost, y_hat
+            if telemetry is not None:
+                telemetry.emit('iteration', iteration=it, lower=lower, upper=upper,
+                               runtime=tm.perf_counter() - start)
+            if upper - lower <= tol*abs(upper) or \
+                    (time_limit is not None and tm.perf_counter() - start > time_limit):
+                break
+            # theta[t] >= z_t + g_t (y - y_hat)
+            for t, (z, g) in enumerate(cuts):
+                model.addConstr(theta[t] - g @ y >= z - g @ y_hat)
+
+    for sub in subproblems:
+        sub.dispose()
+    model.dispose()
+    if best is None:
+        return "non-optimal", None
+
+    # final solve with the activation and coverage fixed (stock, flows and trips free)
+    full = create_model_matrix(instance)
+    full.Params.OutputFlag = 0
+    if time_limit is not None:
+        full.Params.TimeLimit = max(time_limit - (tm.perf_counter() - start), 1)
+    variables = np.array(full.getVars(), dtype=object)
+    fixed = master & (m['vtype'] != 'C')
+    values = np.round(best[fixed[master]]).tolist()
+    full.setAttr('LB', variables[fixed].tolist(), values)
+    full.setAttr('UB', variables[fixed].tolist(), values)
+    solve_model(full)
+    status, solution = get_results(full, instance)
+    if solution is not None:
+        obj_val = solution.dict_sol['obj_val']
+        solution.dict_sol['gap'] = (obj_val - lower)/abs(obj_val) if obj_val else 0.0
+        solution.dict_sol['runTime'] = tm.perf_counter() - start
+        if solution.dict_sol['gap'] > tol:
+            status = "Decomposition"
+    full.dispose()
+    return status, solution
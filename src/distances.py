@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Distance matrices between sites and the transport costs of the arcs.
+
+The matrices are computed with array operations in blocks of rows, so the
+memory of the temporaries is bounded by the block size, and can be cached in
+a folder as .npy files named by a hash of the coordinates and the metric
+(they are memory mapped when read back). Coordinates are (x, y) for the
+euclidean metric and (latitude, longitude) in degrees for the haversine
+metric, whose distances are in km.
+"""
+import hashlib
+import os
+import numpy as np
+from classes import Instance
+
+# mean radius of the earth (km)
+EARTH_RADIUS = 6371.0088
+
+
+def euclidean_matrix(a, b):
+    """Euclidean distances between the points of a (n x 2) and b (m x 2)."""
+    return np.hypot(a[:, None, 0] - b[None, :, 0], a[:, None, 1] - b[None, :, 1])
+
+def haversine_matrix(a, b, radius=EARTH_RADIUS):
+    """Great-circle distances between the (latitude, longitude) points of a
+    and b, in the unit of radius."""
+    lat_a, lon_a = np.radians(a[:, 0])[:, None], np.radians(a[:, 1])[:, None]
+    lat_b, lon_b = np.radians(b[:, 0])[None, :], np.radians(b[:, 1])[None, :]
+    h = np.sin((lat_b - lat_a)/2)**2 + np.cos(lat_a)*np.cos(lat_b)*np.sin((lon_b - lon_a)/2)**2
+    return 2*radius*np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+def euclidean_pairs(a, b):
+    """Euclidean distances between the points of a and b row by row (n x 2 each)."""
+    return np.hypot(a[:, 0] - b[:, 0], a[:, 1] - b[:, 1])
+
+def haversine_pairs(a, b, radius=EARTH_RADIUS):
+    """Great-circle distances between the (latitude, longitude) points of a
+    and b row by row, in the unit of radius."""
+    lat_a, lon_a, lat_b, lon_b = np.radians(a[:, 0]), np.radians(a[:, 1]), np.radians(b[:, 0]), np.radians(b[:, 1])
+    h = np.sin((lat_b - lat_a)/2)**2 + np.cos(lat_a)*np.cos(lat_b)*np.sin((lon_b - lon_a)/2)**2
+    return 2*radius*np.arcsin(np.sqrt(np.minimum(h, 1.0)))
+
+METRICS = {'euclidean': euclidean_matrix, 'haversine': haversine_matrix}
+PAIRS = {'euclidean': euclidean_pairs, 'haversine': haversine_pairs}
+
+def matrix_key(a, b, metric):
+    """Hash of two coordinate sets and a metric (name of the cached file)."""
+    digest = hashlib.sha1(metric.encode())
+    for points in [a, b]:
+        digest.update(repr(points.shape).encode())
+        digest.update(np.ascontiguousarray(points, dtype=np.float64).tobytes())
+    return digest.hexdigest()
+
+def distance_blocks(a, b=None, metric='euclidean', chunk_size=4096):
+    """
+    Yield the distance matrix between a and b by blocks of rows.
+
+    Yields:
+        tuple: The first row of the block and the block (chunk_size x m).
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+    b = a if b is None else np.asarray(b, dtype=np.float64).reshape(-1, 2)
+    func = METRICS[metric]
+    for first in range(0, len(a), chunk_size):
+        yield first, func(a[first:first + chunk_size], b)
+
+def distance_matrix(a, b=None, metric='euclidean', chunk_size=4096, cache_dir=None,
+                    dtype=np.float64):
+    """
+    Pairwise distances between two sets of points.
+
+    Args:
+        a (array): Points of the rows, n x 2.
+        b (array, optional): Points of the columns, m x 2. Defaults to a.
+        metric (str, optional): 'euclidean' or 'haversine'. Defaults to
+            'euclidean'.
+        chunk_size (int, optional): Rows computed at once. Defaults to 4096.
+        cache_dir (str, optional): Folder of the cached matrices. When given,
+            the matrix is written block by block to a .npy file (so it is
+            never held twice in memory) and returned memory mapped.
+        dtype (dtype, optional): Type of the distances. Defaults to float64.
+
+    Returns:
+        ndarray: The n x m distances.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+    b = a if b is None else np.asarray(b, dtype=np.float64).reshape(-1, 2)
+    if cache_dir is None:
+        out = np.empty((len(a), len(b)), dtype=dtype)
+    else:
+        path = os.path.join(cache_dir, '%s_%s.npy' % (matrix_key(a, b, metric), np.dtype(dtype).name))
+        if os.path.exists(path):
+            return np.load(path, mmap_mode='r')
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = '%s.tmp%d.npy' % (path[:-4], os.getpid())
+        out = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(len(a), len(b)))
+
+    for first, block in distance_blocks(a, b, metric, chunk_size):
+        out[first:first + len(block)] = block
+
+    if cache_dir is None:
+        return out
+    out.flush()
+    del out
+    os.replace(tmp, path)
+    return np.load(path, mmap_mode='r')
+
+def pair_distances(a, b, i, j, metric='euclidean', chunk_size=2**16, dtype=np.float64):
+    """
+    Distances between the points a[i] and b[j] of pairs of indices, without
+    the matrix of all the pairs.
+
+    Args:
+        a (array): Points of the first ends, n x 2.
+        b (array): Points of the second ends, m x 2.
+        i (array): Position in a of each pair.
+        j (array): Position in b of each pair.
+        metric (str, optional): 'euclidean' or 'haversine'. Defaults to
+            'euclidean'.
+        chunk_size (int, optional): Pairs computed at once. Defaults to 65536.
+        dtype (dtype, optional): Type of the distances. Defaults to float64.
+
+    Returns:
+        ndarray: The distance of each pair.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 2)
+    func = PAIRS[metric]
+    out = np.empty(len(i), dtype=dtype)
+    for first in range(0, len(i), chunk_size):
+        stop = first + chunk_size
+        out[first:stop] = func(a[i[first:stop]], b[j[first:stop]])
+    return out
+
+def arc_costs(instance, coords, rate=1.0, fixed=0.0, metric='euclidean', echelons=(1, 2),
+              chunk_size=4096, cache_dir=None):
+    """
+    Transport cost of the arcs of an instance from the coordinates of its nodes.
+
+    The distances are computed at the arcs of each echelon by chunks. With a
+    cache folder they are read from one matrix per echelon (origin kind x
+    destination kind), which is only worth its size when the nodes are
+    reused across instances.
+
+    Args:
+        instance (Instance): The instance.
+        coords (dict): Node name -> coordinates, for the nodes of the arcs
+            of the echelons.
+        rate (float, optional): Cost per unit of distance. Defaults to 1.
+        fixed (float, optional): Fixed cost of an arc. Defaults to 0.
+        metric (str, optional): See distance_matrix. Defaults to 'euclidean'.
+        echelons (tuple, optional): Kinds of the origins of the arcs whose
+            cost is computed (0 regions, 1 collectors, 2 manufs), the other
+            arcs keep their cost. Defaults to (1, 2), the arcs with trips.
+        chunk_size (int, optional): Arcs computed at once, or rows of the
+            cached matrices (see distance_matrix). Defaults to 4096.
+        cache_dir (str, optional): See distance_matrix.
+
+    Returns:
+        ndarray: The cost of each arc, in the order of instance.arrays.
+    """
+    arrays = instance.arrays
+    tables = [arrays[key] for key in ['regions', 'collectors', 'manufs', 'producers']]
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    dest_kind = np.asarray(arrays['arc_dest_kind'])
+    orig = np.asarray(arrays['arc_orig'])
+    dest = np.asarray(arrays['arc_dest'])
+    cost = np.array(arrays['arc_cost'], dtype=float)
+    for kind in echelons:
+        sel = np.flatnonzero((orig_kind == kind) & (dest_kind == kind + 1))
+        if len(sel) == 0:
+            continue
+        points = [np.array([coords[n] for n in np.asarray(tables[k]).tolist()], dtype=float)
+                  for k in [kind, kind + 1]]
+        if cache_dir is None:
+            dist = pair_distances(points[0], points[1], orig[sel], dest[sel], metric, chunk_size)
+        else:
+            dist = distance_matrix(points[0], points[1], metric, chunk_size, cache_dir)[orig[sel], dest[sel]]
+        cost[sel] = fixed + rate*dist
+    return cost
+
+def with_arc_costs(instance, costs):
+    """
+    Copy of an instance with other arc costs.
+
+    Args:
+        instance (Instance): The instance.
+        costs (ndarray): The cost of each arc (see arc_costs).
+
+    Returns:
+        Instance: The instance with the new c_transp.
+    """
+    arrays = dict(instance.arrays)
+    arrays['arc_cost'] = np.asarray(costs, dtype=float)
+    new = Instance.from_arrays(arrays, {key: getattr(instance, key) for key in Instance.SCALARS}, instance.name)
+    new.bounds = instance.bounds
+    return new
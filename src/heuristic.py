@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+"""
+Fast approximate plans.
+
+The heuristic takes the binary decisions greedily from the data: the n_reg
+regions with the largest generation are covered, and in each period the
+collectors with the lowest unit cost (buying, classification and activation
+spread over what they can receive) are activated until they can receive the
+demand, plus the cheapest collector of every covered region left without
+one. The activations are extended to the dt commitment windows. With those
+decisions fixed the flows are routed greedily (see route): the covered
+regions send a common share of their generation, and the demand of each
+period goes to the producers along the cheapest manufacturer and collector
+arcs. The trips are rounded up to carry the flows with vehicles of capacity
+capV. If the routing fails (e.g. sparse arcs) the flows are the LP of the
+model with the decisions fixed (see repair).
+
+The routing takes a pass over the arcs per period, so plans of instances
+with thousands of arcs take well under a second. Its gap is measured
+against cost_bound, a lower bound computed from the cheapest path of each
+unit of demand; heuristic_solve(bound=True) measures it against the LP
+relaxation instead, a tighter bound as expensive as a full LP.
+
+The plan is returned as a standard Solution, so solution_checker applies and
+it can be used as a MIP start: solve_model(model, start=solution).
+"""
+import time as tm
+import numpy as np
+import scipy.sparse as sp
+from backends import build_matrices, index_arcs, HighsModel, OPTIMAL
+from optimize import build_solution
+from kpis import evaluate, summary
+
+
+def solve_lp(matrices, lb, ub, time_limit=None):
+    """
+    Solve the LP of the matrices with the given bounds (all variables continuous).
+
+    Returns:
+        HighsModel: The solved model, None if it has no optimal solution.
+    """
+    model = HighsModel({**matrices, 'lb': lb, 'ub': ub,
+                        'vtype': np.full(len(matrices['c']), 'C')})
+    model.Params.OutputFlag = 0
+    if time_limit is not None:
+        model.Params.TimeLimit = time_limit
+    model.optimize()
+    return model if model.Status == OPTIMAL else None
+
+def commitments(activ, instance):
+    """
+    Extend the activations of the collectors to the commitment windows.
+
+    A collector starts an agreement (activ_f) when it is active and was not
+    active in the previous period, and then stays active dt periods (the
+    window of the relat1 constraints).
+
+    Args:
+        activ (ndarray): Boolean activations, collectors x periods.
+        instance (Instance): The instance (time, dt and iniA).
+
+    Returns:
+        tuple: The extended activations and the agreement starts.
+    """
+    time = instance.time
+    t_pos = {t: i for i, t in enumerate(time)}
+    activ = activ.copy()
+    activ_f = np.zeros_like(activ)
+    prev = np.array([instance.iniA[c] > 0.5 for c in instance.collectors], dtype=bool)
+    for i, t1 in enumerate(time):
+        start = activ[:, i] & ~prev
+        activ_f[start, i] = True
+        for t in range(t1, min(t1 + instance.dt, len(time))):
+            activ[start, t_pos[t]] = True
+        prev = activ[:, i]
+    return activ, activ_f
+
+def cost_bound(instance):
+    """
+    Lower bound of the cost of any plan of an instance.
+
+    Every unit of demand is cleaned at a manufacturer and carried by vehicles
+    of capacity capV on an arc collector->manufacturer and an arc
+    manufacturer->producer, so it costs at least the cheapest such path to
+    its producer. The demand that the initial stock cannot serve is also
+    bought and classified at a collector, at least at the cheapest one.
+
+    Args:
+        instance (Instance): The instance.
+
+    Returns:
+        float: The bound (inf if some demand cannot reach its producer).
+    """
+    arrays = instance.arrays
+    idx = index_arcs(instance)
+    cost = np.asarray(arrays['arc_cost'], dtype=float)
+    collectors = np.asarray(arrays['collectors_data'], dtype=float)
+    c_clean = np.asarray(arrays['manufs_data'], dtype=float)[:, 0]
+    demand = np.asarray(arrays['demP'], dtype=float).sum(axis=1)
+
+    # cheapest arc into each manufacturer, then cheapest path to each producer
+    inbound = np.full(len(c_clean), np.inf)
+    np.minimum.at(inbound, idx['dest'][idx['e2']], cost[idx['e2']])
+    e3 = idx['e3']
+    path = np.full(len(demand), np.inf)
+    np.minimum.at(path, idx['dest'][e3],
+                  c_clean[idx['orig'][e3]] + (inbound[idx['orig'][e3]] + cost[e3])/instance.capV)
+    served = demand > 0
+    bound = float(demand[served] @ path[served]) if served.any() else 0.0
+
+    bought = max(0.0, demand.sum() - collectors[:, 6].sum())
+    if bought > 0:
+        receiving = np.unique(idx['dest'][idx['e1']])
+        unit = (collectors[receiving, 0] + collectors[receiving, 1]).min() if len(receiving) else np.inf
+        bound += bought*unit
+    return bound
+
+def greedy(instance):
+    """
+    Greedy cover and activation decisions of an instance.
+
+    The n_reg regions linked to a collector with the largest generation are
+    covered. In each period the collectors are activated by increasing unit
+    cost until they can receive the demand of the period, and every covered
+    region without an active collector gets its cheapest one.
+
+    Args:
+        instance (Instance): The instance.
+
+    Returns:
+        tuple: The 0/1 cover of each region and the boolean activations,
+            collectors x periods.
+    """
+    arrays = instance.arrays
+    idx = index_arcs(instance)
+    e1 = idx['e1']
+    gen = np.asarray(arrays['gen'], dtype=float)
+    collectors = np.asarray(arrays['collectors_data'], dtype=float)
+    demand = np.asarray(arrays['demP'], dtype=float).sum(axis=0)
+    R, T = gen.shape
+    C = len(collectors)
+
+    linked = np.zeros(R, dtype=bool)
+    linked[idx['orig'][e1]] = True
+    cover = np.zeros(R)
+    cover[np.lexsort((-gen.sum(axis=1), ~linked))[:instance.n_reg]] = 1
+
+    # what each collector can receive in each period from the covered regions
+    adjacency = sp.csr_matrix((np.ones(len(e1)), (idx['orig'][e1], idx['dest'][e1])), shape=(R, C))
+    intake = np.minimum(adjacency.T @ (gen*cover[:, None]), collectors[:, [4]])
+    ships = np.zeros(C, dtype=bool)
+    ships[idx['orig'][idx['e2']]] = True
+    total = intake.sum(axis=1)
+    unit = np.full(C, np.inf)
+    usable = ships & (total > 0)
+    unit[usable] = collectors[usable, 0] + collectors[usable, 1] + collectors[usable, 2]*T/total[usable]
+
+    # cheapest collectors until the demand of each period can be received
+    order = np.argsort(unit, kind='stable')
+    order = order[np.isfinite(unit[order])]
+    received = np.cumsum(intake[order], axis=0)
+    n_active = np.minimum((received < demand).sum(axis=0) + 1, len(order))
+    activ = np.zeros((C, T), dtype=bool)
+    activ[order, :] = np.arange(len(order))[:, None] < n_active
+
+    # covered regions without an active collector get their cheapest one
+    arcs = e1[np.lexsort((unit[idx['dest'][e1]], idx['orig'][e1]))]
+    regions, first = np.unique(idx['orig'][arcs], return_index=True)
+    cheapest = np.full(R, -1)
+    cheapest[regions] = idx['dest'][arcs[first]]
+    reached = (adjacency @ activ) > 0
+    r, t = np.nonzero((cover[:, None] > 0) & ~reached & (cheapest[:, None] >= 0))
+    activ[cheapest[r], t] = True
+    return cover, activ
+
+def repair(instance, matrices, cover, activ, time_limit=None):
+    """
+    Complete fixed cover and activation decisions to a plan.
+
+    The activations are extended to the commitment windows, the flows and
+    stock are the LP with those decisions fixed and the trips are rounded up
+    to carry the flows. If the LP is infeasible every collector is activated.
+
+    Args:
+        instance (Instance): The instance.
+        matrices (dict): The model of the instance in matrix form.
+        cover (ndarray): 0/1 cover of each region.
+        activ (ndarray): Boolean activations, collectors x periods.
+        time_limit (float, optional): Time limit of the LP in seconds.
+
+    Returns:
+        ndarray: The values of the variables, None if no plan was found.
+    """
+    m = matrices
+    cols = {name: np.arange(first, stop) for name, keys, first, stop in m['vars']}
+    C, T = len(instance.collectors), len(instance.time)
+    idx = index_arcs(instance)
+    e1 = idx['e1']
+    cover = np.ravel(cover)
+    fixed = None
+    for activ in [activ, np.ones((C, T), dtype=bool)]:
+        activ, activ_f = commitments(activ, instance)
+        lb, ub = m['lb'].copy(), m['ub'].copy()
+        for name, values in [('cover', cover), ('activ', activ), ('activ_f', activ_f)]:
+            lb[cols[name]] = ub[cols[name]] = np.ravel(values)
+        # restrict the flows to the arcs from covered regions to active collectors
+        closed = (cover[idx['orig'][e1]][:, None] == 0) | ~activ[idx['dest'][e1]]
+        ub[cols['flow'].reshape(-1, T)[e1][closed]] = 0
+        fixed = solve_lp(m, lb, ub, time_limit)
+        if fixed is not None:
+            break
+    if fixed is None:
+        return None
+
+    # round up the trips of the arcs with a trips constraint
+    x = fixed.X.copy()
+    x[cols['flow']] = np.maximum(x[cols['flow']], 0)
+    arcs = np.concatenate([idx['e2'], idx['e3']])
+    flow = cols['flow'].reshape(-1, T)[arcs]
+    x[cols['trip']] = 0
+    x[cols['trip'].reshape(-1, T)[arcs]] = np.ceil(x[flow]/instance.capV - 1e-6)
+    for name in ['cover', 'activ', 'activ_f']:
+        x[cols[name]] = np.round(x[cols[name]])
+
+    # collectors that receive nothing are not activated (their stock can still ship)
+    inflow = np.zeros(C)
+    np.add.at(inflow, idx['dest'][e1], x[cols['flow'].reshape(-1, T)[e1]].sum(axis=1))
+    idle = inflow <= 1e-9
+    x[cols['activ'].reshape(C, T)[idle]] = 0
+    x[cols['activ_f'].reshape(C, T)[idle]] = 0
+    return x
+
+def assign(orig, dest, supply, demand):
+    """
+    Greedy transportation along arcs taken in order: each arc carries what its
+    origin can still supply and its destination still needs.
+
+    Returns:
+        tuple: The amount of each arc and the demand left unmet.
+    """
+    supply, demand = supply.tolist(), demand.tolist()
+    amount = [0.0]*len(orig)
+    for k, (i, j) in enumerate(zip(orig.tolist(), dest.tolist())):
+        q = min(supply[i], demand[j])
+        if q > 0:
+            amount[k] = q
+            supply[i] -= q
+            demand[j] -= q
+    return np.array(amount), np.array(demand)
+
+def route(instance, cover, activ, tol=1e-6):
+    """
+    Flows of fixed cover and activation decisions, without an LP.
+
+    Every covered region sends the same share of its generation in a period
+    (so the coverage is balanced), split among its active collectors by
+    capC. The shares collect the demand as late as the capacities allow.
+    Each period the demand is assigned to the manufacturers and then to the
+    collectors along the cheapest arcs, shipping first what a collector
+    could not keep in stock.
+
+    Args:
+        instance (Instance): The instance.
+        cover (ndarray): 0/1 cover of each region.
+        activ (ndarray): Boolean activations, collectors x periods.
+        tol (float, optional): Tolerance of the balances. Defaults to 1e-6.
+
+    Returns:
+        dict: Variable family -> array of values, None if the greedy
+            routing fails.
+    """
+    arrays = instance.arrays
+    idx = index_arcs(instance)
+    e1, e2, e3 = idx['e1'], idx['e2'], idx['e3']
+    orig, dest = idx['orig'], idx['dest']
+    cost = np.asarray(arrays['arc_cost'], dtype=float)
+    collectors = np.asarray(arrays['collectors_data'], dtype=float)
+    capC, capS, iniS = collectors[:, 4], collectors[:, 5], collectors[:, 6]
+    c_clean, capM = np.asarray(arrays['manufs_data'], dtype=float).T
+    gen = np.asarray(arrays['gen'], dtype=float)
+    demP = np.asarray(arrays['demP'], dtype=float)
+    cover = np.ravel(cover)
+    activ, activ_f = commitments(activ, instance)
+    R, T = gen.shape
+    C, A = len(capC), len(cost)
+
+    # share of the flow of each region arc: by capC among the active collectors
+    weight = capC[dest[e1], None]*activ[dest[e1]]*cover[orig[e1], None]
+    total = np.zeros((R, T))
+    np.add.at(total, orig[e1], weight)
+    share = np.divide(weight, total[orig[e1]], out=np.zeros_like(weight), where=total[orig[e1]] > 0)
+    load = np.zeros((C, T))
+    np.add.at(load, dest[e1], gen[orig[e1]]*share)
+    # largest share of each period: capC, and alpha if a covered region cannot send
+    limit = np.min(np.divide(capC[:, None], load, out=np.full((C, T), np.inf), where=load > 0), axis=0)
+    stranded = ((cover[:, None] > 0) & (gen > 0) & (total == 0)).any(axis=0)
+    limit = np.minimum(limit, np.where(stranded, instance.alpha, 1.0))
+    capacity = limit*load.sum(axis=0)
+
+    # intake of each period: the initial stock serves the first periods, the
+    # rest is collected as late as the capacities allow
+    demand = demP.sum(axis=0)
+    need = np.maximum(demand - np.maximum(iniS.sum() - np.concatenate([[0], np.cumsum(demand)[:-1]]), 0), 0)
+    intake = np.zeros(T)
+    deficit = 0.0
+    for t in range(T - 1, -1, -1):
+        intake[t] = min(capacity[t], need[t] + deficit)
+        deficit = need[t] + deficit - intake[t]
+    if deficit > tol:
+        return None
+    fraction = np.divide(intake, load.sum(axis=0), out=np.zeros(T), where=load.sum(axis=0) > 0)
+
+    # cheapest arcs first: cleaning and transport to each producer, transport from collectors
+    inbound = np.full(len(capM), np.inf)
+    np.minimum.at(inbound, dest[e2], cost[e2])
+    e3 = e3[np.argsort(c_clean[orig[e3]] + (cost[e3] + inbound[orig[e3]])/instance.capV, kind='stable')]
+    e2 = e2[np.argsort(cost[e2], kind='stable')]
+
+    flow = np.zeros((A, T))
+    flow[e1] = gen[orig[e1]]*share*fraction
+    stock = np.zeros((C, T))
+    level = iniS
+    for t in range(T):
+        amount, unmet = assign(orig[e3], dest[e3], capM, demP[:, t])
+        if unmet.max(initial=0) > tol:
+            return None
+        flow[e3, t] = amount
+        needed = np.bincount(orig[e3], weights=amount, minlength=len(capM))
+        available = level + load[:, t]*fraction[t]
+        # what a collector cannot keep in stock is shipped first
+        forced = np.maximum(available - capS, 0)
+        first, needed = assign(orig[e2], dest[e2], forced, needed)
+        then, unmet = assign(orig[e2], dest[e2], available - np.bincount(orig[e2], weights=first, minlength=C), needed)
+        shipped = first + then
+        level = available - np.bincount(orig[e2], weights=shipped, minlength=C)
+        if unmet.max(initial=0) > tol or np.any(level > capS + tol):
+            return None
+        flow[e2, t] = shipped
+        stock[:, t] = np.maximum(level, 0)
+
+    trip = np.zeros((A, T))
+    arcs = np.concatenate([e2, e3])
+    trip[arcs] = np.ceil(flow[arcs]/instance.capV - 1e-6)
+    # collectors that receive nothing are not activated (their stock can still ship)
+    idle = np.bincount(dest[e1], weights=flow[e1].sum(axis=1), minlength=C) <= 1e-9
+    activ, activ_f = activ.copy(), activ_f.copy()
+    activ[idle] = activ_f[idle] = False
+
+    # coverage of the regions with generation, the balance holds by construction
+    outflow = np.zeros((R, T))
+    np.add.at(outflow, orig[e1], flow[e1])
+    ratio = np.divide(outflow, gen, out=np.zeros((R, T)), where=gen > 0)
+    covered = (cover[:, None] > 0) & (gen > 0)
+    cover_max = np.where(gen > 0, ratio, 0).max(axis=0, initial=0)
+    cover_min = np.where(covered, ratio, np.inf).min(axis=0, initial=np.inf)
+    cover_min = np.where(np.isfinite(cover_min), cover_min, 0)
+
+    return {'activ': activ.ravel().astype(float), 'activ_f': activ_f.ravel().astype(float),
+            'cover': cover.astype(float), 'cover_max': cover_max, 'cover_min': cover_min,
+            'flow': flow.ravel(), 'stock': stock.ravel(), 'trip': trip.ravel()}
+
+def heuristic_solve(instance, time_limit=None, bound=False):
+    """
+    Find an approximate plan of an instance from greedy decisions and a
+    greedy routing of the flows (a restricted LP if the routing fails).
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        time_limit (float, optional): Time limit of each LP in seconds.
+        bound (bool, optional): Measure the gap against the LP relaxation of
+            the model (one more LP of the size of the model) instead of
+            cost_bound. Defaults to False.
+
+    Returns:
+        tuple: "Heuristic" and the solution object, or "non-optimal" and None
+            if no plan was found.
+    """
+    start = tm.perf_counter()
+    cover, activ = greedy(instance)
+    X = route(instance, cover, activ)
+    m = None
+    if X is None:
+        m = build_matrices(instance)
+        x = repair(instance, m, cover, activ, time_limit)
+        if x is None:
+            return "non-optimal", None
+        X = {name: x[first:stop] for name, keys, first, stop in m['vars']}
+
+    lower = cost_bound(instance)
+    if bound:
+        m = build_matrices(instance) if m is None else m
+        relaxed = solve_lp(m, m['lb'], m['ub'], time_limit)
+        if relaxed is not None:
+            lower = relaxed.ObjVal
+    obj_val = summary(instance, evaluate(instance, X))['c_total']
+    gap = max(0.0, (obj_val - lower)/abs(obj_val)) if obj_val else 0.0
+    return "Heuristic", build_solution(instance, X, obj_val, tm.perf_counter() - start, gap)
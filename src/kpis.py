@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Cost and KPI engine of the solutions.
+
+The values of the variables are reshaped to arrays (arcs x periods and nodes
+x periods) and aggregated by node with sparse incidence matrices, so every
+cost component, quantity and utilization is computed in one pass without
+grouping data frames.
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+
+def evaluate(instance, X):
+    """
+    Aggregate the values of a solution by arc, node and period.
+
+    Args:
+        instance (Instance): The instance the values belong to.
+        X (dict): Variable family -> array of values, in the order of the
+            variables of create_model.
+
+    Returns:
+        dict: Arrays of the flows, trips, trips needed by the flows and
+            transport cost of the trips of each arc (arcs x periods), the inflow and outflow of each kind of node
+            (nodes x periods) and the network variables.
+    """
+    arrays = instance.arrays
+    T = len(instance.time)
+    sizes = [len(instance.regions), len(instance.collectors), len(instance.manufs), len(instance.producers)]
+    A = len(arrays['arc_cost'])
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    dest_kind = np.asarray(arrays['arc_dest_kind'])
+    orig = np.asarray(arrays['arc_orig'], dtype=np.int64)
+    dest = np.asarray(arrays['arc_dest'], dtype=np.int64)
+
+    flow = np.asarray(X['flow'], dtype=float).reshape(A, T)
+    trips = np.asarray(X['trip'], dtype=float).reshape(A, T)
+    # vehicles needed to carry the flow of each arc
+    needed = np.maximum(np.ceil((flow - 0.001)/instance.capV), 0)
+    # the trips of the arcs leaving collectors and manufs are priced (as in the objective)
+    priced = ((orig_kind == 1) & (dest_kind == 2)) | ((orig_kind == 2) & (dest_kind == 3))
+
+    def incidence(kind, pos, k):
+        # node x arc matrix with a one for the arcs of the nodes of kind k
+        sel = np.flatnonzero(kind == k)
+        return sp.csr_matrix((np.ones(len(sel)), (pos[sel], sel)), shape=(sizes[k], A))
+
+    ev = {
+        'flow': flow,
+        'trips': trips,
+        'trips_needed': needed,
+        'c_transp': np.where(priced, np.asarray(arrays['arc_cost'], dtype=float), 0)[:, None]*trips,
+        'inflow': [incidence(dest_kind, dest, k) @ flow for k in range(4)],
+        'outflow': [incidence(orig_kind, orig, k) @ flow for k in range(4)],
+        'cover': np.asarray(X['cover'], dtype=float),
+        }
+    for name in ['activ', 'activ_f', 'stock']:
+        ev[name] = np.asarray(X[name], dtype=float).reshape(sizes[1], T)
+    return ev
+
+def ratio(num, den):
+    # num/den, nan where den is 0
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=float), np.asarray(den, dtype=float))
+    return np.divide(num, den, out=np.full(num.shape, np.nan), where=den != 0)
+
+def summary(instance, ev):
+    """
+    Cost components and totals of a solution (the entries of dict_sol).
+
+    Args:
+        instance (Instance): The instance of the solution.
+        ev (dict): The arrays returned by evaluate.
+
+    Returns:
+        dict: Transport cost (total and by echelon), quantities and costs of
+            buying, classifying, cleaning, activating and holding, the total
+            cost, the number of trips, the average utilization of capC, capS
+            and capM and the coverage of each region.
+    """
+    arrays = instance.arrays
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    c_buy, c_clasif, c_activ, c_hold, capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float).T
+    c_clean, capM = np.asarray(arrays['manufs_data'], dtype=float).T
+    T = len(instance.time)
+
+    q_buy = ev['inflow'][1].sum(axis=1)
+    q_clean = ev['inflow'][2].sum(axis=1)
+    q_activ = ev['activ'].sum(axis=1)
+    q_hold = ev['stock'].sum(axis=1)
+    c_transp = ev['c_transp'].sum(axis=1)
+    costs = {
+        'c_transp': c_transp.sum(),
+        'c_buy': c_buy @ q_buy,
+        'c_clasif': c_clasif @ q_buy,
+        'c_clean': c_clean @ q_clean,
+        'c_activ': c_activ @ q_activ,
+        'c_hold': c_hold @ q_hold}
+
+    return {
+        'c_transp': costs['c_transp'],
+        'c_transp_e2': c_transp[orig_kind == 1].sum(),
+        'c_transp_e3': c_transp[orig_kind == 2].sum(),
+        'c_total': sum(costs.values()),
+        'q_buy': dict(zip(instance.collectors, q_buy.tolist())),
+        'c_buy': costs['c_buy'],
+        'c_clasif': costs['c_clasif'],
+        'q_clean': dict(zip(instance.manufs, q_clean.tolist())),
+        'c_clean': costs['c_clean'],
+        'q_activ': dict(zip(instance.collectors, q_activ.tolist())),
+        'c_activ': costs['c_activ'],
+        'q_hold': dict(zip(instance.collectors, q_hold.tolist())),
+        'c_hold': costs['c_hold'],
+        'n_trips': ev['trips'][(orig_kind == 1) | (orig_kind == 2)].sum(),
+        'util_capC': float(ratio(q_buy.sum(), (capC[:, None]*ev['activ']).sum())),
+        'util_capS': float(ratio(q_hold.sum(), capS.sum()*T)),
+        'util_capM': float(ratio(q_clean.sum(), capM.sum()*T)),
+        'coverage': dict(zip(instance.regions, ratio(ev['outflow'][0].sum(axis=1),
+                                                     np.asarray(arrays['gen']).sum(axis=1)).tolist()))}
+
+def tables(instance, ev):
+    """
+    KPIs of a solution by node, arc and echelon and period.
+
+    Args:
+        instance (Instance): The instance of the solution.
+        ev (dict): The arrays returned by evaluate.
+
+    Returns:
+        dict: DataFrames 'regions' (generation, outflow and coverage),
+            'collectors' (activation, flows, stock, utilization of capC and
+            capS and costs), 'manufs' (flows, utilization of capM and
+            cleaning cost), 'producers' (inflow and demand), 'arcs' (flow,
+            trips and transport cost of the arcs with flow or trips) and
+            'echelons' (flow, trips and transport cost).
+    """
+    arrays = instance.arrays
+    time = np.array(instance.time)
+    T = len(time)
+    c_buy, c_clasif, c_activ, c_hold, capC, capS, iniS = np.asarray(arrays['collectors_data'], dtype=float).T
+    c_clean, capM = np.asarray(arrays['manufs_data'], dtype=float).T
+    gen = np.asarray(arrays['gen'], dtype=float)
+
+    def frame(key, nodes, columns):
+        # one row per node and period
+        return pd.DataFrame({key: np.repeat(np.asarray(nodes, dtype=object), T),
+                             'period': np.tile(time, len(nodes)),
+                             **{name: np.ravel(np.broadcast_to(values, (len(nodes), T)))
+                                for name, values in columns.items()}})
+
+    inflow_c, inflow_m = ev['inflow'][1], ev['inflow'][2]
+    orig_kind = np.asarray(arrays['arc_orig_kind'])
+    dest_kind = np.asarray(arrays['arc_dest_kind'])
+    echelon = np.select([(orig_kind == 0) & (dest_kind == 1), (orig_kind == 1) & (dest_kind == 2),
+                         (orig_kind == 2) & (dest_kind == 3)], [1, 2, 3], 0)
+    used = np.flatnonzero((ev['flow'] != 0) | (ev['trips'] != 0))
+    arc, t = np.divmod(used, T)
+
+    return {
+        'regions': frame('region', instance.regions, {
+            'cover': ev['cover'][:, None], 'gen': gen, 'outflow': ev['outflow'][0],
+            'coverage': ratio(ev['outflow'][0], gen)}),
+        'collectors': frame('collector', instance.collectors, {
+            'activ': ev['activ'], 'activ_f': ev['activ_f'], 'inflow': inflow_c,
+            'outflow': ev['outflow'][1], 'stock': ev['stock'],
+            'util_capC': ratio(inflow_c, capC[:, None]), 'util_capS': ratio(ev['stock'], capS[:, None]),
+            'c_buy': c_buy[:, None]*inflow_c, 'c_clasif': c_clasif[:, None]*inflow_c,
+            'c_activ': c_activ[:, None]*ev['activ'], 'c_hold': c_hold[:, None]*ev['stock']}),
+        'manufs': frame('manuf', instance.manufs, {
+            'inflow': inflow_m, 'outflow': ev['outflow'][2], 'util_capM': ratio(inflow_m, capM[:, None]),
+            'c_clean': c_clean[:, None]*inflow_m}),
+        'producers': frame('producer', instance.producers, {
+            'inflow': ev['inflow'][3], 'demand': np.asarray(arrays['demP'], dtype=float)}),
+        'arcs': pd.DataFrame({
+            'origin': instance.node_names(arrays['arc_orig_kind'], arrays['arc_orig'])[arc],
+            'destination': instance.node_names(arrays['arc_dest_kind'], arrays['arc_dest'])[arc],
+            'period': time[t],
+            'echelon': echelon[arc],
+            'flow': ev['flow'].ravel()[used],
+            'trips': ev['trips'].ravel()[used],
+            'trips_needed': ev['trips_needed'].ravel()[used],
+            'c_transp': ev['c_transp'].ravel()[used]}),
+        'echelons': pd.DataFrame({
+            'echelon': np.repeat([1, 2, 3], T),
+            'period': np.tile(time, 3),
+            **{name: np.concatenate([ev[key][echelon == e].sum(axis=0) for e in [1, 2, 3]])
+               for name, key in [('flow', 'flow'), ('trips', 'trips'), ('c_transp', 'c_transp')]}}),
+        }
@@ -1,7 +1,6 @@
 # 1. import the libraries
 from optimize import create_model, solve_model, get_results
 from classes import Instance, Solution
-from utilities import instance_generator
 import random 
 random.seed(42)
 
@@ -130,9 +129,9 @@ if __name__ == '__main__':
     # # 4. Check solution
     validation = solution.solution_checker()
 
-    instance1 = instance_generator(4, 4, 4, 4, 4, (1000, 2000), 0.2, 0.3, 0.2, 0.3,\
-                                  100, 0.05, 1)
-    print(instance1)
+    instance1 = Instance.instance_generator(4, 4, 4, 4, 4, (1000, 2000), 0.2, 0.3, 0.2, 0.3,\
+                                  100, 0.05, 1, 0.1, 0.05, 0.1, 0.01, 0.01, 3, 0.1, 3, seed=42)
+    print(instance1.name, len(instance1.arcs))
 
 # # add arc column to df_flows
 # df_flows = solution.df_flows
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent solves of the same model with different solver configurations.
+
+Every configuration (Gurobi parameters such as Seed or MIPFocus) builds and
+solves the model in its own process. The processes share the best incumbent
+and the best bound, so all of them stop as soon as one proves optimality or
+the shared gap closes, and they share the time budget.
+"""
+import multiprocessing as mp
+import time as tm
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from gurobipy import GRB
+from classes import Instance
+from optimize import create_model, solve_model, variable_values, build_solution
+
+# default configurations: different search strategies and random seeds
+CONFIGS = [{}, {'MIPFocus': 1}, {'MIPFocus': 2}, {'MIPFocus': 3},
+           {'Seed': 1}, {'Seed': 2}, {'Heuristics': 0.5}, {'Cuts': 2}]
+
+# incumbent, bound and stop event shared by the workers (set by init_worker)
+shared = None
+
+
+def init_worker(incumbent, bound, stop):
+    global shared
+    shared = (incumbent, bound, stop)
+
+def solve_config(data, name, builder, params, deadline, mip_gap, threads):
+    """
+    Build and solve the model with one configuration (run in a worker).
+
+    Returns:
+        dict: The status, objective, bound and runtime of the solve and the
+            values of the variables (None without a solution).
+    """
+    incumbent, bound, stop = shared
+    row = {'params': params, 'status': None, 'obj_val': np.nan, 'bound': np.nan, 'runtime': 0.0, 'X': None}
+    if stop.is_set() or (deadline is not None and tm.time() >= deadline):
+        return row
+
+    model = builder(Instance(data, name=name))
+    model.Params.OutputFlag = 0
+    model.Params.Threads = threads
+    model.Params.MIPGap = mip_gap
+    if deadline is not None:
+        model.Params.TimeLimit = max(deadline - tm.time(), 0)
+    for key, value in params.items():
+        model.setParam(key, value)
+
+    def callback(model, where):
+        if where == GRB.Callback.MIPSOL:
+            obj = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            with incumbent.get_lock():
+                incumbent.value = min(incumbent.value, obj)
+        elif where == GRB.Callback.MIP:
+            obj_bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            with bound.get_lock():
+                bound.value = max(bound.value, obj_bound)
+            if stop.is_set() or (incumbent.value < np.inf and
+                                 incumbent.value - bound.value <= mip_gap*abs(incumbent.value)):
+                model.terminate()
+
+    solve_model(model, callback)
+    if model.Status == GRB.OPTIMAL:
+        stop.set()
+    row.update({'status': model.Status, 'bound': model.ObjBound, 'runtime': model.Runtime})
+    if model.SolCount:
+        row.update({'obj_val': model.ObjVal, 'X': variable_values(model)})
+    model.dispose()
+    return row
+
+def solve_concurrent(instance, configs=None, builder=create_model, time_limit=None, mip_gap=1e-4,
+                     workers=None, threads=1):
+    """
+    Solve an instance with several solver configurations in parallel and keep
+    the best solution.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        configs (list, optional): Dictionaries of Gurobi parameters, one solve
+            each. Defaults to CONFIGS.
+        builder (function, optional): Model builder. Defaults to create_model.
+        time_limit (float, optional): Time budget shared by all the solves in
+            seconds.
+        mip_gap (float, optional): Relative gap between the best incumbent and
+            the best bound of all the solves to stop. Defaults to 1e-4.
+        workers (int, optional): Number of processes. Defaults to the number
+            of configurations.
+        threads (int, optional): Gurobi threads per solve. Defaults to 1.
+
+    Returns:
+        tuple: The status ("Optimal" if the gap is closed, "Feasible" if not,
+            "non-optimal" without solution), the best solution (dict_sol
+            holds the winning configuration) and a DataFrame with the result
+            of every configuration.
+    """
+    configs = CONFIGS if configs is None else configs
+    start = tm.perf_counter()
+    deadline = tm.time() + time_limit if time_limit is not None else None
+    ctx = mp.get_context('spawn')
+    incumbent, bound, stop = ctx.Value('d', np.inf), ctx.Value('d', -np.inf), ctx.Event()
+
+    with ProcessPoolExecutor(max_workers=workers or len(configs), mp_context=ctx,
+                             initializer=init_worker, initargs=(incumbent, bound, stop)) as pool:
+        futures = [pool.submit(solve_config, instance.raw_data, instance.name, builder, params,
+                               deadline, mip_gap, threads) for params in configs]
+        rows = [f.result() for f in futures]
+
+    report = pd.DataFrame([{k: v for k, v in row.items() if k != 'X'} for row in rows])
+    solved = [i for i, row in enumerate(rows) if row['X'] is not None]
+    if not solved:
+        return "non-optimal", None, report
+    best = min(solved, key=lambda i: rows[i]['obj_val'])
+    report['winner'] = report.index == best
+
+    obj_val = rows[best]['obj_val']
+    gap = (obj_val - bound.value)/abs(obj_val) if obj_val else 0.0
+    solution = build_solution(instance, rows[best]['X'], obj_val, tm.perf_counter() - start, max(gap, 0.0))
+    solution.dict_sol['config'] = configs[best]
+    status = "Optimal" if gap <= mip_gap or rows[best]['status'] == GRB.OPTIMAL else "Feasible"
+    return status, solution, report
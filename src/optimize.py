@@ -9,16 +9,22 @@ from gurobipy import GRB
 from classes import Solution
 import pandas as pd
 import numpy as np
-import re
+from backends import build_matrices
+from kpis import evaluate, summary
 
+# constraint families that can be left out of the model and enforced lazily
+LAZY = ('relat1', 'cov_max', 'cov_min')
 
 
-def create_model(instance):
+def create_model(instance, lazy=False):
     """
     Create a model based on the given instance object.
 
     Args:
         instance (Instance): The instance object containing the required data.
+        lazy (bool, optional): Leave the LAZY families (relat1, cov_max and
+            cov_min) out of the model and enforce them from the callback of
+            solve_model (see add_lazy). Defaults to False.
 
     Returns:
         Model: The created model.
@@ -37,6 +43,7 @@ def create_model(instance):
     capC = instance.capC
     capS = instance.capS
     iniS = instance.iniS 
+    iniA = instance.iniA
     c_clean = instance.c_clean
     capM = instance.capM
     arcs = instance.arcs
@@ -60,6 +67,10 @@ def create_model(instance):
     flow = model.addVars(arcs, time,  name="flow")
     stock = model.addVars(collectors, time, name="stock")
     trips = model.addVars(arcs, time,  vtype=gp.GRB.INTEGER, name="trip")
+    if instance.bounds is not None:
+        # upper bounds of flow and trips computed by Instance.presolve
+        model.setAttr('UB', list(flow.values()), instance.bounds['flow'].ravel().tolist())
+        model.setAttr('UB', list(trips.values()), instance.bounds['trip'].ravel().tolist())
     
     
     # create the objective function
@@ -89,7 +100,7 @@ def create_model(instance):
     
     # create constraints
     # number of regions to cover
-    constra_cover = model.addConstr(cover.sum('*') ==n_reg)    
+    constra_cover = model.addConstr(cover.sum('*') ==n_reg, "cover")    
     # generation at each region
     constr_gen = model.addConstrs(
         (flow.sum(r, '*', t) <= gen[r,t] *cover[r] for r in regions for t in time), "gen")
@@ -118,46 +129,333 @@ def create_model(instance):
     constr_demP = model.addConstrs(
         (flow.sum('*',p, t) >= demP[p,t] for p in producers for t in time), "demP")
     # commercial relationship
-    constr_relat1 = model.addConstrs(
-        (activ[c,t] >= activ_f[c,t1] for c in collectors for t1 in time for t in range(t1, min(t1+dt, len(time)))), "relat1")
+    if not lazy:
+        constr_relat1 = model.addConstrs(
+            (activ[c,t] >= activ_f[c,t1] for c in collectors for t1 in time for t in range(t1, min(t1+dt, len(time)))), "relat1")
     def prev_actv(c, t): # auxiliary function to handle the case of period 1
         if t <=1:
-            return 0 # TODO: check other cases
+            return iniA[c]
         return activ[c,t-1]    
     constr_relat2 = model.addConstrs(
         (activ_f[c,t]>=activ[c,t] - prev_actv(c, t) for c in collectors for t in time), "relat2"
         )
-    # maximum coverage
-    constr_cov_max = model.addConstrs(
-        (cover_max[t] >= flow.sum(r,'*',t)/gen[r,t] for t in time for r in regions), "cov_max"
-        )
-    # minimum coverage
-    constr_cov_min = model.addConstrs(
-        (cover_min[t] <= flow.sum(r,'*',t)/gen[r,t] + 1 - cover[r] for t in time for r in regions), "cov_max"
-        )
+    if not lazy:
+        # maximum coverage
+        constr_cov_max = model.addConstrs(
+            (cover_max[t] >= flow.sum(r,'*',t)/gen[r,t] for t in time for r in regions if gen[r,t] > 0), "cov_max"
+            )
+        # minimum coverage
+        constr_cov_min = model.addConstrs(
+            (cover_min[t] <= flow.sum(r,'*',t)/gen[r,t] + 1 - cover[r] for t in time for r in regions if gen[r,t] > 0), "cov_min"
+            )
     # balance coverage
     constr_cov_bal = model.addConstrs(
         (cover_max[t] - cover_min[t] <= alpha for t in time), "cover_bal"
         )
     # round up trips
     constr_trips_e2 = model.addConstrs(
-        (trips[c,m,t] >=flow[c,m,t]/capV for c in collectors for m in manufs for t in time), "trips_e2"
+        (trips[c,m,t] >=flow[c,m,t]/capV for c,m in arcs if c in collectors and m in manufs for t in time), "trips_e2"
         )
     # round up trips
     constr_trips_e3 = model.addConstrs(
-        (trips[m,p,t] >= flow[m,p,t] / capV for m in manufs for p in producers for t in time), "trips_e3"
+        (trips[m,p,t] >= flow[m,p,t] / capV for m,p in arcs if m in manufs and p in producers for t in time), "trips_e3"
         )
     
     model.update()
-    
+    # keep the variables of each family for the extraction of the results
+    model._vars = {'activ': activ, 'activ_f': activ_f, 'cover': cover, 'cover_max': cover_max,
+                   'cover_min': cover_min, 'flow': flow, 'stock': stock, 'trip': trips}
+    if lazy:
+        add_lazy(model, build_matrices(instance))
+
     return model
 
-def solve_model(model):
+def create_model_matrix(instance, lazy=False, names=False):
+    """
+    Create the same model as create_model, emitting the constraints in bulk.
+
+    The model is assembled in matrix form by backends.build_matrices and every
+    constraint family is added as a single sparse block through the gurobipy
+    matrix API. The variables are kept as one MVar, sliced by family in
+    model._vars, so get_results reads all their values in one query.
+
+    Args:
+        instance (Instance): The instance object containing the required data.
+        lazy (bool, optional): Leave the LAZY families out of the model (see
+            create_model). Defaults to False.
+        names (bool, optional): Give the variables the names of create_model
+            (one string per variable, slow on large models). Unnamed models
+            get them from var_names when needed. Defaults to False.
+
+    Returns:
+        Model: The created model.
+    """
+    m = build_matrices(instance)
+
+    # create the model
+    model = gp.Model('returnability')
+
+    # create variables (same order as create_model)
+    keys = [(name, keys) for name, keys, start, stop in m['vars']]
+    x = model.addMVar(len(m['c']), lb=m['lb'], ub=m['ub'], obj=m['c'], vtype=m['vtype'],
+                      name=[n for name, k in keys for n in var_names(name, k)] if names else None)
+    model.ModelSense = GRB.MINIMIZE
+    # keep the variables of each family for the extraction of the results
+    model._x = x
+    model._slices = {name: slice(start, stop) for name, keys, start, stop in m['vars']}
+    model._vars = {name: x[cols] for name, cols in model._slices.items()}
+    model._keys = None if names else keys
+
+    # create constraints, one block per family
+    model._blocks = {}
+    for name, start, stop in m['constrs']:
+        if lazy and name in LAZY:
+            continue
+        model._blocks[name] = model.addMConstr(m['A'][start:stop], x, m['sense'][start:stop],
+                                                m['rhs'][start:stop], name=name)
+
+    model.update()
+    if lazy:
+        add_lazy(model, m)
+
+    return model
+
+def var_names(name, keys):
+    """Names of the variables of a family, as given by create_model."""
+    return ['%s[%s]' % (name, ','.join(str(k) for k in (key if isinstance(key, tuple) else (key,))))
+            for key in keys]
+
+def variable_names(model, variables):
+    """Names of variables of a model, built from the keys of the families for
+    the unnamed models of create_model_matrix."""
+    if getattr(model, '_keys', None) is None:
+        return model.getAttr('VarName', variables)
+    names = [n for name, keys in model._keys for n in var_names(name, keys)]
+    return [names[v.index] for v in variables]
+
+def add_lazy(model, matrices, families=LAZY):
+    """
+    Keep the rows of some constraint families to enforce them as lazy
+    constraints (the model must not contain them).
+
+    Args:
+        model (Model): A model with the variables in the order of build_matrices.
+        matrices (dict): The model in matrix form (see build_matrices).
+        families (tuple, optional): The families. Defaults to LAZY.
+    """
+    model._lazy = [(name, matrices['A'][start:stop].tocsr(), matrices['sense'][start:stop],
+                    matrices['rhs'][start:stop]) for name, start, stop in matrices['constrs']
+                   if name in families]
+    model._lazy_vars = model.getVars()
+    model._n_lazy = {name: 0 for name, *_ in model._lazy}
+    model.Params.LazyConstraints = 1
+
+def lazy_callback(model, where, tol=1e-6):
+    """Add the lazy rows violated by a new incumbent or by the relaxation
+    of a node (see add_lazy)."""
+    variables = model._lazy_vars
+    if where == GRB.Callback.MIPSOL:
+        x = np.array(model.cbGetSolution(variables))
+    elif where == GRB.Callback.MIPNODE and model.cbGet(GRB.Callback.MIPNODE_STATUS) == GRB.OPTIMAL:
+        x = np.array(model.cbGetNodeRel(variables))
+    else:
+        return
+    for name, A, sense, rhs in model._lazy:
+        activity = A @ x
+        violated = np.flatnonzero(((sense == '<') & (activity > rhs + tol)) |
+                                  ((sense == '>') & (activity < rhs - tol)))
+        for i in violated:
+            row = slice(A.indptr[i], A.indptr[i+1])
+            expr = gp.LinExpr(A.data[row].tolist(), [variables[j] for j in A.indices[row]])
+            model.cbLazy(expr <= rhs[i] if sense[i] == '<' else expr >= rhs[i])
+        model._n_lazy[name] += len(violated)
+
+def solve_model(model, callback=None, start=None):
+    # warm start from a previous plan (e.g. the one of heuristic.heuristic_solve)
+    if start is not None:
+        set_start(model, solution_values(start))
+    # enforce the lazy families before the callback of the caller
+    if getattr(model, '_lazy', None):
+        user_callback = callback
+
+        def callback(model, where):
+            lazy_callback(model, where)
+            if user_callback is not None:
+                user_callback(model, where)
     # optimize the model
-    model.optimize()
-    
+    if callback is None:
+        model.optimize()
+    else:
+        model.optimize(callback)
+
     return model
 
+def solution_values(solution, shift=0):
+    """
+    Map the variables of a solution to their values, using the model names.
+
+    Args:
+        solution (Solution): The solution to read the values from.
+        shift (int, optional): Number of periods the values are moved back,
+            the value of period t is assigned to period t - shift. Defaults to 0.
+
+    Returns:
+        dict: Variable name -> value for the flow, trip, activ, activ_f, stock
+            and cover variables (periods moved before 1 are dropped).
+    """
+    flows = solution.df_flows
+    flows = flows[flows['period'] - shift >= 1]
+    flow_names = flows['name'] + '[' + flows['origin'].astype(str) + ',' + \
+        flows['destination'].astype(str) + ',' + (flows['period'] - shift).astype(str) + ']'
+
+    network = solution.df_network
+    by_period = network[network['name'].isin(['activ', 'activ_f', 'stock']) &
+                        (network['period'] - shift >= 1)]
+    period_names = by_period['name'] + '[' + by_period['facility'].astype(str) + ',' + \
+        (by_period['period'] - shift).astype(str) + ']'
+    cover = network[network['name'] == 'cover']
+    cover_names = 'cover[' + cover['facility'].astype(str) + ']'
+
+    values = {}
+    for names, df in [(flow_names, flows), (period_names, by_period), (cover_names, cover)]:
+        values.update(zip(names, df['value']))
+    return values
+
+def set_start(model, values):
+    """
+    Seed the MIP start of a model. Variables not given are left undefined and
+    completed by the solver.
+
+    Args:
+        model (Model): The model to warm start.
+        values (dict): Variable name -> start value (see solution_values).
+
+    Returns:
+        int: Number of variables that received a start value.
+
+    Raises:
+        ValueError: If the model is a backends.HighsModel (no MIP starts).
+    """
+    if hasattr(model, 'family_values'):
+        raise ValueError("The HiGHS backend does not support MIP starts")
+    model.update()
+    variables = model.getVars()
+    index = dict(zip(variable_names(model, variables), variables))
+    found = [(index[name], val) for name, val in values.items() if name in index]
+    if found:
+        model.setAttr('Start', [v for v, _ in found], [val for _, val in found])
+    return len(found)
+
+def fix_vars(model, values, lower_only=False):
+    """
+    Fix variables of a model to the given values.
+
+    Args:
+        model (Model): The model whose variables are fixed.
+        values (dict): Variable name -> value.
+        lower_only (bool, optional): Only set the lower bound. Defaults to False.
+
+    Returns:
+        int: Number of variables fixed.
+
+    Raises:
+        ValueError: If the model is a backends.HighsModel.
+    """
+    if hasattr(model, 'family_values'):
+        raise ValueError("The HiGHS backend does not support fixing variables by name")
+    model.update()
+    variables = model.getVars()
+    index = dict(zip(variable_names(model, variables), variables))
+    found = [(index[name], val) for name, val in values.items() if name in index]
+    if found:
+        model.setAttr('LB', [v for v, _ in found], [val for _, val in found])
+        if not lower_only:
+            model.setAttr('UB', [v for v, _ in found], [val for _, val in found])
+    return len(found)
+
+def build_solution(instance, X, obj_val, runtime=0.0, gap=0.0):
+    """
+    Create the solution object from the values of the variables.
+
+    Args:
+        instance (Instance): The instance the values belong to.
+        X (dict): Variable family -> array of values, in the order of the
+            variables of create_model.
+        obj_val (float): The objective value.
+        runtime (float, optional): The solve time. Defaults to 0.
+        gap (float, optional): The optimality gap. Defaults to 0.
+
+    Returns:
+        Solution: The solution with the summary of costs and the flows and
+            network data frames.
+    """
+    # Create data frames with the solution (only the nonzero flows and trips)
+    values = np.concatenate([X['flow'], X['trip']])
+    rows = np.flatnonzero(values)
+    df_flows = Solution.flow_keys(instance, rows)
+    df_flows['value'] = values[rows]
+    df_network = Solution.network_keys(instance)
+    df_network['value'] = np.concatenate([X[name] for name in Solution.NETWORK])
+
+    # dictionary summarising results
+    dict_sol = {
+        'obj_val': obj_val,
+        'runTime': runtime,
+        'gap': gap,
+        **summary(instance, evaluate(instance, X))}
+
+    # create solution object
+    solution = Solution(instance, dict_sol, df_flows, df_network)
+    return solution
+
+def variable_values(model):
+    """
+    Values of each variable family of a solved model, in the order the
+    variables were added.
+
+    Args:
+        model (Model): A model with a solution and the _vars families.
+
+    Returns:
+        dict: Variable family -> array of values.
+    """
+    if hasattr(model, 'family_values'):
+        return model.family_values()
+    if getattr(model, '_x', None) is not None:
+        # create_model_matrix: one query of the MVar, sliced by family
+        x = model._x.X
+        return {name: x[cols] for name, cols in model._slices.items()}
+    return {name: np.array(model.getAttr('X', list(var.values())))
+            for name, var in model._vars.items()}
+
+def diagnose(model):
+    """
+    Compute an IIS of an infeasible model and map it to the constraint families.
+
+    Args:
+        model (Model): An infeasible Gurobi model.
+
+    Returns:
+        DataFrame: One row per member of the IIS: family (the name before
+            '['), name and kind ('constr', or 'lb'/'ub' for variable bounds).
+            None if no IIS could be computed (e.g. the model is unbounded).
+    """
+    try:
+        model.computeIIS()
+    except gp.GurobiError:
+        return None
+    rows = []
+    constrs = model.getConstrs()
+    members = [c for c, i in zip(constrs, model.getAttr('IISConstr', constrs)) if i]
+    rows += [(name, 'constr') for name in model.getAttr('ConstrName', members)]
+    variables = model.getVars()
+    for kind, attr in [('lb', 'IISLB'), ('ub', 'IISUB')]:
+        members = [v for v, i in zip(variables, model.getAttr(attr, variables)) if i]
+        rows += [(name, kind) for name in variable_names(model, members)]
+    iis = pd.DataFrame(rows, columns=['name', 'kind'])
+    iis.insert(0, 'family', iis['name'].str.split('[').str[0])
+    return iis
+
 def get_results(model, instance):
     """
     Retrieves the results of a mathematical optimization model.
@@ -168,82 +466,15 @@ def get_results(model, instance):
     
     Returns:
         tuple: A tuple containing the status and the solution object if the model is optimal,
-            otherwise a tuple containing the status and None.
+            otherwise a tuple containing the status and None. The IIS of an
+            infeasible Gurobi model is kept in model._iis (see diagnose).
     """
 
     if model.Status == GRB.OPTIMAL:
-        # list of variables from the model solved
-        flows = []
-        network = []
-        for var in model.getVars():
-            row = []    
-            row.append(var.VarName.split('[')[0])
-            indexes = re.findall(r'\[(.*?)\]', var.VarName)[0].split(',')
-            [row.append(index) for index in indexes]
-            if 'cover' in var.VarName:
-                row.append(-99) # the variable cover has only one index
-            row.append(var.X)
-            if any(name in var.VarName for name in ['flow', 'trip']):
-                flows.append(row)
-            else:
-                network.append(row)
-                
-        # Create data frames with the solution
-        df_flows = pd.DataFrame.from_records(flows, columns=['name', 'origin', 'destination', 'period', 'value'])
-        df_flows['period'] = df_flows['period'].astype(int)
-        df_flows['arc'] = list(zip(df_flows['origin'], df_flows['destination']))
-        df_network = pd.DataFrame.from_records(network, columns=['name', 'facility', 'period', 'value'])
-        df_network['period'] = df_network['period'].astype(int)
-        
-        # calculate the different parts ofthe cost
-        df_flows_o = df_flows[df_flows['name']=='flow'] # extract only the x (flow) variables
-        # transport cost       
-        df_flows_o['trips'] = np.ceil((df_flows_o['value']-0.001)/instance.capV)
-        df_flows_o['c_transp'] = df_flows_o['arc'].map(instance.c_transp)*df_flows_o['trips']
-        c_transp = df_flows_o['c_transp'].sum()      
-        c_transp_e2 = df_flows_o[df_flows_o['origin'].isin(instance.collectors)]['c_transp'].sum()
-        c_transp_e3 = df_flows_o[df_flows_o['origin'].isin(instance.manufs)]['c_transp'].sum()
-        # cost of buying and classif
-        df_collect = df_flows[df_flows['destination'].isin(instance.collectors)].groupby(['destination'], as_index= False).agg(total = ('value', sum))
-        df_collect['c_buy'] = df_collect['destination'].map(instance.c_buy)*df_collect['total']
-        df_collect['c_clasif'] = df_collect['destination'].map(instance.c_clasif)*df_collect['total']
-        c_buy = df_collect['c_buy'].sum()
-        c_clasif = df_collect['c_clasif'].sum()
-        # cost of cleaning all incoming bottles
-        df_clean = df_flows_o[df_flows_o['destination'].isin(instance.manufs)].groupby(['destination'], as_index= False).agg(total = ('value', sum))
-        df_clean['c_clean'] = df_clean['destination'].map(instance.c_clean)*df_clean['total']
-        c_clean = df_clean['c_clean'].sum()
-        # cost of activiting facilities
-        df_actv = df_network[df_network['name']=='activ'].groupby(['facility'], as_index=False).agg(count = ('value', sum))
-        df_actv['c_activ'] = df_actv['facility'].map(instance.c_activ)*df_actv['count']
-        c_activ = df_actv['c_activ'].sum()
-        # cost of holding
-        df_stock = df_network[df_network['name']=='stock'].groupby(['facility'], as_index=False).agg(count = ('value', sum))
-        df_stock['c_hold'] = df_stock['facility'].map(instance.c_hold)*df_stock['count']
-        c_hold = df_stock['c_hold'].sum()
-        
-        # TODO: add other basic results
-       
-        # dictionary summarising results
-        dict_sol ={
-            'obj_val': model.ObjVal,
-            'runTime': model.Runtime,
-            'gap': model.MIPGap,
-            'c_transp': c_transp,
-            'c_transp_e2': c_transp_e2,
-            'c_transp_e3': c_transp_e3, 
-            'c_total':   c_transp + c_buy + c_clasif + c_clean + c_activ + c_hold, 
-            'q_buy': dict(zip(df_collect['destination'], df_collect['total'])),
-            'c_buy': c_buy,
-            'c_clasif': c_clasif,
-            'q_clean': dict(zip(df_clean['destination'], df_clean['total'])),
-            'c_clean': c_clean,
-            'q_activ': dict(zip(df_actv['facility'], df_actv['count'])),
-            'c_activ': c_activ}
-    
-        
-        # create solution object
-        solution = Solution(instance, dict_sol, df_flows, df_network)
+        X = variable_values(model)
+        solution = build_solution(instance, X, model.ObjVal, model.Runtime, model.MIPGap)
         return "Optimal", solution
     else:
+        if model.Status in (GRB.INFEASIBLE, GRB.INF_OR_UNBD) and hasattr(model, 'computeIIS'):
+            model._iis = diagnose(model)
         return "non-optimal", None
\ No newline at end of file
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+Rolling-horizon re-planning on top of create_model/solve_model.
+
+Every re-plan moves the planning window `shift` periods forward: the stock
+and activity of the collectors at the end of the executed periods become the
+initial values of the new window, the commercial agreements still running are
+kept, the decisions of the first `committed` periods of the new window are
+fixed and the previous solution is used as a MIP start.
+"""
+import numpy as np
+from classes import Instance
+from optimize import create_model, solution_values, set_start, fix_vars
+
+
+def roll_data(instance, solution, shift=1, gen=None, demP=None):
+    """
+    Create the data of the planning window moved `shift` periods forward.
+
+    Args:
+        instance (Instance): The instance of the previous plan.
+        solution (Solution): The solution of the previous plan.
+        shift (int, optional): Number of periods executed since the previous
+            plan. Defaults to 1.
+        gen (dict, optional): Updated generation (region, period) -> value for
+            the periods of the new window. Defaults to the previous values
+            moved forward, repeating the last period.
+        demP (dict, optional): Updated demand (producer, period) -> value for
+            the periods of the new window. Defaults to the previous values
+            moved forward, repeating the last period.
+
+    Returns:
+        dict: A data dictionary in the format used by Instance.
+    """
+    time = instance.time
+    last = time[-1]
+    network = solution.df_network
+    # state of the collectors at the end of the last executed period
+    state = network[network['period'] == shift]
+    stock = state[state['name'] == 'stock'].set_index('facility')['value']
+    activ = state[state['name'] == 'activ'].set_index('facility')['value']
+
+    data = dict(instance.raw_data)
+    data['collectors'] = {c: list(vals[:-1]) + [float(stock.get(c, 0))]
+                          for c, vals in instance.raw_data['collectors'].items()}
+    data['iniA'] = {c: int(np.round(activ.get(c, 0))) for c in instance.collectors}
+    if gen is None:
+        gen = {(r, t): instance.gen[r, min(t + shift, last)] for r in instance.regions for t in time}
+    if demP is None:
+        demP = {(p, t): instance.demP[p, min(t + shift, last)] for p in instance.producers for t in time}
+    data['gen'] = gen
+    data['demP'] = demP
+
+    return data
+
+def rolling_horizon(instance, solution, shift=1, committed=0, gen=None, demP=None,
+                    builder=create_model):
+    """
+    Build the model of the next planning window, warm started from the
+    previous solution.
+
+    Args:
+        instance (Instance): The instance of the previous plan.
+        solution (Solution): The solution of the previous plan.
+        shift (int, optional): Number of periods executed since the previous
+            plan. Defaults to 1.
+        committed (int, optional): Number of periods at the start of the new
+            window whose activ and stock decisions are fixed to the previous
+            plan. Defaults to 0.
+        gen (dict, optional): Updated generation for the new window.
+        demP (dict, optional): Updated demand for the new window.
+        builder (function, optional): Model builder. Defaults to create_model.
+
+    Returns:
+        tuple: The instance and the model of the new window, ready for
+            solve_model and get_results.
+    """
+    data = roll_data(instance, solution, shift, gen, demP)
+    new_instance = Instance(data, name=instance.name)
+    model = builder(new_instance)
+
+    values = solution_values(solution, shift)
+
+    # agreements signed in the executed periods keep the collectors active
+    network = solution.df_network
+    started = network[(network['name'] == 'activ_f') & (network['value'] > 0.5) &
+                      (network['period'] <= shift)]
+    agreed = {}
+    for c, t1 in zip(started['facility'], started['period']):
+        for t in range(t1, min(t1 + instance.dt, len(instance.time))):
+            if t > shift:
+                agreed['activ[%s,%s]' % (c, t - shift)] = 1
+    fix_vars(model, agreed, lower_only=True)
+
+    # decisions already committed in the new window; the starts of agreements
+    # (activ_f) are left to relat2, the old ones would force (relat1) periods
+    # of activity the committed activ does not have
+    fixed = {name: np.round(val) if not name.startswith('stock') else val
+             for name, val in values.items()
+             if name.split('[')[0] in ('activ', 'stock')
+             and int(name[:-1].split(',')[-1]) <= committed}
+    fix_vars(model, fixed)
+
+    set_start(model, values)
+
+    return new_instance, model
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Batch runner for sensitivity sweeps: every scenario overrides some of the
+data of a base instance (alpha, n_reg, dt, capV, ...) and is built and solved
+in a pool of processes.
+"""
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+import pandas as pd
+from classes import Instance
+from optimize import create_model, solve_model, get_results
+
+
+def scenario_grid(**params):
+    """
+    Create the scenarios of a full grid of parameter values.
+
+    Args:
+        **params: Data key -> list of values, e.g. alpha=[0.1, 0.3], n_reg=[1, 2].
+
+    Returns:
+        list: One dictionary of overrides per combination of values.
+    """
+    keys = list(params)
+    return [dict(zip(keys, values)) for values in product(*params.values())]
+
+def run_scenario(data, overrides, name='scenario0', threads=1, time_limit=None,
+                 builder=create_model):
+    """
+    Build and solve one scenario.
+
+    Args:
+        data (dict): The base data, in the format used by Instance.
+        overrides (dict): Data key -> value replacing the base data.
+        name (str, optional): The name of the scenario instance.
+        threads (int, optional): Threads used by Gurobi. Defaults to 1.
+        time_limit (float, optional): Time limit of the solve in seconds.
+        builder (function, optional): Model builder. Defaults to create_model.
+
+    Returns:
+        dict: The overrides, the status and the entries of dict_sol.
+    """
+    instance = Instance({**data, **overrides}, name=name)
+    model = builder(instance)
+    model.Params.OutputFlag = 0
+    model.Params.Threads = threads
+    if time_limit is not None:
+        model.Params.TimeLimit = time_limit
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    row = {'scenario': name, **overrides, 'status': status}
+    if solution is not None:
+        row.update(solution.dict_sol)
+    model.dispose()
+    return row
+
+def run_batch(instance, scenarios, workers=None, threads=1, time_limit=None,
+              builder=create_model):
+    """
+    Solve a list of scenarios of an instance in a pool of processes.
+
+    Every worker gives Gurobi `threads` threads, so by default the number of
+    workers is the number of cores divided by `threads` to avoid
+    oversubscribing the machine. The workers are spawned processes, so the
+    calling script needs an `if __name__ == '__main__'` guard.
+
+    Args:
+        instance (Instance): The base instance.
+        scenarios (list): Dictionaries of overrides of the base data
+            (see scenario_grid).
+        workers (int, optional): Number of processes. Defaults to
+            cpu_count // threads.
+        threads (int, optional): Gurobi threads per worker. Defaults to 1.
+        time_limit (float, optional): Time limit of each solve in seconds.
+        builder (function, optional): Model builder. Defaults to create_model.
+
+    Returns:
+        DataFrame: One row per scenario with its overrides and results.
+    """
+    if workers is None:
+        workers = max(1, (os.cpu_count() or 1) // threads)
+    names = ['%s_%s' % (instance.name, i) for i in range(len(scenarios))]
+
+    # spawned workers do not inherit the Gurobi environment and threads of the parent
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context('spawn')) as pool:
+        futures = [pool.submit(run_scenario, instance.raw_data, overrides, name,
+                               threads, time_limit, builder)
+                   for overrides, name in zip(scenarios, names)]
+        rows = [f.result() for f in futures]
+
+    return pd.DataFrame(rows)
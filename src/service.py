@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+"""
+Plan-serving service.
+
+Clients submit instances in the format of the data files (see
+utilities.read_data_json), the jobs are queued and built and solved by a pool
+of worker processes, and the telemetry events of every job (stages and the
+incumbent/gap trajectory of the solver) are streamed back while it runs. The
+result of a job is its status and the KPIs of the solution (dict_sol).
+
+The service is served over a minimal HTTP/1.1 interface on a TCP port or a
+Unix socket, so it can be load tested locally:
+
+    POST /jobs               instance payload -> 202 {"job": id}
+    GET  /jobs/<id>          status and result of the job
+    GET  /jobs/<id>/events   events as JSON lines until the job ends
+    GET  /health             number of jobs by status
+
+Run it with `python service.py --port 8080` (or `--unix path`).
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import multiprocessing as mp
+import time as tm
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from classes import Instance
+from optimize import create_model
+from telemetry import Telemetry, run_pipeline
+from utilities import parse_data
+
+# event queue of the workers (set by init_worker)
+events = None
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+class QueueStream:
+    """File-like object putting every line written to it in a queue, tagged
+    with the job it belongs to."""
+    def __init__(self, queue, job):
+        self.queue = queue
+        self.job = job
+
+    def write(self, line):
+        self.queue.put((self.job, line))
+
+def init_worker(queue):
+    global events
+    events = queue
+
+def run_job(job, data, builder, params):
+    """
+    Build and solve the instance of a job (run in a worker).
+
+    Returns:
+        dict: The status and the KPIs of the solution (None without solution),
+            JSON serializable.
+    """
+    try:
+        instance = Instance(parse_data(data), name=job)
+        status, solution = run_pipeline(instance, builder, Telemetry(QueueStream(events, job), run=job),
+                                        **params)
+    finally:
+        # end of the events of the job
+        events.put((job, None))
+    kpis = None if solution is None else json.loads(json.dumps(solution.dict_sol, default=float))
+    return {'status': status, 'kpis': kpis}
+
+class PlanService:
+    """
+    Queue of solve jobs served by a pool of worker processes.
+
+    Args:
+        workers (int, optional): Number of worker processes. Defaults to 1.
+        builder (function, optional): Model builder. Defaults to create_model.
+        max_finished (int, optional): Number of finished jobs kept, the oldest
+            ones are forgotten when it is exceeded. Defaults to 1000.
+        **params: Gurobi parameters of every solve (e.g. TimeLimit=60). The
+            solver log is off unless OutputFlag=1 is given.
+    """
+    def __init__(self, workers=1, builder=create_model, max_finished=1000, **params):
+        self.workers = workers
+        self.builder = builder
+        self.max_finished = max_finished
+        self.params = {'OutputFlag': 0, **params}
+        self.jobs = {}
+        # finished jobs, oldest first
+        self._finished = deque()
+        self._drained = {}
+        self._ids = itertools.count(1)
+
+    async def start(self):
+        ctx = mp.get_context('spawn')
+        self._queue = ctx.Queue()
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                         initializer=init_worker, initargs=(self._queue,))
+        self._changed = asyncio.Condition()
+        self._pump = asyncio.create_task(self._read_events())
+
+    async def close(self):
+        # waiting for the running jobs would block the event loop
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, partial(self._pool.shutdown, cancel_futures=True))
+        self._queue.put(None)
+        await self._pump
+
+    async def _read_events(self):
+        # move the events of the workers to their jobs
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await loop.run_in_executor(None, self._queue.get)
+            if item is None:
+                return
+            job, line = item
+            if line is None:
+                if job in self._drained:
+                    self._drained[job].set()
+            elif job in self.jobs:
+                await self._update(job, event=json.loads(line))
+
+    async def _update(self, job, event=None, **fields):
+        async with self._changed:
+            self.jobs[job].update(fields)
+            if event is not None:
+                # a job is running from its first event
+                if self.jobs[job]['status'] == 'queued':
+                    self.jobs[job]['status'] = 'running'
+                self.jobs[job]['events'].append(event)
+            self._changed.notify_all()
+
+    async def submit(self, data, **params):
+        """
+        Queue an instance.
+
+        Args:
+            data (dict): The instance in the format of the data files.
+            **params: Gurobi parameters of this solve, on top of the ones of
+                the service.
+
+        Returns:
+            str: The job id.
+        """
+        job = 'job-%d' % next(self._ids)
+        self.jobs[job] = {'job': job, 'status': 'queued', 'submitted': tm.time(),
+                          'events': [], 'result': None, 'error': None}
+        self._drained[job] = asyncio.Event()
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, run_job, job, data, self.builder, {**self.params, **params})
+        asyncio.create_task(self._wait(job, future))
+        return job
+
+    async def _wait(self, job, future):
+        try:
+            result = await future
+        except Exception as e:
+            self._drained.pop(job, None)
+            await self._update(job, status='failed', error=repr(e), finished=tm.time())
+            self._forget(job)
+            return
+        try:
+            # the events travel through another channel than the result
+            await asyncio.wait_for(self._drained[job].wait(), 10)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._drained.pop(job, None)
+        await self._update(job, status='done', result=result, finished=tm.time())
+        self._forget(job)
+
+    def _forget(self, job):
+        # drop the oldest finished jobs beyond max_finished
+        self._finished.append(job)
+        while len(self._finished) > self.max_finished:
+            self.jobs.pop(self._finished.popleft(), None)
+
+    def status(self, job):
+        """Status, timings and result of a job (None if it does not exist)."""
+        if job not in self.jobs:
+            return None
+        return without_events(self.jobs[job])
+
+    async def stream(self, job):
+        """Yield the events of a job as they arrive, until the job ends."""
+        # the record outlives the job being forgotten meanwhile
+        record = self.jobs[job]
+        i = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(record['events']) > i or
+                                             record['status'] in ('done', 'failed'))
+                new = record['events'][i:]
+                ended = record['status'] in ('done', 'failed')
+            for event in new:
+                yield event
+            i += len(new)
+            if ended and i == len(record['events']):
+                return
+
+    async def handle(self, reader, writer):
+        """Serve one HTTP request."""
+        try:
+            request = await reader.readline()
+            method, path, _ = request.decode().split(' ', 2)
+            headers = {}
+            while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                key, value = line.decode().split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+        except (ValueError, asyncio.IncompleteReadError):
+            await respond(writer, 400, {'error': 'malformed request'})
+            return
+
+        parts = path.strip('/').split('/')
+        try:
+            if parts == ['health']:
+                counts = {}
+                for record in self.jobs.values():
+                    counts[record['status']] = counts.get(record['status'], 0) + 1
+                await respond(writer, 200, {'jobs': counts, 'workers': self.workers})
+            elif parts == ['jobs'] and method == 'POST':
+                payload = json.loads(body)
+                await respond(writer, 202, {'job': await self.submit(payload.pop('data', payload),
+                                                                      **payload.pop('params', {}))})
+            elif len(parts) in (2, 3) and parts[0] == 'jobs' and method == 'GET':
+                if parts[1] not in self.jobs:
+                    await respond(writer, 404, {'error': 'unknown job %s' % parts[1]})
+                elif len(parts) == 2:
+                    await respond(writer, 200, self.status(parts[1]))
+                elif parts[2] == 'events':
+                    record = self.jobs[parts[1]]
+                    writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n'
+                                 b'Connection: close\r\n\r\n')
+                    async for event in self.stream(parts[1]):
+                        writer.write((json.dumps(event) + '\n').encode())
+                        await writer.drain()
+                    writer.write((json.dumps({'event': 'end', **without_events(record)}) + '\n').encode())
+                    writer.close()
+                else:
+                    await respond(writer, 404, {'error': 'not found'})
+            else:
+                await respond(writer, 405 if parts[0] in ('jobs', 'health') else 404,
+                              {'error': '%s %s not supported' % (method, path)})
+        except (ValueError, KeyError, TypeError) as e:
+            await respond(writer, 400, {'error': repr(e)})
+        except ConnectionError:
+            writer.close()
+        except Exception:
+            await respond(writer, 500, {'error': traceback.format_exc()})
+
+    async def serve(self, host='127.0.0.1', port=8080, path=None):
+        """
+        Start the workers and serve HTTP on a TCP port or a Unix socket.
+
+        Returns:
+            Server: The asyncio server (closing it does not stop the workers,
+                see close).
+        """
+        await self.start()
+        if path is not None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, host, port)
+
+def without_events(record):
+    return {key: value for key, value in record.items() if key != 'events'}
+
+async def respond(writer, code, payload):
+    body = json.dumps(payload, default=float).encode()
+    writer.write(b'HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n'
+                 b'Connection: close\r\n\r\n' % (code, REASONS[code].encode(), len(body)) + body)
+    await writer.drain()
+    writer.close()
+
+async def request(method, path, payload=None, host='127.0.0.1', port=8080, unix=None):
+    """
+    Minimal client of the service (for scripts and load tests).
+
+    Returns:
+        tuple: The status code and the decoded JSON body. For the events
+            endpoint the body is the list of events.
+    """
+    if unix is not None:
+        reader, writer = await asyncio.open_unix_connection(unix)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    body = b'' if payload is None else json.dumps(payload).encode()
+    writer.write(b'%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n'
+                 b'Content-Length: %d\r\n\r\n' % (method.encode(), path.encode(), len(body)) + body)
+    await writer.drain()
+    code = int((await reader.readline()).split()[1])
+    while await reader.readline() not in (b'\r\n', b''):
+        pass
+    data = await reader.read()
+    writer.close()
+    if path.endswith('/events'):
+        return code, [json.loads(line) for line in data.splitlines() if line]
+    return code, json.loads(data)
+
+async def main(args):
+    service = PlanService(args.workers, TimeLimit=args.time_limit) if args.time_limit \
+        else PlanService(args.workers)
+    server = await service.serve(args.host, args.port, args.unix)
+    print('serving on %s' % (args.unix or '%s:%s' % (args.host, args.port)))
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', default=None, help='Unix socket path (instead of host/port)')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--time-limit', type=float, default=None)
+    asyncio.run(main(parser.parse_args()))
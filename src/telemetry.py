@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentation of the pipeline build -> solve -> extract -> check.
+
+Every stage emits a structured event as one JSON line: timings, the number of
+variables and constraints of each family and the incumbent/bound trajectory
+of the solver, taken from a Gurobi callback.
+"""
+import json
+import sys
+import time as tm
+from collections import Counter
+from contextlib import contextmanager
+from gurobipy import GRB
+from optimize import create_model, solve_model, get_results
+
+
+class Telemetry:
+    """
+    Emits events as JSON lines.
+
+    Args:
+        stream (file, optional): Where the events are written. Defaults to
+            sys.stderr.
+        run (str, optional): Identifier added to every event.
+        interval (float, optional): Minimum seconds between two progress events
+            that only change the bound. Defaults to 1.
+    """
+    def __init__(self, stream=None, run=None, interval=1.0):
+        self.stream = sys.stderr if stream is None else stream
+        self.run = run
+        self.interval = interval
+        self._last_progress = -interval
+        self._last_incumbent = None
+        self._last_bound = None
+
+    def emit(self, event, **fields):
+        record = {'ts': tm.time(), 'run': self.run, 'event': event, **fields}
+        self.stream.write(json.dumps(record, default=float) + '\n')
+
+    @contextmanager
+    def stage(self, name, **fields):
+        """Time a block of code and emit it as an event; the block can add
+        fields to the dictionary it receives. If the block raises, the event
+        has the error in its error field."""
+        start = tm.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            # a failed stage is still emitted, with the error
+            fields['error'] = repr(e)
+            raise
+        finally:
+            self.emit(name, time=tm.perf_counter() - start, **fields)
+
+    def callback(self, model, where):
+        """Gurobi callback emitting the incumbent and bound of the MIP search."""
+        if where == GRB.Callback.MIPSOL:
+            incumbent = model.cbGet(GRB.Callback.MIPSOL_OBJBST)
+            bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+            new_incumbent = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+            incumbent = min(incumbent, new_incumbent)
+        elif where == GRB.Callback.MIP:
+            incumbent = model.cbGet(GRB.Callback.MIP_OBJBST)
+            bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+        else:
+            return
+        runtime = model.cbGet(GRB.Callback.RUNTIME)
+        if incumbent == self._last_incumbent and (bound == self._last_bound or
+                                                  runtime - self._last_progress < self.interval):
+            return
+        self._last_incumbent = incumbent
+        self._last_bound = bound
+        self._last_progress = runtime
+        gap = abs(incumbent - bound)/abs(incumbent) if incumbent < GRB.INFINITY and incumbent != 0 else None
+        self.emit('progress', runtime=runtime, incumbent=incumbent if incumbent < GRB.INFINITY else None,
+                  bound=bound, gap=gap)
+
+def family_counts(model):
+    """
+    Count the variables and constraints of each family of a model.
+
+    Args:
+        model (Model): A model created by create_model, create_model_matrix
+            or backends.create_model_highs.
+
+    Returns:
+        tuple: Dictionaries family -> number of variables and family ->
+            number of constraints. Matrix models keep a block of rows per
+            family; for create_model the family is the name before '['.
+    """
+    # tupledicts of create_model, MVar slices of create_model_matrix or ranges of HighsModel
+    variables = {name: var.size if hasattr(var, 'size') else len(var)
+                 for name, var in getattr(model, '_vars', {}).items()}
+    if getattr(model, '_blocks', None) is not None:
+        # MConstr of create_model_matrix or rows of backends.HighsModel
+        return variables, {name: block.size if hasattr(block, 'size') else len(block)
+                           for name, block in model._blocks.items()}
+    names = model.getAttr('ConstrName', model.getConstrs())
+    constraints = Counter(name.split('[')[0] for name in names)
+    return variables, dict(constraints)
+
+def run_pipeline(instance, builder=create_model, telemetry=None, check=True, presolve=False,
+                 precheck=False, **params):
+    """
+    Build, solve, extract and check an instance emitting telemetry events.
+
+    Args:
+        instance (Instance): The instance to solve.
+        builder (function, optional): Model builder. Defaults to create_model.
+        telemetry (Telemetry, optional): The event emitter. Defaults to a
+            Telemetry writing to sys.stderr with the instance name as run.
+        check (bool, optional): Run the solution checker. Defaults to True.
+        presolve (bool, optional): Remove the unusable arcs and bound the
+            flows before the build (see Instance.presolve). Defaults to False.
+        precheck (bool, optional): Run the feasibility tests of
+            Instance.precheck first and stop if one fails. Defaults to False.
+        **params: Gurobi parameters of the solve (e.g. TimeLimit=60).
+
+    Returns:
+        tuple: The status and the solution, as returned by get_results, or
+            "infeasible" and None if the precheck fails.
+    """
+    telemetry = Telemetry(run=instance.name) if telemetry is None else telemetry
+
+    if precheck:
+        with telemetry.stage('precheck') as event:
+            failed = instance.precheck(report=True)
+            event['valid'] = failed.empty
+            event['failed'] = failed.groupby('test').size().to_dict()
+            event['shortfall'] = failed.groupby('test')['shortfall'].max().to_dict()
+        if not failed.empty:
+            return "infeasible", None
+
+    if presolve:
+        with telemetry.stage('presolve') as event:
+            event['n_arcs'] = len(instance.arrays['arc_cost'])
+            instance = instance.presolve()
+            event['n_arcs_kept'] = len(instance.arrays['arc_cost'])
+            event['n_fixed'] = int((instance.bounds['flow'] == 0).sum())
+
+    with telemetry.stage('build', builder=builder.__name__) as event:
+        model = builder(instance)
+        event['n_vars'] = model.NumVars
+        event['n_constrs'] = model.NumConstrs
+        event['n_nz'] = model.NumNZs
+        event['vars'], event['constrs'] = family_counts(model)
+
+    with telemetry.stage('solve') as event:
+        for key, value in params.items():
+            model.setParam(key, value)
+        # HiGHS models report no progress (no callbacks)
+        solve_model(model, None if hasattr(model, 'family_values') else telemetry.callback)
+        event['status'] = model.Status
+        event['runtime'] = model.Runtime
+        event['node_count'] = model.NodeCount
+        if model.SolCount:
+            event['obj_val'] = model.ObjVal
+            event['bound'] = model.ObjBound
+            event['gap'] = model.MIPGap
+
+    with telemetry.stage('extract') as event:
+        status, solution = get_results(model, instance)
+        event['status'] = status
+        if getattr(model, '_iis', None) is not None:
+            event['iis'] = model._iis.groupby('family').size().to_dict()
+
+    if check and solution is not None:
+        with telemetry.stage('check') as event:
+            violations = solution.solution_checker(report=True)
+            event['valid'] = violations.empty
+            event['violations'] = violations.groupby('constraint').size().to_dict()
+
+    return status, solution
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Model templates for what-if queries.
+
+A template keeps a built model together with its matrix form. When only
+costs, capacities, generation or demand change, the new matrices are compared
+with the previous ones and only the objective coefficients, right-hand sides
+and matrix coefficients that differ are changed in place before the model is
+re-optimized from the previous solution. Templates are cached by the
+structure of the instance (sets, arcs and dt) with LRU eviction.
+"""
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from classes import Instance
+from backends import build_matrices
+from optimize import create_model_matrix, solve_model, get_results
+
+# parameter -> (data key, position in the data list); position None for scalars
+# and for the dictionaries indexed like the data (gen, demP, arcs, iniA)
+PARAMETERS = {
+    'c_buy': ('collectors', 0), 'c_clasif': ('collectors', 1), 'c_activ': ('collectors', 2),
+    'c_hold': ('collectors', 3), 'capC': ('collectors', 4), 'capS': ('collectors', 5),
+    'iniS': ('collectors', 6), 'c_clean': ('manufs', 0), 'capM': ('manufs', 1),
+    'c_transp': ('arcs', None), 'gen': ('gen', None), 'demP': ('demP', None),
+    'iniA': ('iniA', None), 'n_reg': ('n_reg', None), 'alpha': ('alpha', None),
+    'capV': ('capV', None)}
+
+
+def structure_key(instance):
+    """
+    Key of the structure of an instance: the sets, the arcs and dt. Instances
+    with the same key only differ in parameters a template can update.
+
+    Args:
+        instance (Instance): The instance.
+
+    Returns:
+        str: A hexadecimal digest.
+    """
+    arrays = instance.arrays
+    digest = hashlib.sha1()
+    for values in [instance.regions, instance.collectors, instance.manufs, instance.producers, instance.time]:
+        digest.update(repr(list(values)).encode())
+    for key in ['arc_orig_kind', 'arc_orig', 'arc_dest_kind', 'arc_dest']:
+        digest.update(np.ascontiguousarray(arrays[key], dtype=np.int64).tobytes())
+    digest.update(repr(instance.dt).encode())
+    return digest.hexdigest()
+
+def update_data(data, **params):
+    """
+    Apply parameter changes to a data dictionary.
+
+    Args:
+        data (dict): The data, in the format used by Instance (not modified).
+        **params: Parameter -> new value. Scalars (n_reg, alpha, capV) take a
+            number, the other parameters a dictionary with the entries that
+            change, e.g. c_buy={'c1': 90} or gen={('r1', 2): 500}.
+
+    Returns:
+        dict: The updated data.
+    """
+    data = dict(data)
+    for param, value in params.items():
+        if param not in PARAMETERS:
+            raise ValueError("Unknown parameter: %s" % param)
+        key, pos = PARAMETERS[param]
+        if pos is not None:
+            rows = {k: list(v) for k, v in data[key].items()}
+            for k, v in value.items():
+                rows[k][pos] = v
+            data[key] = rows
+        elif isinstance(data.get(key), dict):
+            data[key] = {**data[key], **value}
+        else:
+            data[key] = value
+    return data
+
+class ModelTemplate:
+    """
+    A built model that is updated in place between solves.
+
+    Args:
+        instance (Instance): The instance the model is built from.
+        builder (function, optional): Model builder taking an instance, the
+            model must come from build_matrices (create_model_matrix or
+            backends.create_model_highs) with every constraint family, so
+            not in lazy mode. Defaults to create_model_matrix.
+
+    Raises:
+        ValueError: If the model of the builder has no block of rows for
+            every constraint family (create_model, or the lazy mode).
+    """
+    def __init__(self, instance, builder=create_model_matrix):
+        self.instance = instance
+        self.key = structure_key(instance)
+        self.matrices = build_matrices(instance)
+        self.model = builder(instance)
+        blocks = getattr(self.model, '_blocks', None) or {}
+        if getattr(self.model, '_lazy', None) or \
+                any(name not in blocks for name, start, stop in self.matrices['constrs']):
+            self.model.dispose()
+            raise ValueError("A template needs a model with the constraint blocks of "
+                             "build_matrices (create_model_matrix without lazy mode)")
+        self.solves = 0
+
+    def update(self, instance=None, **params):
+        """
+        Change the parameters of the model in place.
+
+        Args:
+            instance (Instance, optional): An instance with the structure of
+                the template whose parameters replace the current ones.
+            **params: Parameter changes applied to the current data (see
+                update_data), ignored if an instance is given.
+
+        Returns:
+            dict: Number of objective coefficients, upper bounds, right-hand
+                sides and matrix coefficients changed.
+
+        Raises:
+            ValueError: If the instance has another structure or the new
+                parameters change the sparsity of the model (coefficients
+                or rows that become zero or stop being so). The template is
+                left unchanged.
+        """
+        if instance is None:
+            instance = Instance(update_data(self.instance.raw_data, **params), name=self.instance.name)
+        elif structure_key(instance) != self.key:
+            raise ValueError("The instance does not have the structure of the template")
+        old, new = self.matrices, build_matrices(instance)
+        if not (np.array_equal(old['A'].indptr, new['A'].indptr)
+                and np.array_equal(old['A'].indices, new['A'].indices)):
+            raise ValueError("The update changes the sparsity of the model")
+
+        obj = np.flatnonzero(old['c'] != new['c'])
+        rhs = np.flatnonzero(old['rhs'] != new['rhs'])
+        ub = np.flatnonzero(old['ub'] != new['ub'])
+        coef = np.flatnonzero(old['A'].data != new['A'].data)
+
+        model = self.model
+        if hasattr(model, 'family_values'):
+            # HighsModel is rebuilt from the matrices at every solve
+            model.matrices = new
+        else:
+            variables = model.getVars()
+            constrs = [c for name, start, stop in new['constrs'] for c in model._blocks[name].tolist()]
+            if len(obj):
+                model.setAttr('Obj', [variables[i] for i in obj], new['c'][obj].tolist())
+            if len(ub):
+                model.setAttr('UB', [variables[i] for i in ub], new['ub'][ub].tolist())
+            if len(rhs):
+                model.setAttr('RHS', [constrs[i] for i in rhs], new['rhs'][rhs].tolist())
+            if len(coef):
+                rows = np.repeat(np.arange(new['A'].shape[0]), np.diff(new['A'].indptr))[coef]
+                cols = new['A'].indices[coef]
+                for i, j, v in zip(rows.tolist(), cols.tolist(), new['A'].data[coef].tolist()):
+                    model.chgCoeff(constrs[i], variables[j], v)
+            # start the next solve from the previous solution (the LP basis is kept by Gurobi)
+            if model.SolCount:
+                model.setAttr('Start', variables, model.getAttr('X', variables))
+            model.update()
+
+        self.instance = instance
+        self.matrices = new
+        return {'obj': len(obj), 'ub': len(ub), 'rhs': len(rhs), 'coef': len(coef)}
+
+    def solve(self, callback=None):
+        """
+        Re-optimize the model.
+
+        Returns:
+            tuple: The status and the solution, as returned by get_results.
+        """
+        solve_model(self.model, callback)
+        self.solves += 1
+        return get_results(self.model, self.instance)
+
+class TemplateCache:
+    """
+    LRU cache of model templates keyed by the structure of the instances.
+
+    Args:
+        maxsize (int, optional): Maximum number of templates kept, the least
+            recently used is disposed when it is exceeded. Defaults to 8.
+        builder (function, optional): Model builder of the templates.
+            Defaults to create_model_matrix.
+        **params: Solver parameters set on every new model (e.g. OutputFlag=0).
+    """
+    def __init__(self, maxsize=8, builder=create_model_matrix, **params):
+        self.maxsize = maxsize
+        self.builder = builder
+        self.params = params
+        self.templates = OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, instance):
+        """
+        Template of an instance, updated to its parameters.
+
+        Args:
+            instance (Instance): The instance.
+
+        Returns:
+            ModelTemplate: A cached template updated in place, or a new one
+                (also when the parameters change the sparsity of the cached
+                template).
+        """
+        key = structure_key(instance)
+        template = self.templates.get(key)
+        if template is not None:
+            try:
+                template.update(instance)
+            except ValueError:
+                # zero parameters (e.g. gen or capacities) changed the sparsity, rebuild it
+                del self.templates[key]
+                template.model.dispose()
+            else:
+                self.hits += 1
+                self.templates.move_to_end(key)
+                return template
+
+        self.misses += 1
+        template = ModelTemplate(instance, self.builder)
+        for param, value in self.params.items():
+            template.model.setParam(param, value)
+        self.templates[key] = template
+        if len(self.templates) > self.maxsize:
+            _, evicted = self.templates.popitem(last=False)
+            evicted.model.dispose()
+        return template
+
+    def solve(self, instance, callback=None):
+        """
+        Solve an instance with the cached template of its structure.
+
+        Returns:
+            tuple: The status and the solution, as returned by get_results.
+        """
+        return self.get(instance).solve(callback)
@@ -6,60 +6,221 @@ Created on Mon Jun 19 09:23:27 2023
 """
 
 import json
-import random
+import re
 import numpy as np
-from geopy.distance import geodesic as GD
+from scipy.spatial import cKDTree
 
 
-def read_data_json(file_path):
+# sections of the JSON file whose keys are tuples written as strings
+TUPLE_SECTIONS = ('arcs', 'gen', 'demP')
+DATA_KEYS = ('regions', 'collectors', 'manufs', 'producers', 'time', 'arcs', 'gen',
+             'demP', 'dt', 'capV', 'n_reg', 'alpha')
+
+def parse_key(key):
+    """
+    Parse a tuple key written as a string, e.g. "('r1', 'c1')" or "('p1',1)",
+    without eval. Quoted items are kept as strings and the others converted
+    to numbers (node names must not contain commas).
+
+    Args:
+        key (str): The string representation of the tuple.
+
+    Returns:
+        tuple: The parsed tuple.
+    """
+    items = []
+    for item in key.strip()[1:-1].split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if item[0] in '\'"':
+            items.append(item[1:-1])
+        elif item.lstrip('-').isdigit():
+            items.append(int(item))
+        else:
+            items.append(float(item))
+    return tuple(items)
+
+class _JsonStream:
+    """
+    Minimal incremental JSON reader: reads the file by chunks and decodes one
+    token at a time, so only the current chunk is kept in memory.
+    """
+    # longest entry of an object of numbers, a longer unmatched text is malformed
+    MAX_ENTRY = 1 << 16
+    _ws = re.compile(r'[ \t\n\r]*')
+    _number_entry = re.compile(r'\s*"([^"\\]*)"\s*:\s*(-?\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)\s*([,}])')
+
+    def __init__(self, file, chunk_size):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        # position of the start of the buffer in the stream
+        self.offset = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buf = self.buf[self.pos:] + chunk
+        self.offset += self.pos
+        self.pos = 0
+        self.eof = not chunk
+        return not self.eof
+
+    def peek(self):
+        # next non whitespace character ('' at the end of the file)
+        while True:
+            self.pos = self._ws.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError("Expected '%s' at position %s of the JSON stream" % (char, self.offset + self.pos))
+        self.pos += 1
+
+    def value(self):
+        # decode the next complete value, a value is complete when it is followed
+        # by a separator (a number may be cut by the end of the buffer)
+        self.peek()
+        while True:
+            try:
+                val, end = self.decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) and self.buf[end] in ',:]} \t\n\r' or self.eof:
+                    self.pos = end
+                    return val
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def numbers(self):
+        # iterate over the (key, value) pairs of an object of numbers, matching
+        # the entries directly in the buffer
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            # the entry ends with its separator, so a match is never cut by the buffer end
+            match = self._number_entry.match(self.buf, self.pos)
+            if match is None:
+                if len(self.buf) - self.pos <= self.MAX_ENTRY and self._fill():
+                    continue
+                raise ValueError("Expected a number entry at position %s of the JSON stream"
+                                 % (self.offset + self.pos))
+            self.pos = match.end()
+            key, val, char = match.groups()
+            yield key, (float(val) if any(c in val for c in '.eE') else int(val))
+            if char == '}':
+                return
+
+    def keys(self):
+        # iterate over the keys of an object, the caller reads each value
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError("Expected ',' or '}' at position %s of the JSON stream"
+                                 % (self.offset + self.pos))
+
+def read_data_json(file_path, stream=False, chunk_size=1 << 20):
     """
     Read data from a JSON file and return the extracted information as a dictionary.
 
     Args:
         file_path (str): The path to the JSON file.
+        stream (bool, optional): Read the file incrementally by chunks, so the
+            whole JSON text is never held in memory. Defaults to False.
+        chunk_size (int, optional): Characters read per chunk when streaming.
 
     Returns:
         dict: A dictionary containing the extracted data from the JSON file.
     """
     # Open the JSON file for reading
     with open(file_path, "r") as json_file:
-        json_data = json.load(json_file)
+        if stream:
+            reader = _JsonStream(json_file, chunk_size)
+            json_data = {}
+            for key in reader.keys():
+                if key in TUPLE_SECTIONS:
+                    json_data[key] = {parse_key(k): v for k, v in reader.numbers()}
+                else:
+                    json_data[key] = reader.value()
+        else:
+            return parse_data(json.load(json_file))
 
     # Extract required data from the loaded JSON
-    data = {
-        'regions': json_data['regions'],
-        'collectors': json_data['collectors'],
-        'manufs': json_data['manufs'],
-        'producers': json_data['producers'],
-        'time': json_data['time'],
-        'arcs': {tuple(eval(k)): v for k, v in json_data['arcs'].items()},
-        'gen': {eval(k): v for k, v in json_data['gen'].items()},
-        'demP': {tuple(eval(k)): v for k, v in json_data['demP'].items()},
-        'dt': json_data['dt'],
-        'capV': json_data['capV'],
-        'n_reg': json_data['n_reg'],
-        'alpha': json_data['alpha']
-    }
-    
+    data = {key: json_data[key] for key in DATA_KEYS}
+
+    return data
+
+def parse_data(json_data):
+    """
+    Convert a JSON object in the format of the data files (tuple keys written
+    as strings) to the data dictionary used by Instance.
+
+    Args:
+        json_data (dict): The decoded JSON object.
+
+    Returns:
+        dict: A dictionary containing the extracted data.
+    """
+    data = {key: json_data[key] for key in DATA_KEYS}
+    for key in TUPLE_SECTIONS:
+        data[key] = {parse_key(k): v for k, v in data[key].items()}
     return data
 
-def create_partition(k, m, dev=0.25):
-    numbers_list = []
-    remaining_sum = m
+def write_data_json(data, file_path):
+    """
+    Write a data dictionary to a JSON file readable by read_data_json.
+
+    Args:
+        data (dict): The data, in the format used by Instance.
+        file_path (str): The path to the JSON file.
+    """
+    json_data = {key: data[key] for key in DATA_KEYS}
+    for key in TUPLE_SECTIONS:
+        json_data[key] = {str(k): v for k, v in data[key].items()}
+    with open(file_path, "w") as json_file:
+        json.dump(json_data, json_file)
+
+def create_partition(k, m, dev=0.25, rng=None):
+    """
+    Split the integer m into k integer parts that deviate at most dev from the mean.
+
+    Args:
+        k (int): Number of parts.
+        m (int): Total to split.
+        dev (float, optional): Maximum relative deviation of the first k-1
+            parts from m/k. Defaults to 0.25.
+        rng (Generator, optional): NumPy random generator. Defaults to a new
+            unseeded generator.
+
+    Returns:
+        ndarray: The k parts, the last one positive and equal to the remainder.
+    """
+    rng = np.random.default_rng() if rng is None else rng
     avg = m / k
-    
-    while True:        
-        for _ in range(k - 1):
-            deviation = random.uniform(-dev, dev)  # Random deviation from the mean
-            number = int((1+ deviation)*avg) 
-            numbers_list.append(number)
-            remaining_sum -= number
-        if  remaining_sum > 0:   
-            remaining_sum = m - sum(numbers_list)
-            numbers_list.append(remaining_sum)
-            return numbers_list
-        
-        
+    while True:
+        numbers = ((1 + rng.uniform(-dev, dev, k - 1))*avg).astype(np.int64)
+        remaining = m - numbers.sum()
+        if remaining > 0:
+            return np.append(numbers, remaining)
+
 def instance_generator(n_reg, n_collec, n_manufs, n_prod, periods, demand_range, 
                        p_capT, # percentage of increase of capacity regarding demand
                        p_capC, # percentage of increase of capacity regarding demand
@@ -75,87 +236,146 @@ def instance_generator(n_reg, n_collec, n_manufs, n_prod, periods, demand_range,
                        p_clean, # cost of cleaning as percentage of v_base of a packaging
                        dt,
                        alpha,
-                       min_reg):
-    
-    regions = ["r"+str(i+1) for i in range(n_reg)]
-    collectors = ["c"+str(i+1) for i in range(n_collec)]
-    manufs = ["m"+str(i+1) for i in range(n_manufs)]
-    producers = ["p"+str(i+1) for i in range(n_prod)]
-    time = [(t+1) for t in range(periods)]
-    # create demands per region
-    demP  = {(p,t):random.randint(demand_range[0], demand_range[1]) \
-                for p in producers for t in time}
-    
-    # calculate the maximum demand in a period    
-    agg_dem = {t: sum(val for (key, val) in demP.items() if key[1] == t) for t in set(key[1] for key in demP)}
-    max_demt = max(list(agg_dem.values()))
-    
-    
+                       min_reg, # number of regions to cover
+                       seed=None,
+                       k=None, # nearest downstream nodes kept per site (None: complete arc sets)
+                       radius=None, # distance within which downstream nodes are kept
+                       feasible=False): # any min_reg regions generate the largest demand of a period
+    """
+    Generate a random instance using only array operations. The arc sets
+    between consecutive echelons are complete, or sparse (see sparse_arcs)
+    if k or radius is given; the regions then also get coordinates and the
+    cost factor is scaled by the longest kept arc. With feasible, the
+    generation of the regions is raised so that covering any min_reg of
+    them supplies the demand (the capacities already exceed it); this holds
+    for complete arc sets only, sparse ones may leave a producer without
+    enough reachable cleaning capacity.
+
+    Returns:
+        tuple: The arrays and the scalars of the instance, in the layout of
+            Instance.from_arrays (see Instance.instance_generator).
+    """
+    rng = np.random.default_rng(seed)
+    time = np.arange(1, periods + 1)
+    # create demands per producer and period
+    demP = rng.integers(demand_range[0], demand_range[1], size=(n_prod, periods), endpoint=True)
+
+    # calculate the maximum demand in a period
+    max_demt = demP.sum(axis=0).max()
+
     # create transformers capacity
-    capT = create_partition(n_manufs, int(max_demt*(1+p_capT)))
-    capT = {c:capT[i] for i, c in enumerate(manufs) }
-    
+    capT = create_partition(n_manufs, int(max_demt*(1+p_capT)), rng=rng)
+
     # create collectors clasif capacity, inventory capacity and initial value
-    capC = create_partition(n_collec, int(max_demt*(1+p_capC)))
-    capC = {c : capC[i] for i, c in enumerate(collectors) }
-    capS = {k : int(v*p_capS) for k, v in capC.items()}
-    iniS = {k : random.randint(0, v) for k, v in capS.items()}
-    
-    # create region generation
-    gen = create_partition(n_collec, int(max_demt/p_gen))
-    gen = {r : gen[i] for i, r in enumerate(regions) }
-    
+    capC = create_partition(n_collec, int(max_demt*(1+p_capC)), rng=rng)
+    capS = (capC*p_capS).astype(np.int64)
+    iniS = rng.integers(0, capS, endpoint=True)
+
+    # create region generation (the same in every period)
+    gen = create_partition(n_reg, int(max_demt/p_gen), rng=rng)
+    if feasible:
+        gen = np.maximum(gen, -(-max_demt//min_reg))
+    gen = np.repeat(gen[:, None], periods, axis=1)
+
     # create vehicle capacity
-    max_dem = max(demP.values())
-    capV = random.randint(int(max_dem/2), max_dem)
-    
+    max_dem = demP.max()
+    capV = int(rng.integers(int(max_dem/2), max_dem, endpoint=True))
+
     # Create arcs
     # create coordinates on a 100x100  panel
-    nodes = {s:(random.uniform(0, 100), random.uniform(0, 100)) for s in collectors + manufs + producers}
-    arcs_e1 = {(r, c):0 for r in regions for c in collectors}
-    arcs_e2 = {(c, m):euclidean(nodes[c], nodes[m])  for c in collectors for m in manufs}
-    arcs_e3 = {(m, p):euclidean(nodes[m], nodes[p])  for m in producers for p in producers}
-    arcs = {**arcs_e1, **arcs_e2, **arcs_e3}
-    max_dist = max(arcs.values())
+    xy_c = rng.uniform(0, 100, size=(n_collec, 2))
+    xy_m = rng.uniform(0, 100, size=(n_manufs, 2))
+    xy_p = rng.uniform(0, 100, size=(n_prod, 2))
+    sparse = k is not None or radius is not None
+    xy_r = rng.uniform(0, 100, size=(n_reg, 2)) if sparse else None
+
+    def echelon(xy_orig, xy_dest, n_orig, n_dest, kind):
+        # arcs between two consecutive echelons and their lengths
+        if sparse:
+            orig, dest = sparse_arcs(xy_orig, xy_dest, k, radius)
+        else:
+            orig = np.repeat(np.arange(n_orig), n_dest)
+            dest = np.tile(np.arange(n_dest), n_orig)
+        dist = None if xy_orig is None else np.hypot(*(xy_orig[orig] - xy_dest[dest]).T)
+        return (np.full(len(orig), kind, dtype=np.int8), orig.astype(np.int32),
+                np.full(len(orig), kind + 1, dtype=np.int8), dest.astype(np.int32), dist)
+
+    arcs = [echelon(xy_r, xy_c, n_reg, n_collec, 0), echelon(xy_c, xy_m, n_collec, n_manufs, 1),
+            echelon(xy_m, xy_p, n_manufs, n_prod, 2)]
+    max_dist = max(arcs[1][4].max(), arcs[2][4].max())
     factor = d_tranp*capV*p_transp/max_dist
-    arcs = {k : int(v*factor) for k,v in arcs.items()}
-    
-    c_buy = p_buy*v_base
-    c_clasif = p_clasif*v_base
-    c_activ = {c : capC[c]*v_base*p_activ for c in collectors}
-    c_hold = p_hold*v_base
-    c_clean = p_clean*v_base
-    dt = dt
-    alpha = alpha
-    min_reg = min_reg
-    
-    return arcs, max_dist,  capV*p_transp
+    arc_cost = np.concatenate([np.zeros(len(arcs[0][0])),
+                               (arcs[1][4]*factor).astype(np.int64),
+                               (arcs[2][4]*factor).astype(np.int64)]).astype(float)
 
+    def names(prefix, n):
+        return np.char.add(prefix, np.arange(1, n + 1).astype(str))
 
-instance = instance_generator(4, 4, 4, 4, 4, (1000, 2000), 0.2, 0.3, 0.2, 0.3,\
-                              100, 0.05, 1, 0.1, 0.05, 0.1, 0.01, 0.01, 3, 0.1, 3)
-instance
-    
+    c_activ = capC*v_base*p_activ
+    collectors_data = np.column_stack([np.full(n_collec, p_buy*v_base), np.full(n_collec, p_clasif*v_base),
+                                       c_activ, np.full(n_collec, p_hold*v_base), capC, capS, iniS])
+    manufs_data = np.column_stack([np.full(n_manufs, p_clean*v_base), capT])
 
+    arrays = {
+        'regions': names('r', n_reg),
+        'collectors': names('c', n_collec),
+        'manufs': names('m', n_manufs),
+        'producers': names('p', n_prod),
+        'time': time,
+        'collectors_data': collectors_data.astype(float),
+        'manufs_data': manufs_data.astype(float),
+        'iniA': np.zeros(n_collec),
+        'arc_orig_kind': np.concatenate([a[0] for a in arcs]),
+        'arc_orig': np.concatenate([a[1] for a in arcs]),
+        'arc_dest_kind': np.concatenate([a[2] for a in arcs]),
+        'arc_dest': np.concatenate([a[3] for a in arcs]),
+        'arc_cost': arc_cost,
+        'gen': gen.astype(float),
+        'demP': demP.astype(float)}
+    scalars = {'dt': dt, 'capV': capV, 'n_reg': min_reg, 'alpha': alpha}
 
-def create_partition(k, m, dev=0.25):
-    numbers_list = []
-    remaining_sum = m
-    avg = m / k
-    
-    while True:        
-        for _ in range(k - 1):
-            deviation = random.uniform(-dev, dev)  # Random deviation from the mean
-            number = int((1+ deviation)*avg) 
-            numbers_list.append(number)
-            remaining_sum -= number
-        if  remaining_sum > 0:   
-            remaining_sum = m - sum(numbers_list)
-            numbers_list.append(remaining_sum)
-            return numbers_list
+    return arrays, scalars
+
+def sparse_arcs(xy_orig, xy_dest, k=None, radius=None):
+    """
+    Arcs from every site to its nearest downstream sites, found with KD-trees.
+
+    Every origin keeps its k nearest destinations and/or the destinations
+    within radius (at least the nearest one), and every destination is
+    reached from its nearest origin, so no node is left without arcs.
+
+    Args:
+        xy_orig (ndarray): Coordinates of the origins, n x 2.
+        xy_dest (ndarray): Coordinates of the destinations, m x 2.
+        k (int, optional): Nearest destinations kept per origin.
+        radius (float, optional): Distance within which destinations are kept.
+
+    Returns:
+        tuple: Positions of the origin and the destination of each arc,
+            sorted by origin and destination and without duplicates.
+    """
+    n, m = len(xy_orig), len(xy_dest)
+    tree = cKDTree(xy_dest)
+    _, nearest = tree.query(xy_orig, k=1)
+    orig, dest = [np.arange(n)], [nearest]
+    if k is not None:
+        _, idx = tree.query(xy_orig, k=min(k, m))
+        idx = idx.reshape(n, -1)
+        orig.append(np.repeat(np.arange(n), idx.shape[1]))
+        dest.append(idx.ravel())
+    if radius is not None:
+        near = tree.query_ball_point(xy_orig, r=radius)
+        orig.append(np.repeat(np.arange(n), [len(d) for d in near]))
+        dest.append(np.concatenate([np.asarray(d, dtype=np.int64) for d in near]))
+    # the nearest origin of every destination
+    _, back = cKDTree(xy_orig).query(xy_dest, k=1)
+    orig.append(back)
+    dest.append(np.arange(m))
+    pairs = np.unique(np.concatenate(orig).astype(np.int64)*m + np.concatenate(dest))
+    return np.divmod(pairs, m)
 
 def euclidean(point1, point2):
-    return np.sqrt((point1[0]-point2[0])**2 + (point1[0]-point2[0])**2)
+    # distance between two (x, y) points, see distances.distance_matrix for many points
+    return np.hypot(point1[0]-point2[0], point1[1]-point2[1])
     
     
-create_partition(4, 100, 0.3)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from classes import Instance
+from main import data
+from conftest import OPTIMUM
+
+pytest.importorskip('gurobipy')
+from aggregation import aggregate_solve, cost_features
+
+
+def test_aggregated_plan_is_valid_and_bounded():
+    instance = Instance(data)
+    with pytest.warns(UserWarning, match='coords'):
+        status, solution = aggregate_solve(instance, ratio=0.7, OutputFlag=0)
+    assert status == "Aggregated"
+    assert solution.solution_checker()
+    assert solution.dict_sol['obj_val'] >= OPTIMUM
+    assert 0 <= solution.dict_sol['gap'] <= 1
+
+
+def test_cost_features_from_the_arcs():
+    instance = Instance(data)
+    features = cost_features(instance, 1, 2)
+    costs = np.array([[data['arcs'][c, m] for m in instance.manufs] for c in instance.collectors])
+    assert np.allclose(features, np.column_stack([costs.mean(axis=1), costs.min(axis=1)]))
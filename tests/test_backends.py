@@ -0,0 +1,25 @@
+import pytest
+from classes import Instance
+from main import data
+from conftest import OPTIMUM
+from backends import create_model_highs
+from optimize import solve_model, get_results
+
+
+def test_highs_solves_the_instance():
+    instance = Instance(data)
+    model = create_model_highs(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    assert status == "Optimal"
+    assert solution.dict_sol['obj_val'] == pytest.approx(OPTIMUM, rel=1e-4)
+    assert solution.solution_checker()
+
+    # callbacks, lazy constraints and MIP starts are Gurobi only
+    with pytest.raises(ValueError, match='callbacks'):
+        solve_model(model, callback=lambda model, where: None)
+    with pytest.raises(ValueError, match='MIP starts'):
+        solve_model(model, start=solution)
+    with pytest.raises(ValueError, match='lazy'):
+        create_model_highs(instance, lazy=True)
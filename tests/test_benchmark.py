@@ -0,0 +1,44 @@
+import time as tm
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('gurobipy')
+from benchmark import (PIPELINE_COLUMNS, RSSMonitor, benchmark_build, benchmark_pipeline,
+                       compare_benchmarks)
+
+SIZE = (5, 5, 3, 5, 4)
+
+
+def test_build_rows_and_dimensions():
+    df = benchmark_build([SIZE])
+    assert list(df.columns) == ['size', 'builder', 'build_time', 'n_vars', 'n_constrs', 'n_nz']
+    assert list(df['builder']) == ['create_model', 'create_model_matrix']
+    assert (df['size'] == SIZE).all() and (df['build_time'] > 0).all()
+    # both builders give the same model
+    for key in ['n_vars', 'n_constrs', 'n_nz']:
+        assert df[key].nunique() == 1 and df[key].iloc[0] > 0
+
+
+def test_compare_runs_of_two_commits(tmp_path):
+    path = str(tmp_path / 'results.csv')
+    df = benchmark_pipeline([SIZE], time_limit=60)
+    assert list(df.columns) == PIPELINE_COLUMNS
+    assert list(df['stage']) == ['build', 'solve', 'extract', 'check'] and df['valid'].iloc[-1]
+    for commit in ['aaaaaaa', 'bbbbbbb']:
+        df.assign(commit=commit).to_csv(path, mode='a', header=commit == 'aaaaaaa', index=False)
+
+    table = compare_benchmarks(path)
+    assert list(table.columns) == ['aaaaaaa', 'bbbbbbb']
+    assert list(table.index.names) == ['builder', 'n_reg', 'n_collec', 'n_manufs', 'n_prod', 'periods',
+                                       'stage']
+    assert sorted(table.index.get_level_values('stage')) == ['build', 'check', 'extract', 'solve']
+    pd.testing.assert_series_equal(table['aaaaaaa'], table['bbbbbbb'], check_names=False)
+
+
+def test_rss_monitor_sees_a_temporary_allocation():
+    with RSSMonitor() as rss:
+        block = np.ones(2**25)  # 256 MB
+        tm.sleep(0.1)
+        del block
+    assert rss.peak - rss.start > 200
@@ -0,0 +1,46 @@
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from cache import ResultCache, instance_key
+
+
+def shuffled(data):
+    # same instance with its sets, nodes and arcs in another order
+    return {**data, 'regions': data['regions'][::-1], 'time': data['time'][::-1],
+            'collectors': dict(reversed(list(data['collectors'].items()))),
+            'arcs': dict(reversed(list(data['arcs'].items()))),
+            'gen': dict(reversed(list(data['gen'].items())))}
+
+
+def test_key_does_not_depend_on_the_order():
+    assert instance_key(Instance(data), TimeLimit=10) == instance_key(Instance(shuffled(data)), TimeLimit=10)
+    assert instance_key(Instance(data), TimeLimit=10) != instance_key(Instance(data), TimeLimit=20)
+    changed = {**data, 'arcs': {**data['arcs'], ('c2', 'm2'): data['arcs'][('c2', 'm2')] + 1}}
+    assert instance_key(Instance(data)) != instance_key(Instance(changed))
+
+
+def test_disk_hit_from_a_new_cache(tmp_path):
+    status, solution = ResultCache(path=str(tmp_path)).solve(Instance(data), OutputFlag=0)
+    cache = ResultCache(path=str(tmp_path))
+    cached_status, cached = cache.solve(Instance(shuffled(data)), OutputFlag=0)
+    assert cache.stats()['hits_disk'] == 1 and cache.misses == 0
+    assert cached_status == status
+    assert cached.dict_sol['obj_val'] == pytest.approx(solution.dict_sol['obj_val'])
+
+
+def test_key_depends_on_the_solver_and_the_builder():
+    from heuristic import heuristic_solve
+    from optimize import create_model_matrix
+    cache = ResultCache()
+    status, solution = cache.solve(Instance(data), solver=heuristic_solve)
+    assert status == "Heuristic"
+    # an exact request is not served the heuristic plan, nor another builder's plan
+    exact_status, exact = cache.solve(Instance(data), OutputFlag=0)
+    assert exact_status == "Optimal" and cache.misses == 2
+    cache.solve(Instance(data), builder=create_model_matrix, OutputFlag=0)
+    assert cache.misses == 3
+    assert cache.solve(Instance(data), solver=heuristic_solve)[1] is solution
+    assert cache.stats()['hits_memory'] == 1
+    assert exact.dict_sol['obj_val'] < solution.dict_sol['obj_val']
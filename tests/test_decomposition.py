@@ -0,0 +1,32 @@
+import io
+import json
+import pytest
+from classes import Instance
+from main import data
+from conftest import OPTIMUM
+
+pytest.importorskip('gurobipy')
+from decomposition import benders_solve
+from telemetry import Telemetry
+
+
+def test_benders_plan_is_valid():
+    instance = Instance(data)
+    stream = io.StringIO()
+    status, solution = benders_solve(instance, tol=1e-2, workers=1, telemetry=Telemetry(stream))
+    assert status == "Optimal"
+    assert solution.dict_sol['gap'] <= 1e-2
+    assert solution.solution_checker()
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert events and all(e['event'] == 'iteration' for e in events)
+    assert events[-1]['lower'] <= solution.dict_sol['obj_val'] + 1e-6
+    # the fixed-decision solve is at most the gap of the decomposition above the optimum
+    assert solution.dict_sol['obj_val'] == pytest.approx(OPTIMUM, rel=1e-2)
+
+
+def test_open_gap_is_not_reported_optimal():
+    # three iterations leave the bounds far apart
+    status, solution = benders_solve(Instance(data), max_iter=3, workers=1)
+    assert status == "Decomposition"
+    assert solution.dict_sol['gap'] > 1e-4
+    assert solution.solution_checker()
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+import distances
+from classes import Instance
+from main import data
+from distances import distance_matrix, pair_distances, arc_costs, with_arc_costs
+
+
+def test_cached_matrix_equals_the_computed_one(tmp_path):
+    rng = np.random.default_rng(0)
+    a, b = rng.random((50, 2)), rng.random((30, 2))
+    computed = distance_matrix(a, b, chunk_size=7)
+    cached = distance_matrix(a, b, chunk_size=7, cache_dir=str(tmp_path))
+    assert np.array_equal(cached, computed)
+    assert isinstance(distance_matrix(a, b, cache_dir=str(tmp_path)), np.memmap)
+    i, j = rng.integers(0, 50, 100), rng.integers(0, 30, 100)
+    assert np.allclose(pair_distances(a, b, i, j, chunk_size=16), computed[i, j])
+
+
+def test_haversine_of_a_known_pair():
+    paris, london = [48.8566, 2.3522], [51.5074, -0.1278]
+    assert distance_matrix([paris], [london], metric='haversine')[0, 0] == pytest.approx(343.5, abs=1)
+    assert pair_distances([paris], [london], [0], [0], metric='haversine')[0] == pytest.approx(343.5, abs=1)
+
+
+def test_arc_costs_from_the_cached_matrices(tmp_path, monkeypatch):
+    instance = Instance(data)
+    rng = np.random.default_rng(1)
+    nodes = instance.regions + instance.collectors + instance.manufs + instance.producers
+    coords = dict(zip(nodes, rng.random((len(nodes), 2))*100))
+    costs = arc_costs(instance, coords, rate=2, fixed=5, cache_dir=str(tmp_path))
+    priced = with_arc_costs(instance, costs)
+    for (o, d), cost in priced.c_transp.items():
+        if o in instance.regions:
+            assert cost == instance.c_transp[o, d]
+        else:
+            assert cost == pytest.approx(5 + 2*np.hypot(*(coords[o] - coords[d])))
+    # one matrix per echelon, read back memory mapped without computing it again
+    assert len(list(tmp_path.glob('*.npy'))) == 2
+
+    def fail(*args, **kwargs):
+        raise AssertionError('distances computed again')
+    monkeypatch.setattr(distances, 'distance_blocks', fail)
+    assert np.array_equal(arc_costs(instance, coords, rate=2, fixed=5, cache_dir=str(tmp_path)), costs)
@@ -0,0 +1,40 @@
+import time as tm
+import pytest
+from classes import Instance
+from main import data
+from conftest import OPTIMUM
+
+pytest.importorskip('gurobipy')
+import heuristic
+from heuristic import heuristic_solve, cost_bound
+from benchmark import synthetic_instance
+
+
+def test_heuristic_plan_is_valid_and_bounded():
+    instance = Instance(data)
+    status, solution = heuristic_solve(instance)
+    assert status == "Heuristic"
+    assert solution.solution_checker()
+    obj_val = solution.dict_sol['obj_val']
+    assert cost_bound(instance) <= OPTIMUM <= obj_val
+    assert 0 <= solution.dict_sol['gap'] <= 1
+    _, tight = heuristic_solve(instance, bound=True)
+    assert tight.dict_sol['gap'] <= solution.dict_sol['gap']
+
+
+def test_heuristic_plan_in_under_a_second():
+    instance = synthetic_instance(50, 50, 20, 50, 24)
+    start = tm.perf_counter()
+    status, solution = heuristic_solve(instance)
+    assert tm.perf_counter() - start < 1
+    assert status == "Heuristic"
+    assert solution.solution_checker()
+
+
+def test_failed_routing_falls_back_to_the_lp(monkeypatch):
+    instance = Instance(data)
+    monkeypatch.setattr(heuristic, 'route', lambda *args: None)
+    status, solution = heuristic.heuristic_solve(instance)
+    assert status == "Heuristic"
+    assert solution.solution_checker()
+    assert solution.dict_sol['obj_val'] >= OPTIMUM
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+from classes import Instance
+from main import data
+
+
+def test_memory_mapped_round_trip(tmp_path):
+    instance = Instance(data)
+    instance.save(str(tmp_path))
+    loaded = Instance.load(str(tmp_path))
+    assert isinstance(loaded.arrays['gen'], np.memmap)
+    for key, array in instance.arrays.items():
+        assert np.array_equal(loaded.arrays[key], array), key
+    assert loaded.arcs == instance.arcs
+    assert loaded.gen == instance.gen and loaded.demP == instance.demP
+
+    pytest.importorskip('gurobipy')
+    from optimize import create_model, solve_model
+    objectives = []
+    for model in [create_model(instance), create_model(loaded)]:
+        model.Params.OutputFlag = 0
+        model.Params.MIPGap = 0
+        solve_model(model)
+        objectives.append(model.ObjVal)
+        model.dispose()
+    assert objectives[1] == pytest.approx(objectives[0])
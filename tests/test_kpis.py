@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, solve_model, build_solution
+
+
+def test_costs_price_the_trips_of_the_plan():
+    instance = Instance(data)
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    X = {name: np.array(model.getAttr('X', list(var.values()))) for name, var in model._vars.items()}
+    keys = list(model._vars['trip'].keys())
+    obj_val = model.ObjVal
+    model.dispose()
+
+    # a plan with a trip more than its flows need (valid, one arc cost dearer)
+    i = keys.index(('c2', 'm2', 1))
+    X['trip'][i] += 1
+    solution = build_solution(instance, X, obj_val + data['arcs'][('c2', 'm2')])
+    assert solution.dict_sol['c_total'] == pytest.approx(solution.dict_sol['obj_val'])
+    assert solution.solution_checker()
@@ -0,0 +1,22 @@
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, create_model_matrix, solve_model, get_results
+
+
+@pytest.mark.parametrize('builder', [create_model, create_model_matrix])
+def test_lazy_mode_gives_the_eager_optimum(builder):
+    instance = Instance(data)
+    objectives = []
+    for lazy in [False, True]:
+        model = builder(instance, lazy=lazy)
+        model.Params.OutputFlag = 0
+        # both optima within the default gap may differ
+        model.Params.MIPGap = 0
+        solve_model(model)
+        status, solution = get_results(model, instance)
+        assert solution.solution_checker()
+        objectives.append(solution.dict_sol['obj_val'])
+    assert objectives[1] == pytest.approx(objectives[0])
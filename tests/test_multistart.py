@@ -0,0 +1,26 @@
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, solve_model
+from multistart import solve_concurrent
+
+
+def test_concurrent_solve_matches_a_single_solve():
+    instance = Instance(data)
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    model.Params.MIPGap = 1e-4
+    solve_model(model)
+    obj_val = model.ObjVal
+    model.dispose()
+
+    configs = [{}, {'MIPFocus': 1}]
+    status, solution, report = solve_concurrent(instance, configs, workers=2)
+    assert status == "Optimal"
+    assert len(report) == 2 and report['winner'].sum() == 1
+    assert solution.dict_sol['config'] in configs
+    assert solution.solution_checker()
+    # both solved to the same relative gap
+    assert solution.dict_sol['obj_val'] == pytest.approx(obj_val, rel=1e-4)
@@ -0,0 +1,87 @@
+import copy
+import pytest
+from classes import Instance
+from optimize import create_model, solve_model, get_results
+from main import data
+from benchmark import synthetic_instance
+
+
+def stocked_instance():
+    # c4 has no region arcs, its initial stock covers the halved generation
+    stocked = copy.deepcopy(data)
+    stocked['collectors']['c4'] = [100, 10, 100, 1, 300, 2500, 2000]
+    stocked['arcs'][('c4', 'm1')] = 60
+    stocked['arcs'][('c4', 'm2')] = 50
+    stocked['gen'] = {key: value/2 for key, value in stocked['gen'].items()}
+    return Instance(stocked)
+
+
+def test_precheck_counts_stock_without_region_arcs():
+    instance = stocked_instance()
+    assert instance.precheck()
+
+    gp = pytest.importorskip('gurobipy')
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    assert model.Status == gp.GRB.OPTIMAL
+    assert solution.solution_checker()
+    model.dispose()
+
+
+def test_covered_regions_need_no_arcs():
+    # only regions 0 and 1 keep arcs, but n_reg = 3 regions can be covered
+    instance = synthetic_instance(6, 3, 2, 3, 3)
+    arrays = dict(instance.arrays)
+    keep = ~((arrays['arc_orig_kind'] == 0) & (arrays['arc_orig'] >= 2))
+    for key in ['arc_orig_kind', 'arc_orig', 'arc_dest_kind', 'arc_dest', 'arc_cost']:
+        arrays[key] = arrays[key][keep]
+    arrays['collectors_data'] = arrays['collectors_data'].copy()
+    arrays['collectors_data'][:, 6] = arrays['collectors_data'][:, 5]
+    scalars = {key: getattr(instance, key) for key in Instance.SCALARS}
+    reduced = Instance.from_arrays(arrays, {**scalars, 'alpha': 1})
+    assert reduced.n_reg == 3
+    assert reduced.precheck()
+
+    gp = pytest.importorskip('gurobipy')
+    model = create_model(reduced)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, reduced)
+    assert model.Status == gp.GRB.OPTIMAL
+    assert solution.solution_checker()
+    model.dispose()
+
+
+def short_instance():
+    # the manufacturers clean 200 bottles per period between them
+    short = copy.deepcopy(data)
+    short['manufs'] = {m: [values[0], 100] for m, values in data['manufs'].items()}
+    return Instance(short)
+
+
+def test_precheck_reports_the_shortfall():
+    failed = short_instance().precheck(report=True)
+    demP = failed[failed['test'] == 'demP']
+    expected = {key for key, value in data['demP'].items() if value > 200}
+    assert expected and set(zip(demP['key'], demP['period'])) == expected
+    assert (demP['echelon'] == 3).all()
+    required = [data['demP'][key] for key in zip(demP['key'], demP['period'])]
+    assert demP['shortfall'].tolist() == pytest.approx([value - 200 for value in required])
+    assert (failed[failed['test'] == 'capM']['echelon'] == 2).all()
+
+
+def test_infeasible_model_keeps_its_iis():
+    pytest.importorskip('gurobipy')
+    instance = short_instance()
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    assert status == "non-optimal" and solution is None
+    iis = model._iis
+    assert not iis.empty
+    assert {'capM', 'demP'} & set(iis['family'])
+    assert set(iis['kind']) <= {'constr', 'lb', 'ub'}
+    model.dispose()
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from classes import Instance
+from main import data
+from backends import build_matrices
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, solve_model, get_results, variable_values
+
+
+def solve(instance):
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    return get_results(model, instance)
+
+
+def test_presolve_keeps_the_optimum():
+    instance = Instance(data)
+    reduced = instance.presolve()
+    assert reduced.bounds is not None
+    _, solution = solve(instance)
+    _, presolved = solve(reduced)
+    assert presolved.dict_sol['obj_val'] == pytest.approx(solution.dict_sol['obj_val'])
+    assert presolved.solution_checker()
+
+
+def test_optimal_flows_are_within_the_bounds():
+    instance = Instance(data)
+    reduced = instance.presolve()
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    model.Params.MIPGap = 0
+    solve_model(model)
+    flow = variable_values(model)['flow'].reshape(len(instance.arcs), len(instance.time))
+    model.dispose()
+    bounds = dict(zip(reduced.arcs, reduced.bounds['flow']))
+    for arc, values in zip(instance.arcs, flow):
+        # the arcs dropped by presolve carry no flow
+        assert np.all(values <= bounds.get(arc, 0) + 1e-6), arc
+
+
+def rows(matrices, name):
+    # (columns, coefficients, sense, rhs) of the rows of a family
+    start, stop = next((s, e) for n, s, e in matrices['constrs'] if n == name)
+    A = matrices['A'][start:stop].tocsr()
+    return [(tuple(A[i].indices), tuple(A[i].data), matrices['sense'][start + i], matrices['rhs'][start + i])
+            for i in range(A.shape[0])]
+
+
+def test_rows_satisfied_by_the_bounds_are_dropped():
+    reduced = Instance(data).presolve()
+    bounded = build_matrices(reduced)
+    unbounded = build_matrices(Instance.from_arrays(reduced.arrays, {key: getattr(reduced, key)
+                                                                      for key in Instance.SCALARS}))
+    ub = np.where(np.isinf(bounded['ub']), 1e30, bounded['ub'])
+
+    def implied(row):
+        # the row holds for any value within the bounds (all lower bounds are 0)
+        cols, coefs, sense, rhs = row
+        activity = np.asarray(coefs)*ub[list(cols)]
+        if sense == '<':
+            return activity.clip(min=0).sum() <= rhs
+        if sense == '>':
+            return activity.clip(max=0).sum() >= rhs
+        return False
+
+    n_dropped = 0
+    for name, start, stop in unbounded['constrs']:
+        kept, full = rows(bounded, name), rows(unbounded, name)
+        assert not any(implied(row) for row in kept), name
+        dropped = [row for row in full if row not in kept]
+        assert all(implied(row) for row in dropped), name
+        assert len(kept) + len(dropped) == len(full)
+        n_dropped += len(dropped)
+    assert n_dropped > 0
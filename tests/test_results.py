@@ -0,0 +1,85 @@
+import re
+import numpy as np
+import pandas as pd
+import pytest
+from classes import Instance
+from main import data
+from conftest import OPTIMUM
+
+gp = pytest.importorskip('gurobipy')
+from optimize import create_model, create_model_matrix, solve_model, get_results, variable_names
+
+COSTS = ('c_transp', 'c_transp_e2', 'c_transp_e3', 'c_buy', 'c_clasif', 'c_clean',
+         'c_activ', 'c_hold', 'c_total')
+QUANTITIES = ('q_buy', 'q_clean', 'q_activ')
+
+
+def name_parsing_results(model, instance):
+    # extraction of the baseline: one X query and a name parse per variable
+    flows, network = [], []
+    variables = model.getVars()
+    # create_model_matrix leaves the variables unnamed, their names come from the keys
+    for var, name in zip(variables, variable_names(model, variables)):
+        row = [name.split('[')[0]] + re.findall(r'\[(.*?)\]', name)[0].split(',')
+        if 'cover' in name:
+            row.append(-99)
+        row.append(var.X)
+        (flows if row[0] in ('flow', 'trip') else network).append(row)
+    df_flows = pd.DataFrame.from_records(flows, columns=['name', 'origin', 'destination', 'period', 'value'])
+    df_flows['period'] = df_flows['period'].astype(int)
+    df_network = pd.DataFrame.from_records(network, columns=['name', 'facility', 'period', 'value'])
+    df_network['period'] = df_network['period'].astype(int)
+
+    flow = df_flows[df_flows['name'] == 'flow'].copy()
+    flow['c_transp'] = [instance.c_transp[a] for a in zip(flow['origin'], flow['destination'])] * \
+        np.ceil((flow['value'] - 0.001)/instance.capV)
+    collect = flow[flow['destination'].isin(instance.collectors)].groupby('destination')['value'].sum()
+    clean = flow[flow['destination'].isin(instance.manufs)].groupby('destination')['value'].sum()
+    activ = df_network[df_network['name'] == 'activ'].groupby('facility')['value'].sum()
+    stock = df_network[df_network['name'] == 'stock'].groupby('facility')['value'].sum()
+    sol = {'c_transp': flow['c_transp'].sum(),
+           'c_transp_e2': flow[flow['origin'].isin(instance.collectors)]['c_transp'].sum(),
+           'c_transp_e3': flow[flow['origin'].isin(instance.manufs)]['c_transp'].sum(),
+           'c_buy': sum(instance.c_buy[c]*q for c, q in collect.items()),
+           'c_clasif': sum(instance.c_clasif[c]*q for c, q in collect.items()),
+           'c_clean': sum(instance.c_clean[m]*q for m, q in clean.items()),
+           'c_activ': sum(instance.c_activ[c]*q for c, q in activ.items()),
+           'c_hold': sum(instance.c_hold[c]*q for c, q in stock.items()),
+           'q_buy': collect.to_dict(), 'q_clean': clean.to_dict(), 'q_activ': activ.to_dict()}
+    sol['c_total'] = sum(sol[key] for key in COSTS[3:-1]) + sol['c_transp']
+    return sol, df_flows, df_network
+
+
+def by_key(df, keys):
+    return df.set_index(keys)['value'].sort_index()
+
+
+@pytest.mark.parametrize('builder', [create_model, create_model_matrix])
+def test_results_match_the_name_parsing_extraction(builder):
+    instance = Instance(data)
+    model = builder(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    expected, df_flows, df_network = name_parsing_results(model, instance)
+    model.dispose()
+    assert status == "Optimal"
+
+    sol = solution.dict_sol
+    # solved to the default MIPGap, other plans are within it
+    assert sol['obj_val'] == pytest.approx(OPTIMUM, rel=1e-4)
+    assert sol['c_total'] == pytest.approx(sol['obj_val'])
+    for key in COSTS:
+        assert sol[key] == pytest.approx(expected[key]), key
+    for key in QUANTITIES:
+        assert sol[key] == pytest.approx({k: expected[key].get(k, 0.0) for k in sol[key]}), key
+
+    flow_keys = ['name', 'origin', 'destination', 'period']
+    pd.testing.assert_series_equal(by_key(solution.df_flows, flow_keys), by_key(df_flows, flow_keys),
+                                   check_index_type=False)
+    network_keys = ['name', 'facility', 'period']
+    pd.testing.assert_series_equal(by_key(solution.df_network, network_keys),
+                                   by_key(df_network, network_keys), check_index_type=False)
+    assert sum(sol['q_clean'].values()) == pytest.approx(sum(data['demP'].values()))
+    assert sum(value > 0 for value in sol['coverage'].values()) == data['n_reg']
+    assert solution.solution_checker()
@@ -0,0 +1,51 @@
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, create_model_matrix, solve_model, get_results
+from rolling import rolling_horizon
+
+
+def solve(instance):
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    return get_results(model, instance)
+
+
+def decisions(solution):
+    network = solution.df_network
+    network = network[network['name'].isin(['activ', 'stock'])]
+    return network.set_index(['name', 'facility', 'period'])['value']
+
+
+def test_replan_keeps_the_committed_periods():
+    instance = Instance(data)
+    _, solution = solve(instance)
+    new_instance, model = rolling_horizon(instance, solution, shift=1, committed=2)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, replanned = get_results(model, new_instance)
+    assert status == "Optimal"
+    assert replanned.solution_checker()
+
+    previous, new = decisions(solution), decisions(replanned)
+    for (name, c, t), value in new.items():
+        if t <= 2:
+            assert value == pytest.approx(previous[name, c, t + 1], abs=1e-6)
+
+
+@pytest.mark.parametrize('builder', [create_model, create_model_matrix])
+def test_start_solution_is_accepted(builder):
+    instance = Instance(data)
+    _, solution = solve(instance)
+    # the variables of create_model_matrix are unnamed, the start maps them by key
+    model = builder(instance)
+    model.Params.OutputFlag = 0
+    # stop at the first incumbent: the start itself or a better plan
+    model.Params.SolutionLimit = 1
+    solve_model(model, start=solution)
+    assert model.SolCount > 0
+    assert model.ObjVal <= solution.dict_sol['obj_val'] + 1e-6
+    model.dispose()
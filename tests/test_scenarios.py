@@ -0,0 +1,18 @@
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from scenarios import run_batch, run_scenario, scenario_grid
+
+
+def test_batch_gives_one_row_per_scenario():
+    instance = Instance(data)
+    scenarios = scenario_grid(alpha=[0.3, 1])
+    batch = run_batch(instance, scenarios, workers=2)
+    assert len(batch) == 2
+    assert batch['alpha'].tolist() == [0.3, 1]
+    assert (batch['status'] == "Optimal").all()
+    # the pooled solve of a scenario is the one of run_scenario
+    row = run_scenario(data, scenarios[0])
+    assert batch['obj_val'][0] == pytest.approx(row['obj_val'])
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import os
+import pytest
+from service import PlanService, request
+
+pytest.importorskip('gurobipy')
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'data.json')
+
+
+def test_job_round_trip(tmp_path):
+    path = str(tmp_path / 'service.sock')
+    with open(DATA) as data_file:
+        data = json.load(data_file)
+
+    async def run():
+        service = PlanService(workers=1)
+        server = await service.serve(path=path)
+        try:
+            code, body = await request('POST', '/jobs', {'data': data}, unix=path)
+            assert code == 202
+            job = body['job']
+            code, events = await request('GET', '/jobs/%s/events' % job, unix=path)
+            assert code == 200
+            assert events[-1]['event'] == 'end'
+            return events[-1]
+        finally:
+            server.close()
+            await service.close()
+
+    end = asyncio.run(asyncio.wait_for(run(), 60))
+    assert end['status'] == 'done'
+    assert end['error'] is None
+    assert end['result']['status'] == 'Optimal'
+    assert end['finished'] - end['submitted'] < 10
+
+
+def test_finished_jobs_are_forgotten_and_close_does_not_block():
+    with open(DATA) as data_file:
+        data = json.load(data_file)
+
+    async def run():
+        service = PlanService(workers=1, max_finished=1)
+        await service.start()
+        first = await service.submit(data)
+        events = [event async for event in service.stream(first)]
+        second = await service.submit(data)
+        async for _ in service.stream(second):
+            pass
+        assert events and service.status(second)['status'] == 'done'
+        # only the last finished job is kept
+        assert service.status(first) is None and list(service.jobs) == [second]
+
+        # the event loop keeps running while the pool waits for the running job
+        await service.submit(data)
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        await asyncio.sleep(0)
+        start = ticks
+        await service.close()
+        ticker.cancel()
+        return ticks - start
+
+    assert asyncio.run(asyncio.wait_for(run(), 60)) > 1
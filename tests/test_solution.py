@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+from classes import Instance, Solution
+from main import data
+
+
+def test_compact_keeps_the_values_exact():
+    # balances of large plans are checked with an absolute tolerance
+    df = pd.DataFrame({'name': ['stock', 'stock', 'stock'], 'node': ['c1', 'c1', 'c2'],
+                       'period': [1, 2, 1], 'value': [12345678.9, 0.0, 0.1]})
+    compact = Solution.compact(df)
+    assert len(compact) == 2
+    assert compact['value'].tolist() == [12345678.9, 0.1]
+    assert compact['node'].dtype == 'category'
+
+
+def test_checker_reports_an_injected_violation():
+    pytest.importorskip('gurobipy')
+    from optimize import create_model, solve_model, get_results, build_solution
+    instance = Instance(data)
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    _, solution = get_results(model, instance)
+    model.dispose()
+    assert solution.solution_checker(report=True).empty
+
+    # 50 more bottles in stock at c1 in period 1 than its balance allows
+    X = solution.values()
+    X['stock'][0] += 50
+    broken = build_solution(instance, X, solution.dict_sol['obj_val'])
+    assert not broken.solution_checker()
+    violations = broken.solution_checker(report=True)
+    stock = violations[violations['constraint'] == 'stock']
+    assert set(stock['key']) == {('c1', 1), ('c1', 2)}
+    assert stock['violation'].tolist() == pytest.approx([50, 50])
+    # the holding cost of the extra stock is not in the objective
+    assert 'obj' in set(violations['constraint'])
+
+
+def test_parquet_round_trip(tmp_path):
+    pytest.importorskip('gurobipy')
+    from optimize import create_model, solve_model, get_results
+    instance = Instance(data)
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    _, solution = get_results(model, instance)
+    model.dispose()
+
+    solution.save(str(tmp_path))
+    loaded = Solution.load(str(tmp_path))
+    assert loaded.dict_sol == solution.dict_sol
+    pd.testing.assert_frame_equal(loaded.df_flows, solution.df_flows)
+    pd.testing.assert_frame_equal(loaded.df_network, solution.df_network)
+    for key, table in solution.kpis.items():
+        pd.testing.assert_frame_equal(loaded.kpis[key], table)
+    assert loaded.solution_checker()
+
+    # float32 values take half the space, the round trip keeps their type
+    compact = Solution(instance, solution.dict_sol, solution.df_flows, solution.df_network, dtype='float32')
+    compact.save(str(tmp_path / 'float32'))
+    assert Solution.load(str(tmp_path / 'float32')).flows['value'].dtype == 'float32'
@@ -0,0 +1,16 @@
+import numpy as np
+import pytest
+from utilities import sparse_arcs
+
+
+@pytest.mark.parametrize('k, radius', [(1, None), (3, None), (None, 0.05), (2, 0.1)])
+def test_no_node_is_left_without_arcs(k, radius):
+    rng = np.random.default_rng(0)
+    # clustered origins leave many destinations far from all of them
+    xy_orig = rng.normal(0.2, 0.02, size=(40, 2))
+    xy_dest = rng.random(size=(60, 2))
+    orig, dest = sparse_arcs(xy_orig, xy_dest, k=k, radius=radius)
+    assert set(orig.tolist()) == set(range(40))
+    assert set(dest.tolist()) == set(range(60))
+    pairs = orig*60 + dest
+    assert np.all(np.diff(pairs) > 0)
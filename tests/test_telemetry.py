@@ -0,0 +1,29 @@
+import io
+import json
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, create_model_matrix
+from telemetry import Telemetry, family_counts
+
+
+def test_family_counts_of_both_builders():
+    instance = Instance(data)
+    for model in [create_model(instance), create_model_matrix(instance)]:
+        variables, constraints = family_counts(model)
+        assert sum(variables.values()) == model.NumVars
+        assert sum(constraints.values()) == model.NumConstrs
+        assert constraints['gen'] == len(data['regions'])*len(data['time'])
+
+
+def test_failed_stage_is_emitted():
+    stream = io.StringIO()
+    with pytest.raises(ZeroDivisionError):
+        with Telemetry(stream).stage('build') as event:
+            event['n_vars'] = 1
+            1/0
+    event = json.loads(stream.getvalue())
+    assert event['event'] == 'build' and event['n_vars'] == 1
+    assert 'ZeroDivisionError' in event['error']
@@ -0,0 +1,44 @@
+from functools import partial
+import pytest
+from classes import Instance
+from main import data
+
+pytest.importorskip('gurobipy')
+from optimize import create_model, create_model_matrix, solve_model
+from templates import ModelTemplate, TemplateCache, update_data
+
+
+def rebuilt_objective(data):
+    model = create_model(Instance(data))
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    obj_val = model.ObjVal
+    model.dispose()
+    return obj_val
+
+
+def test_update_matches_a_rebuild():
+    template = ModelTemplate(Instance(data))
+    template.model.Params.OutputFlag = 0
+    template.solve()
+    changes = template.update(c_buy={'c1': 50}, demP={('p1', 2): 150})
+    assert changes['obj'] > 0 and changes['rhs'] > 0
+    _, solution = template.solve()
+    expected = rebuilt_objective(update_data(data, c_buy={'c1': 50}, demP={('p1', 2): 150}))
+    assert solution.dict_sol['obj_val'] == pytest.approx(expected)
+
+
+def test_sparsity_change_rebuilds_the_template():
+    cache = TemplateCache(OutputFlag=0)
+    cache.solve(Instance(data))
+    # a region without generation loses its coverage rows
+    changed = update_data(data, gen={('r1', 2): 0})
+    _, solution = cache.solve(Instance(changed))
+    assert cache.misses == 2 and cache.hits == 0
+    assert solution.dict_sol['obj_val'] == pytest.approx(rebuilt_objective(changed))
+
+
+@pytest.mark.parametrize('builder', [create_model, partial(create_model_matrix, lazy=True)])
+def test_template_rejects_models_without_blocks(builder):
+    with pytest.raises(ValueError, match='constraint blocks'):
+        ModelTemplate(Instance(data), builder)
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pytest
+from utilities import instance_generator, read_data_json
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'data.json')
+
+
+def test_stream_loader_reads_the_same_data():
+    assert read_data_json(DATA, stream=True, chunk_size=64) == read_data_json(DATA)
+
+
+def test_stream_loader_rejects_a_malformed_entry(tmp_path):
+    path = tmp_path / 'bad.json'
+    path.write_text('{"arcs": {"(\'r1\', \'c1\')": 0, "(\'r1\', \'c2\')": [%s]}}' % (' '*200000))
+    with pytest.raises(ValueError, match='position 28 '):
+        read_data_json(str(path), stream=True, chunk_size=1024)
+
+
+def generate(seed, **kwargs):
+    # the parameters of benchmark.GENERATOR, covering 3 of 6 regions
+    return instance_generator(6, 4, 3, 3, 3, (100, 300), 0.2, 0.3, 0.2, 0.3, 100, 0.01, 1,
+                              1.0, 0.05, 0.1, 0.01, 0.01, 2, 0.3, 3, seed=seed, **kwargs)
+
+
+def test_generator_is_reproducible():
+    (arrays, scalars), (same, same_scalars) = generate(7), generate(7)
+    assert scalars == same_scalars
+    assert all(np.array_equal(arrays[key], same[key]) for key in arrays)
+    other, _ = generate(8)
+    assert not np.array_equal(arrays['demP'], other['demP'])
+
+
+@pytest.mark.parametrize('k, radius', [(2, None), (None, 30)])
+def test_generator_sparse_arcs(k, radius):
+    complete, _ = generate(0)
+    arrays, _ = generate(0, k=k, radius=radius)
+    assert len(arrays['arc_cost']) < len(complete['arc_cost'])
+    # every node keeps an arc to (and from) the next echelon
+    for kind, n in enumerate([6, 4, 3]):
+        assert set(arrays['arc_orig'][arrays['arc_orig_kind'] == kind]) == set(range(n))
+    for kind, n in enumerate([4, 3, 3], start=1):
+        assert set(arrays['arc_dest'][arrays['arc_dest_kind'] == kind]) == set(range(n))
+    # only the arcs from regions are free
+    assert np.all(arrays['arc_cost'][arrays['arc_orig_kind'] == 0] == 0)
+    assert np.all(arrays['arc_cost'][arrays['arc_orig_kind'] > 0] >= 0)
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_feasible_instances_solve(seed):
+    pytest.importorskip('gurobipy')
+    from classes import Instance
+    from optimize import create_model, solve_model, get_results
+    instance = Instance.from_arrays(*generate(seed, feasible=True))
+    assert instance.precheck()
+    model = create_model(instance)
+    model.Params.OutputFlag = 0
+    solve_model(model)
+    status, solution = get_results(model, instance)
+    model.dispose()
+    assert status == "Optimal"
+    assert solution.solution_checker()